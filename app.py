@@ -1,420 +1,99 @@
 # app.py  –  Head-&-Neck Local-Flap Selector (research prototype)
 # Author: Tanish Patel
 # -----------------------------------------------------------------
-from pathlib import Path
 from datetime import datetime, date
-import pandas as pd
 import streamlit as st
-   
-# ──────────────────────────────────────────────────────────────
-# 1. CONSTANTS & HELPERS
-# ──────────────────────────────────────────────────────────────
-DATA_PATH = Path(".data/usage_log.csv")      # hidden dot-folder
-DATA_PATH.parent.mkdir(exist_ok=True, parents=True)
-
-st.set_page_config("Flap-Selector (Research)", "🩺", layout="wide")  
-SUBUNITS = [
-    "Scalp", "Forehead – central", "Forehead – lateral", "Temple",
-    "Zygomatic-arch (temporal-malar)", "Nasal tip", "Nasal dorsum",
-    "Nasal ala / side-wall", "Upper eyelid", "Lower eyelid",
-    "Medial canthus", "Lateral canthus", "Upper lip – central",
-    "Upper lip – lateral", "Lower lip – central", "Lower lip – lateral",
-    "Oral commissure", "Cheek – infra-orbital", "Cheek – buccal",
-    "Chin – mentum", "Ear – helical rim", "Ear – conchal bowl",
-    "Ear – lobule", "Peri-auricular skin",
-]
 
-DEPTH_OPTS = [
-    "Superficial (skin only)",
-    "Partial thickness (subcut / perichondrium)",
-    "Full thickness (cartilage / bone exposed)",
-]
-
-THR = {
-    "Scalp": (2, 6), "Forehead – central": (1.5, 5), "Forehead – lateral": (1.5, 4),
-    "Temple": (1.5, 4), "Zygomatic-arch (temporal-malar)": (2, 4),
-    "Nasal tip": (0.5, 1.5), "Nasal dorsum": (1, 1.5), "Nasal ala / side-wall": (1, 1.5),
-    "Upper eyelid": (1, 1.5), "Lower eyelid": (1, 1.5),
-    "Medial canthus": (1, 1.5), "Lateral canthus": (1, 1.5),
-    "Upper lip – central": (0.8, 1.6), "Upper lip – lateral": (0.8, 1.6),
-    "Lower lip – central": (1, 2), "Lower lip – lateral": (1, 2),
-    "Oral commissure": (1, 1.5),
-    "Cheek – infra-orbital": (1.5, 3), "Cheek – buccal": (2, 4), "Chin – mentum": (1.5, 3),
-    "Ear – helical rim": (1, 1.5), "Ear – conchal bowl": (1.5, 2.5),
-    "Ear – lobule": (1, 1.5), "Peri-auricular skin": (2, 4),
-}
-
-def _cat(loc: str, cm: float) -> str:
-    lo, mid = THR[loc]
-    return "small" if cm <= lo else "medium" if cm <= mid else "large"
-
-pick = lambda size, m: m[size]
-
-# ──────────────────────────────────────────────────────────────
-# 2.  DECISION ENGINE  (full logic preserved)
-# ──────────────────────────────────────────────────────────────
-def decide(loc, kind, cm, depth, hair, age, dia, smk, rad):
-    # FIX: use _cat(), not cat()
-    size = _cat(loc, cm)
-    flap = rationale = ""
-
-    # ————————————————— SCALP —————————————————
-    if loc == "Scalp":
-        if depth.startswith("Full"):
-            if size=="large":
-                flap="Latissimus-dorsi free flap + STSG"
-                rationale="Massive bare skull requires vascular muscle then graft."
-            else:
-                flap="Ortícochea four-flap rotation"
-                rationale="≤6 cm full-depth closed with opposing galeal rotations."
-        else:
-            if size=="small":
-                flap="Linear primary closure ± galeal scoring"
-                rationale="≤2 cm superficial scalp closed after undermining."
-            elif size=="medium":
-                flap="O-Z rotation flap"
-                rationale="2-6 cm superficial scalp defects via semicircular rotation."
-            else:
-                flap="Ortícochea four-flap rotation"
-                rationale=">6 cm superficial needs four opposing rotations."
-        if hair and "graft" in flap.lower():
-            rationale+=" Flap preserves hair-bearing skin; graft would alopecise."
-
-    # ————————————————— FOREHEAD CENTRAL / LATERAL / TEMPLE / ZYGOMA —————————————————
-    elif loc == "Forehead – central":
-        if depth.startswith("Full"):
-            flap="Temporalis fascia turnover + frontal skin rotation"
-            rationale="Fascia vascularises bone, rotated skin closes."
-        else:
-            flap = pick(size,{
-                "small":"Direct closure in horizontal rhytid",
-                "medium":"H-plasty bilateral advancement",
-                "large":"Parietal-forehead rotation flap"})
-            rationale = pick(size,{
-                "small":"Short scar hidden in forehead line.",
-                "medium":"Advances both sides (1.5-5 cm).",
-                "large":"Large defect recruits parietal scalp."})
-    elif loc == "Forehead – lateral":
-        if depth.startswith("Full"):
-            flap="Temporoparietal fascia flap + STSG"
-            rationale="TP fascia on bone then skin graft."
-        else:
-            flap = pick(size,{
-                "small":"Mini A-T advancement flap",
-                "medium":"Temporal-scalp rotation flap",
-                "large":"Extended cervicofacial rotation"})
-            rationale = pick(size,{
-                "small":"Triangle-to-T hides scar at hairline.",
-                "medium":"Rotated hair-bearing scalp covers 1.5-4 cm.",
-                "large":">4 cm needs cheek/neck recruitment."})
-    elif loc == "Temple":
-        if depth.startswith("Full"):
-            flap="Temporalis-fascia flap + STSG"
-            rationale="Vascular fascia over bone/joint."
-        else:
-            flap = pick(size,{
-                "small":"Limberg rhomboid flap",
-                "medium":"Mustardé cheek rotation flap",
-                "large":"Cervicofacial rotation flap"})
-            rationale = pick(size,{
-                "small":"Rhomboid in crow’s-feet lines ≤1.5 cm.",
-                "medium":"2-4 cm uses Mustardé upward rotation.",
-                "large":">4 cm full cervicofacial."})
-    elif loc == "Zygomatic-arch (temporal-malar)":
-        if depth.startswith("Full"):
-            flap="Mustardé cheek rotation flap"
-            rationale="Robust cheek rotation covers arch."
-        else:
-            flap = pick(size,{
-                "small":"Rhomboid transposition flap",
-                "medium":"Mustardé cheek rotation flap",
-                "large":"Cervicofacial rotation flap"})
-            rationale = pick(size,{
-                "small":"≤2 cm rhomboid along RSTL.",
-                "medium":"2-4 cm rotated cheek skin.",
-                "large":">4 cm needs full cervicofacial flap."})
-
-    # ————————————————— NOSE —————————————————
-    elif loc == "Nasal tip":
-        if depth.startswith("Full"):
-            flap="Paramedian forehead flap + septal cartilage graft"
-            rationale="2-stage skin + support for full-depth tip."
-        else:
-            flap = pick(size,{
-                "small":"Secondary intention / tiny FTSG",
-                "medium":"Bilobed flap",
-                "large":"Paramedian forehead flap"})
-            rationale = pick(size,{
-                "small":"<5 mm granulates or small graft.",
-                "medium":"Bilobed uses upper-dorsum skin.",
-                "large":">1.5 cm exceeds nasal reserve."})
-    elif loc == "Nasal dorsum":
-        if depth.startswith("Full"):
-            flap="Paramedian forehead flap"
-            rationale="Full-depth dorsal defect needs forehead skin & lining."
-        else:
-            flap = pick(size,{
-                "small":"Rieger dorsal-nasal flap",
-                "medium":"Glabellar rotation flap",
-                "large":"Paramedian forehead flap"})
-            rationale = pick(size,{
-                "small":"≤1 cm short transposition.",
-                "medium":"1-1.5 cm glabellar rotation.",
-                "large":">1.5 cm forehead flap."})
-    elif loc == "Nasal ala / side-wall":
-        if depth.startswith("Full"):
-            flap="Nasolabial interpolation flap + conchal cartilage"
-            rationale="Staged cheek skin + cartilage maintain airway."
-        else:
-            flap = pick(size,{
-                "small":"Inferior bilobed flap",
-                "medium":"Nasolabial interpolation flap",
-                "large":"Paramedian forehead flap"})
-            rationale = pick(size,{
-                "small":"<1 cm ala gap bilobed.",
-                "medium":"1-1.5 cm staged nasolabial.",
-                "large":">1.5 cm requires forehead flap."})
-
-    # ————————————————— EYELIDS / CANTHI —————————————————
-    elif loc == "Upper eyelid":
-        if depth.startswith("Full"):
-            flap = "Cutler-Beard bridge flap" if size=="large" else "Tenzel semicircular flap"
-            rationale = ("Full-thickness >50 % upper-lid via 2-stage Cutler-Beard."
-                         if size=="large"
-                         else "25-50 % full-thickness closed by Tenzel lateral rotation.")
-        else:
-            flap = pick(size,{
-                "small":"Direct closure in lid crease",
-                "medium":"Blepharoplasty skin-advancement",
-                "large":"Tenzel semicircular flap"})
-            rationale = pick(size,{
-                "small":"<1 cm skin closed in natural crease.",
-                "medium":"1-1.5 cm advanced redundant lid skin.",
-                "large":">1.5 cm superficial uses Tenzel flap."})
-    elif loc == "Lower eyelid":
-        if depth.startswith("Full"):
-            flap = "Hughes tarsoconjunctival flap + STSG" if size=="large" else "Tenzel semicircular flap"
-            rationale = (">50 % full-thickness lower-lid with Hughes posterior lamella + skin graft."
-                         if size=="large"
-                         else "25-50 % full-thickness uses Tenzel semicircular.")
-        else:
-            flap = pick(size,{
-                "small":"Direct closure",
-                "medium":"Full-thickness skin graft",
-                "large":"Tenzel semicircular flap"})
-            rationale = pick(size,{
-                "small":"≤1 cm linear closure.",
-                "medium":"1-1.5 cm graft from post-auricular.",
-                "large":">1.5 cm superficial uses Tenzel."})
-    elif loc == "Medial canthus":
-        if depth.startswith("Full") or size=="large":
-            flap="Paramedian (glabellar) forehead interpolation flap"
-            rationale="Deep/large medial canthus needs staged glabellar skin."
-        else:
-            flap = "Full-thickness skin graft" if size=="small" else "Glabellar V-Y (Rintala) flap"
-            rationale = ("<1 cm grafted with thin skin."
-                         if size=="small"
-                         else "1-1.5 cm V-Y glabellar transposition.")
-    elif loc == "Lateral canthus":
-        flap = pick(size,{
-            "small":"Direct primary closure",
-            "medium":"Tenzel semicircular flap",
-            "large":"Mustardé cheek rotation flap"})
-        rationale = pick(size,{
-            "small":"≤1 cm closed after cantholysis.",
-            "medium":"25-50 % lateral defect uses Tenzel.",
-            "large":">1.5 cm needs Mustardé cheek rotation."})
-
-    # ————————————————— LIPS / COMMISSURE —————————————————
-    elif loc.startswith("Upper lip"):
-        zone="central" in loc
-        if depth.startswith("Superficial") and size=="small":
-            flap="V-Y vermilion advancement"
-            rationale="Tiny vermilion excision advanced mucosa."
-        else:
-            if zone:
-                flap = pick(size,{
-                    "small":"Full-thickness wedge closure",
-                    "medium":"Abbé cross-lip flap",
-                    "large":"Karapandzic bilateral rotation"})
-                rationale = pick(size,{
-                    "small":"≤0.8 cm (<30 %) wedge.",
-                    "medium":"30-60 % central: staged Abbé cross-lip.",
-                    "large":">60 %: bilateral Karapandzic."})
-            else:
-                flap = pick(size,{
-                    "small":"Full-thickness wedge closure",
-                    "medium":"Estlander flap",
-                    "large":"Bernard-Burow advancement"})
-                rationale = pick(size,{
-                    "small":"<30 % lateral wedge.",
-                    "medium":"30-50 % lateral/commissure Estlander.",
-                    "large":">50 % cheek advancement."})
-    elif loc.startswith("Lower lip"):
-        zone="central" in loc
-        if zone:
-            flap = pick(size,{
-                "small":"Full-thickness wedge closure",
-                "medium":"Karapandzic rotation flap",
-                "large":"Bernard-Webster bilateral advancement"})
-            rationale = pick(size,{
-                "small":"<30 % wedge.",
-                "medium":"30-60 % central Karapandzic.",
-                "large":">60 % Bernard-Webster."})
-        else:
-            flap = pick(size,{
-                "small":"Full-thickness wedge closure",
-                "medium":"Estlander flap",
-                "large":"Extended Karapandzic / Burow"})
-            rationale = pick(size,{
-                "small":"<30 % lateral wedge.",
-                "medium":"30-50 % Estlander.",
-                "large":">50 % extended circumoral rotation."})
-    elif loc == "Oral commissure":
-        if depth.startswith("Full") or size=="large":
-            flap="Free radial-forearm commissuroplasty flap"
-            rationale="Near-total commissure reconstructed microsurgically."
-        else:
-            flap = "Commissuroplasty triangular flap" if size=="small" else "Estlander cross-lip flap"
-            rationale = ("<1 cm triangular mucocutaneous realignment."
-                         if size=="small"
-                         else "1-1.5 cm lateral loss Estlander flap.")
-
-    # ————————————————— CHEEK / CHIN —————————————————
-    elif loc == "Cheek – infra-orbital":
-        flap = pick(size,{
-            "small":"Malar V-Y advancement",
-            "medium":"Mustardé cheek rotation",
-            "large":"Cervicofacial rotation"})
-        rationale = pick(size,{
-            "small":"≤1.5 cm V-Y under eyelid.",
-            "medium":"1.5-3 cm Mustardé malar rotation.",
-            "large":">3 cm cervicofacial flap."})
-    elif loc == "Cheek – buccal":
-        if depth.startswith("Full"):
-            flap="Cervicofacial rotation flap"
-            rationale="Deep buccal loss best with large rotation."
-        else:
-            flap = pick(size,{
-                "small":"Limberg rhomboid flap",
-                "medium":"V-Y cheek advancement",
-                "large":"Cervicofacial rotation"})
-            rationale = pick(size,{
-                "small":"≤2 cm rhomboid along smile lines.",
-                "medium":"2-4 cm V-Y advancement.",
-                "large":">4 cm cervicofacial flap."})
-    elif loc == "Chin – mentum":
-        if depth.startswith("Full"):
-            flap="Submental island flap"
-            rationale="Full-thickness chin needs pedicled submental."
-        else:
-            flap = pick(size,{
-                "small":"H-plasty bilateral advancement",
-                "medium":"Submental advancement flap",
-                "large":"Extended cervicofacial rotation"})
-            rationale = pick(size,{
-                "small":"≤1.5 cm bilateral advancement under chin.",
-                "medium":"1.5-3 cm submental laxity advanced.",
-                "large":">3 cm cheek-neck rotation."})
-
-    # ————————————————— EAR / PERI-AURICULAR —————————————————
-    elif loc == "Ear – helical rim":
-        flap = pick(size,{
-            "small":"V-wedge chondro-cutaneous closure",
-            "medium":"Antia-Buch advancement flap",
-            "large":"Posterior-auricular tubed flap"})
-        rationale = pick(size,{
-            "small":"Short segment closed wedge.",
-            "medium":"1-1.5 cm rim advanced.",
-            "large":">1.5 cm staged tubed flap."})
-        if depth.startswith("Full") and size!="small":
-            rationale += "  Conchal cartilage graft supports rim."
-    elif loc == "Ear – conchal bowl":
-        flap = pick(size,{
-            "small":"Post-auricular full-thickness skin graft",
-            "medium":"Revolving-door island flap",
-            "large":"Two-stage posterior-auricular flap"})
-        rationale = pick(size,{
-            "small":"Thin FTSG matches concavity.",
-            "medium":"Island flap swings into bowl.",
-            "large":">2.5 cm requires staged flap."})
-    elif loc == "Ear – lobule":
-        flap = pick(size,{
-            "small":"Direct wedge closure",
-            "medium":"Gavello V-Y advancement",
-            "large":"Bilobed lobule rotation + composite graft"})
-        rationale = pick(size,{
-            "small":"Tiny gap approximated.",
-            "medium":"V-Y slides inferior lobule.",
-            "large":">1.5 cm rotation + graft restore bulk."})
-    elif loc == "Peri-auricular skin":
-        flap = pick(size,{
-            "small":"Direct sulcus closure",
-            "medium":"Retro-auricular rotation flap",
-            "large":"Cervicofacial rotation flap"})
-        rationale = pick(size,{
-            "small":"≤2 cm scar hides behind ear.",
-            "medium":"2-4 cm mastoid rotation.",
-            "large":">4 cm extended cervicofacial."})
-        if depth.startswith("Full"):
-            rationale += "  Parotid fascia exposed – SMAS turned in."
-
-    # ————————————————— NOTES / RISK FLAGS —————————————————
-    notes = []
-    if smk: notes.append("Smoking jeopardises flap – cessation essential.")
-    if dia: notes.append("Optimise glycaemia pre-op.")
-    if rad: notes.append("Radiated skin – consider delay/wider pedicle.")
-    if hair and "graft" in flap.lower():
-        notes.append("A graft on hair-bearing skin causes alopecia; flap chosen.")
-    if age < 18:
-        notes.append("Paediatric skin tight – staged expansion may help.")
-    elif age > 70:
-        notes.append("Elderly laxity aids rotation; rhytids hide scars.")
-    if kind == "Oncologic":
-        notes.append("Confirm clear margins before reconstruction.")
-    elif kind == "Traumatic":
-        notes.append("Debride & align with laceration lines.")
-    elif kind == "Congenital":
-        notes.append("Consider staged expansion for symmetry.")
-
-    return (
-        f"**Recommended flap:** {flap}\n\n"
-        f"**Rationale:** {rationale}\n\n"
-        f"**Notes:** {' '.join(notes) if notes else 'None.'}"
-    )
+# Keep this import block light: pandas / NumPy / pyarrow load lazily inside
+# the admin + batch features (budget enforced by bench/startup_budget.py).
+from flap_selector import DEPTH_OPTS, KINDS, DecisionTable, current_rules
+from flap_selector.aggregates import DIMENSIONS, Q2_SCALE, Q3_SCALE, AggregateFile
+from flap_selector.engine import on_reload
+from flap_selector.export import ExportFilter, export_file
+from flap_selector.logview import LogView
+from flap_selector.profiling import fragment_run, rerun, stage
+from flap_selector.similar import CaseIndex
+from flap_selector.telemetry import RuleHits, feedback_by_rule, hit_table
+from flap_selector.usagelog import ARCHIVE_DIR, DATA_PATH, UsageLogWriter, writer_from_env
 
 # ───────────────────────────────────────────────────────────────
 # 1️⃣  CONSTANTS & UTILITY
 # ───────────────────────────────────────────────────────────────
-DATA_PATH = Path(".data/usage_log.csv")
 DATA_PATH.parent.mkdir(exist_ok=True, parents=True)   # hidden folder
 
-SUBUNITS = [
-    "Scalp", "Forehead – central", "Forehead – lateral", "Temple",
-    "Zygomatic-arch (temporal-malar)", "Nasal tip", "Nasal dorsum",
-    "Nasal ala / side-wall", "Upper eyelid", "Lower eyelid",
-    "Medial canthus", "Lateral canthus", "Upper lip – central",
-    "Upper lip – lateral", "Lower lip – central", "Lower lip – lateral",
-    "Oral commissure", "Cheek – infra-orbital", "Cheek – buccal",
-    "Chin – mentum", "Ear – helical rim", "Ear – conchal bowl",
-    "Ear – lobule", "Peri-auricular skin",
+PGY_LEVELS = ["PGY-1", "PGY-2", "PGY-3", "PGY-4", "PGY-5", "Fellow", "Staff"]
+EXPERIENCE_LEVELS = [
+    "",
+    "Early Career Faculty <5years",
+    "Faculty 5-10years",
+    "Faculty 10-20 years",
+    "Faculty > 20 years",
 ]
 
-DEPTH_OPTS = [
-    "Superficial (skin only)",
-    "Partial thickness (subcut / perichondrium)",
-    "Full thickness (cartilage / bone exposed)",
-]
+@st.cache_resource
+def get_log_writer() -> UsageLogWriter:
+    """One write-behind writer shared by every session in this process.
+
+    FLAP_LOG_STORE=.data/usage_log.db switches the log to SQLite.
+    """
+    return writer_from_env(listeners=[AggregateFile()])
+
+@st.cache_resource
+def get_decision_table() -> DecisionTable:
+    """Memoised decide() shared by every session (hit/miss counts in the admin area).
+
+    Also counts which rule answered, for the admin "Rule hits" table.
+    """
+    return DecisionTable(hits=RuleHits())
+
+@st.cache_resource(show_spinner="Indexing past cases…")
+def get_case_index() -> CaseIndex:
+    """Similar-past-cases index over the whole log; the writer inserts new rows."""
+    writer = get_log_writer()
+    index = CaseIndex()
+
+    def backfill():
+        if (ARCHIVE_DIR / "manifest.json").exists():
+            from flap_selector.compact import iter_archive_rows
+            index.add_many(iter_archive_rows(ARCHIVE_DIR))
+        if writer.store.exists():
+            index.add_many(writer.store.iter_rows())
+
+    writer.add_listener(index, backfill=backfill)   # no row missed or indexed twice
+    return index
+
+@st.cache_resource
+def get_atlas():
+    """Offline decision atlas (.data/atlas/), rewritten whenever the rules hot-reload."""
+    from flap_selector.atlas import ATLAS_DIR, ensure_atlas, write_atlas
+    on_reload(lambda rules: write_atlas(ATLAS_DIR, rules))
+    return ensure_atlas(ATLAS_DIR)
+
+@st.cache_resource
+def get_shipper():
+    """Background log shipper when FLAP_SHIP_URL is set (s3://bucket/prefix or file:///dir)."""
+    from flap_selector.shipper import shipper_from_env
+    shipper = shipper_from_env()
+    return shipper.start() if shipper else None
+
+@st.cache_resource
+def get_log_view() -> LogView:
+    """Shared in-memory copy of the log + archive; each rerun parses only appended rows."""
+    return LogView(get_log_writer().store, archive=ARCHIVE_DIR)
 
 def log_row(row: dict) -> None:
-    """Append one anonymised row to .data/usage_log.csv."""
-    first = not DATA_PATH.exists()
-    pd.DataFrame([row]).to_csv(DATA_PATH, mode="a", header=first, index=False)
+    """Queue one anonymised row for .data/usage_log.csv (returns immediately)."""
+    get_log_writer().submit(row)
 
 # ───────────────────────────────────────────────────────────────
 # 2️⃣  STREAMLIT PAGE CONFIG & SIDEBAR
 # ───────────────────────────────────────────────────────────────
+# The script body runs on page load only: clicks inside the admin area and
+# the case panel (st.fragment, below) rerun just their own fragment.
 st.set_page_config("Flap-Selector (Research)", "🩺", layout="wide")
+prof = rerun()                           # FLAP_PROFILE=1 → per-stage timings, else a no-op
+get_atlas()                              # once per process: writes the atlas, hooks rules reloads
+get_shipper()                            # once per process: off unless FLAP_SHIP_URL is set
 
 with st.sidebar:
     st.header("Flap Selection Tool")
@@ -425,43 +104,112 @@ with st.sidebar:
         "in a private file visible *only* to the Research team.\n\n"
         "Made by referencing Baker — 3rd edition, Neligan Volume 1 & 3 — 5th edition.\n" 
     )
-    if DATA_PATH.exists():
-        st.caption(f"Logged cases: {len(pd.read_csv(DATA_PATH))}")
+    store = get_log_writer().store
+    if store.exists():
+        with stage("log_count"):
+            n_logged = get_log_view().count()
+        st.caption(f"Logged cases: {n_logged}")
     st.caption(f"Build: {date.today()}")
-# -- INSIDE the "with st.sidebar:" block --
-if DATA_PATH.exists():
+prof.lap("sidebar")
+
+# ───────────────────────────────────────────────────────────────
+# 3️⃣  ADMIN AREA  (fragment: its widgets rerun only this block)
+# ───────────────────────────────────────────────────────────────
+@st.fragment
+def admin_area(store) -> None:
+    frag = fragment_run("admin")             # a fragment rerun never reaches prof.done()
     # OPTIONAL one-line password gate ─ remove if not needed
-    pw_ok = st.text_input("Admin password", type="password") == st.secrets["ADMIN_PASS"]
+    with stage("secrets"):
+        admin_pass = st.secrets["ADMIN_PASS"]
+    pw_ok = st.text_input("Admin password", type="password") == admin_pass
 
     if pw_ok:
+        # filters only; the file itself is built when the button is clicked
+        ex1, ex2, ex3 = st.columns([2, 3, 2])
+        days = ex1.date_input("Export date range", value=())
+        ex_locs = ex2.multiselect("Export sub-units", current_rules().subunits)
+        ex_used = ex3.radio("Used recommended?", ["Any", "Yes", "No"], horizontal=True)
+        ex_gzip = ex3.checkbox("gzip", value=True)
+        flt = ExportFilter(
+            start=days[0] if days else None,
+            end=days[-1] if days else None,
+            locs=frozenset(ex_locs) or None,
+            used_recommended=None if ex_used == "Any" else ex_used == "Yes",
+        )
         st.download_button(
             "⬇️  Download usage CSV",
-            data=DATA_PATH.read_bytes(),
-            file_name="usage_log.csv",
-            mime="text/csv",
+            data=lambda: export_file(store, flt, gzip=ex_gzip, archive=ARCHIVE_DIR),
+            file_name="usage_log.csv.gz" if ex_gzip else "usage_log.csv",
+            mime="application/gzip" if ex_gzip else "text/csv",
+        )
+
+        st.download_button(
+            "⬇️  Offline decision atlas (HTML)",
+            data=lambda: get_atlas().read_bytes(),
+            file_name=f"flap-atlas-{current_rules().version}.html",
+            mime="text/html",
         )
 
+        memo = get_decision_table().stats()
+        st.caption(f"Rules {memo['rules_version'] or current_rules().version} · "
+                   f"decision table: {memo['size']} keys cached, "
+                   f"{memo['hits']} hits / {memo['misses']} misses")
+
+        with st.expander("🎯 Rule hits"):
+            # counted per decide() across sessions; feedback joined from the log view
+            rules = current_rules()
+            hits = get_decision_table().hits
+            by_rule = feedback_by_rule(get_log_view().frame(), rules.version)
+            table = hit_table(rules, hits.totals().get(rules.version, {}), by_rule)
+            st.caption(f"Rules {rules.version} · {sum(r['hits'] for r in table)} hits "
+                       f"since {hits.since()} · {sum(not r['hits'] for r in table)} rules never fired")
+            st.dataframe(table, hide_index=True)
+
+        with st.expander("📊 Concordance dashboard"):
+            # running totals kept by the log writer – no log scan here
+            agg_file = AggregateFile()
+            dim = st.selectbox("Break down by", list(DIMENSIONS), format_func=DIMENSIONS.get)
+            agg = agg_file.load()
+            st.caption(f"{agg.total()} cases aggregated")
+            st.dataframe(agg.table(dim), hide_index=True)
+            if st.button("Rebuild from full log"):
+                from itertools import chain
+                from flap_selector.compact import iter_archive_rows
+                # the writer's listener must not fold in a batch the rebuild already read
+                get_log_writer().between_batches(lambda: agg_file.rebuild(
+                    chain(iter_archive_rows(ARCHIVE_DIR), store.iter_rows())))
+                st.rerun(scope="fragment")
+    frag.done()
+
+if store.exists():
+    admin_area(store)
+prof.lap("admin")
+
 # ───────────────────────────────────────────────────────────────
-# 3️⃣  SESSION-STATE INITIALISATION
+# 4️⃣  SESSION-STATE INITIALISATION
 # ───────────────────────────────────────────────────────────────
 for key, default in {
     "case_submitted": False,
     "feedback_done":  False,
     "case_row":       {},
-    "recommendation": "",
+    "recommendation": None,
+    "or_cases":       None,      # OR-list mode: cleaned case table,
+    "or_recs":        None,      # … its decide_batch() results
+    "or_time":        "",        # … and when it was scored
+    "or_done":        False,
 }.items():
     if key not in st.session_state:
         st.session_state[key] = default
+prof.lap("session_state")
 
 # ───────────────────────────────────────────────────────────────
-# 1️⃣  CASE-ENTRY FORM  (shows until first submit)
+# 5️⃣  CASE-ENTRY FORM  (shows until first submit)
 # ───────────────────────────────────────────────────────────────
-if not st.session_state.case_submitted:
+def case_form() -> None:
     with st.form("case_form"):
         c1, c2 = st.columns(2)
-        loc   = c1.selectbox("Anatomical sub-unit", SUBUNITS)
-        kind  = c2.selectbox("Defect type",
-                             ["Oncologic", "Traumatic", "Congenital"])
+        loc   = c1.selectbox("Anatomical sub-unit", current_rules().subunits)
+        kind  = c2.selectbox("Defect type", KINDS)
         depth = c1.radio("Depth of defect", DEPTH_OPTS)
         cm    = c2.number_input("Largest diameter (cm)",
                                 min_value=0.1, max_value=25.0,
@@ -512,17 +260,30 @@ if not st.session_state.case_submitted:
             "smk": smk,
             "rad": rad,
         }
-        st.session_state.recommendation = decide(
-            loc, kind, cm, depth, hair, age, dia, smk, rad
-        )
+        with stage("decide"):
+            st.session_state.recommendation = get_decision_table().decide(
+                loc, kind, cm, depth, hair, age, dia, smk, rad
+            )
         st.session_state.case_submitted = True
 
 # ───────────────────────────────────────────────────────────────
-# 2️⃣  SHOW RECOMMENDATION & FEEDBACK  (single page)
+# 6️⃣  SHOW RECOMMENDATION & FEEDBACK  (single page)
 # ───────────────────────────────────────────────────────────────
-# ───────── STAGE 2 – recommendation + feedback (single page) ─────────
-if st.session_state.case_submitted and not st.session_state.feedback_done:
-    st.markdown(st.session_state.recommendation)
+def recommendation_and_feedback() -> None:
+    rec = st.session_state.recommendation
+    st.markdown(rec.to_markdown())
+
+    case = st.session_state.case_row
+    with stage("similar_cases"):
+        similar = get_case_index().similar(
+            case["loc"], case["depth"], case["cm"], case["age"],
+            case["hair"], case["dia"], case["smk"], case["rad"], k=5)
+    with st.expander(f"🗂️ Similar past cases ({len(similar)})"):
+        if similar:
+            st.caption("Same sub-unit and depth, nearest by size, age and risk flags.")
+            st.dataframe(similar, hide_index=True)
+        else:
+            st.caption("No logged cases with this sub-unit and depth yet.")
 
     # 1️⃣  Feedback form
     with st.form("feedback_form"):
@@ -549,52 +310,26 @@ if st.session_state.case_submitted and not st.session_state.feedback_done:
 
         pgy_levels = st.multiselect(
             "PGY level",
-            [
-                "PGY-1",
-                "PGY-2",
-                "PGY-3",
-                "PGY-4",
-                "PGY-5",
-                "Fellow",
-                "Staff",
-            ],
+            PGY_LEVELS,
             key="pgy_levels"
         )
 
         experience_level = st.selectbox(
             "Experience level (only if faculty)",
-            [
-                "",
-                "Early Career Faculty <5years",
-                "Faculty 5-10years",
-                "Faculty 10-20 years",
-                "Faculty > 20 years",
-            ],
+            EXPERIENCE_LEVELS,
             key="experience_level"
         )
        
         q2_algorithm_help = st.radio(
             "To what extent did your recon plan match the algorithm suggestion?",
-            [
-                "Strongly Agree",
-                "Agree",
-                "Neutral",
-                "Disagree",
-                "Strongly Disagree",
-            ],
+            Q2_SCALE,
             key="algorithm_assist_q2",
             horizontal=True,
         )
        
         q3_algorithm_help = st.radio(
             "To what extent did the algorithm assist you in recon planning?",
-            [
-                "Very helpful",
-                "Helpful",
-                "Neutral",
-                "Unhelpful",
-                "Very unhelpful",
-            ],
+            Q3_SCALE,
             key="algorithm_assist_q3",
             horizontal=True,
         )
@@ -613,16 +348,12 @@ if st.session_state.case_submitted and not st.session_state.feedback_done:
             st.warning("Please tell us which flap you used.")
             st.stop()
 
-        import re, csv
-
-        # Extract recommended flap from markdown
-        m = re.search(r"\*\*Recommended flap:\*\*\s*(.+)", st.session_state.recommendation)
-        rec_flap = m.group(1).strip() if m else "(parse failed)"
-
         # Build row
         row = st.session_state.case_row.copy()
         row.update({
-            "recommended_flap": rec_flap,
+            "recommended_flap": rec.flap,
+            "rule_id": rec.rule_id,
+            "rules_version": rec.rules_version,
             "used_recommended": (used_choice == "Yes"),
             "alt_flap_if_no": alt_flap_val.strip(),
             "physician_name": physician_name.strip(),
@@ -632,13 +363,8 @@ if st.session_state.case_submitted and not st.session_state.feedback_done:
             "algorithm_assist_recon_planning_q3": q3_algorithm_help,
             "final_comments_rationale": final_comments_rationale.strip(),
         })
-        # Append to CSV
-        first_write = not DATA_PATH.exists()
-        with DATA_PATH.open("a", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=row.keys(), quoting=csv.QUOTE_MINIMAL)
-            if first_write:
-                writer.writeheader()
-            writer.writerow(row)
+        with stage("log_submit"):
+            log_row(row)
 
         st.success("Thank you — entry logged.")
         st.session_state.feedback_done = True
@@ -657,25 +383,163 @@ if st.session_state.case_submitted and not st.session_state.feedback_done:
             st.session_state.pop(k, None)
 
 # ───────────────────────────────────────────────────────────────
-# 3️⃣  RESET BUTTON AFTER FEEDBACK
+# 7️⃣  RESET BUTTON AFTER FEEDBACK
 # ───────────────────────────────────────────────────────────────
-if st.session_state.get("feedback_done"):
-    if st.button("Start new case"):
-        # Clear the per-case state
-        st.session_state["case_submitted"]  = False
-        st.session_state["feedback_done"]   = False
-        st.session_state["recommendation"]  = ""
-        st.session_state["case_row"]        = {}
-
-        # Remove optional widget values if they exist
-        for k in ("used_recommended", "alt_flap_text"):
-            st.session_state.pop(k, None)
+def start_new_case() -> None:
+    """on_click: runs before the panel reruns, so the fresh form shows in that same run."""
+    # Clear the per-case state
+    st.session_state["case_submitted"]  = False
+    st.session_state["feedback_done"]   = False
+    st.session_state["recommendation"]  = None
+    st.session_state["case_row"]        = {}
+
+    # Remove optional widget values if they exist
+    for k in ("used_recommended", "alt_flap_text"):
+        st.session_state.pop(k, None)
+
+@st.fragment
+def case_panel() -> None:
+    """Case form → recommendation + feedback → new case.
+
+    One fragment: every click in it reruns only this panel, and each step
+    hands over to the next within that same run.  The sidebar "Logged
+    cases" count catches up on the next full page run.
+    """
+    frag = fragment_run("case_panel")
+    if not st.session_state.case_submitted:
+        with stage("case_form"):
+            case_form()
+    if st.session_state.case_submitted and not st.session_state.feedback_done:
+        with stage("feedback_form"):
+            recommendation_and_feedback()
+    if st.session_state.feedback_done:
+        st.button("Start new case", on_click=start_new_case)
+    frag.done()
 
-        # Immediately show a fresh form (Streamlit ≥ 1.27)
-        try:
-            st.rerun()
-        except AttributeError:          # fallback for very old versions
-            st.experimental_rerun()
+# ───────────────────────────────────────────────────────────────
+# 8️⃣  OR LIST  (a whole day's defects: one table, one engine call, one append)
+# ───────────────────────────────────────────────────────────────
+def or_list_form() -> None:
+    from flap_selector import orlist          # pandas: loaded on first use of this mode
+    col = st.column_config
+    with st.form("or_list_form"):
+        st.caption("One row per defect – add rows with ＋, blank rows are ignored.")
+        edited = st.data_editor(
+            orlist.blank_list(),
+            key="or_list_editor",
+            num_rows="dynamic",
+            hide_index=True,
+            column_config={
+                "loc": col.SelectboxColumn("Sub-unit", options=current_rules().subunits,
+                                           required=True),
+                "kind": col.SelectboxColumn("Defect type", options=KINDS, default="Oncologic"),
+                "depth": col.SelectboxColumn("Depth", options=DEPTH_OPTS, required=True),
+                "cm": col.NumberColumn("Diameter (cm)", min_value=0.1, max_value=25.0,
+                                       step=0.1, required=True),
+                "age": col.NumberColumn("Age", min_value=0, max_value=120, step=1,
+                                        required=True),
+                "hair": col.CheckboxColumn("Hair-bearing", default=True),
+                "patient_sex": col.SelectboxColumn("Sex", options=orlist.SEXES),
+                "cancer_type": col.TextColumn("Cancer type"),
+                "margin_size_mm": col.NumberColumn("Margin (mm)", min_value=0.0, max_value=50.0,
+                                                   step=1.0, default=0.0),
+                "dia": col.CheckboxColumn("Diabetes", default=False),
+                "smk": col.CheckboxColumn("Smoker", default=False),
+                "rad": col.CheckboxColumn("Irradiated", default=False),
+            },
+        )
+        submitted = st.form_submit_button("Recommend flaps for list")
+
+    if submitted:
+        cases, problems = orlist.clean_cases(edited)
+        if not problems and not len(cases):
+            problems = ["Add at least one case."]
+        if problems:
+            st.warning("\n\n".join(problems))
+            return
+        with stage("decide_batch"):
+            st.session_state.or_recs = orlist.score_cases(cases, hits=get_decision_table().hits)
+        st.session_state.or_cases = cases
+        st.session_state.or_time = datetime.utcnow().isoformat(timespec="seconds")
+
+def or_list_feedback() -> None:
+    from flap_selector import orlist
+    cases, recs = st.session_state.or_cases, st.session_state.or_recs
+    st.markdown(f"**{len(cases)} cases scored** · rules {recs['rules_version'].iloc[0]}")
+    st.dataframe(
+        cases[["loc", "cm", "depth"]].join(recs[["flap", "rationale", "notes", "rule_id"]]),
+        hide_index=True,
+    )
+
+    with st.form("or_feedback_form"):
+        feedback = st.data_editor(
+            orlist.feedback_table(cases, recs),
+            key="or_feedback_editor",
+            hide_index=True,
+            disabled=["case", "recommended_flap"],
+            column_config={
+                "case": "Case",
+                "recommended_flap": "Recommended flap",
+                "used_recommended": st.column_config.CheckboxColumn("Used recommended?"),
+                "alt_flap_if_no": st.column_config.TextColumn("If not, which flap?"),
+                "algorithm_assist_recon_planning_q2": st.column_config.SelectboxColumn(
+                    "Plan matched algorithm?", options=Q2_SCALE),
+                "algorithm_assist_recon_planning_q3": st.column_config.SelectboxColumn(
+                    "Algorithm helped?", options=Q3_SCALE),
+                "final_comments_rationale": st.column_config.TextColumn("Comments / rationale"),
+            },
+        )
+        st.markdown("##### For the whole list")
+        physician_name = st.text_input("Physician name", key="or_physician_name",
+                                       placeholder="Enter physician name")
+        pgy_levels = st.multiselect("PGY level", PGY_LEVELS, key="or_pgy_levels")
+        experience_level = st.selectbox("Experience level (only if faculty)",
+                                        EXPERIENCE_LEVELS, key="or_experience_level")
+        send = st.form_submit_button(f"Submit feedback for {len(cases)} cases")
+
+    if send:
+        rows, problems = orlist.log_rows(
+            cases, recs, feedback,
+            {"physician_name": physician_name, "pgy_levels": pgy_levels,
+             "experience_level": experience_level},
+            st.session_state.or_time,
+        )
+        if problems:
+            st.warning("\n\n".join(problems))
+            return
+        with stage("log_submit"):
+            get_log_writer().submit_many(rows)   # one append for the whole list
+        st.success(f"Thank you — {len(rows)} entries logged.")
+        st.session_state.or_done = True
+
+def start_new_list() -> None:
+    """on_click: back to an empty list in the same run."""
+    st.session_state["or_cases"] = None
+    st.session_state["or_recs"]  = None
+    st.session_state["or_done"]  = False
+    for k in ("or_list_editor", "or_feedback_editor"):
+        st.session_state.pop(k, None)
+
+@st.fragment
+def or_list_panel() -> None:
+    """Case table → recommendations + feedback table → new list, as in case_panel."""
+    frag = fragment_run("or_list_panel")
+    if st.session_state.or_cases is None:
+        with stage("or_list_form"):
+            or_list_form()
+    if st.session_state.or_cases is not None and not st.session_state.or_done:
+        with stage("or_feedback_form"):
+            or_list_feedback()
+    if st.session_state.or_done:
+        st.button("Start new list", on_click=start_new_list)
+    frag.done()
+
+entry = st.radio("Entry mode", ["Single case", "OR list"], horizontal=True, key="entry_mode")
+if entry == "OR list":
+    or_list_panel()
+else:
+    case_panel()
+prof.lap("case_panel")
 
 
 # ───────────────────────────────────────────────────────────────
@@ -683,3 +547,5 @@ if st.session_state.get("feedback_done"):
 # ───────────────────────────────────────────────────────────────
 st.markdown("---")
 st.caption("Research prototype — use best clinical judgement.")
+prof.lap("footer")
+prof.done()
@@ -0,0 +1,98 @@
+# bench/api_check.py  –  the JSON API's status codes, called as a bare ASGI app
+# -----------------------------------------------------------------
+#   python bench/api_check.py              # exits 1 on any unexpected status
+#
+# Sends good and malformed bodies straight to api.app (no server, no
+# uvicorn) and checks each gets the status a client is promised: 200 / 202
+# for valid cases, 400 for bodies that are not JSON or not UTF-8, 422 for
+# every field of the wrong type or out of range – including lists and
+# objects where a choice is expected – never a 500.  A case without "hair"
+# is taken as hair-bearing, the form's default.
+# The data dir is a fresh temp dir (FLAP_DATA_DIR), never .data.
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ["FLAP_DATA_DIR"] = tempfile.mkdtemp(prefix="flap-api-")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector import api  # noqa: E402
+from flap_selector.engine import DEPTH_OPTS, current_rules  # noqa: E402
+
+CASE = {"loc": current_rules().subunits[0], "kind": "Oncologic", "cm": 1.2,
+        "depth": DEPTH_OPTS[1], "age": 60, "hair": False, "dia": False, "smk": True, "rad": False}
+
+
+async def call(method: str, path: str, body) -> tuple[int, object]:
+    raw = body if isinstance(body, bytes) else json.dumps(body).encode()
+    sent, received = [], [{"type": "http.request", "body": raw, "more_body": False}]
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(msg):
+        sent.append(msg)
+
+    try:
+        await api.app({"type": "http", "method": method, "path": path}, receive, send)
+    except Exception as exc:                       # noqa: BLE001 – what a server turns into a 500
+        return 500, f"{type(exc).__name__}: {exc}"
+    payload = json.loads(sent[1]["body"]) if path != "/metrics" else sent[1]["body"]
+    return sent[0]["status"], payload
+
+
+def cases() -> list[tuple]:
+    """(method, path, body, expected status)"""
+    out = [("POST", "/recommend", CASE, 200),
+           ("POST", "/recommend/batch", {"cases": [CASE, CASE]}, 200),
+           ("POST", "/feedback", {**CASE, "used_recommended": True}, 202),
+           ("GET", "/healthz", b"", 200),
+           ("POST", "/recommend", b"{not json", 400),
+           ("POST", "/recommend", b'"\xff"', 400),
+           ("POST", "/feedback", b'{"loc": "\xc3"}', 400),
+           ("GET", "/recommend", b"", 405),
+           ("POST", "/nowhere", b"", 404)]
+    bad_values = [["x"], {"a": 1}, 3, None, True]
+    for field in ("loc", "kind", "depth"):
+        for value in bad_values:
+            out.append(("POST", "/recommend", {**CASE, field: value}, 422))
+            out.append(("POST", "/recommend/batch", {"cases": [CASE, {**CASE, field: value}]}, 422))
+    for field in ("patient_sex", "algorithm_assist_recon_planning_q2",
+                  "algorithm_assist_recon_planning_q3"):
+        for value in bad_values:
+            out.append(("POST", "/feedback", {**CASE, "used_recommended": True, field: value}, 422))
+    for field, value in (("cm", "1.2"), ("cm", 99), ("age", float("nan")), ("hair", "yes"),
+                         ("pgy_levels", "PGY-1"), ("physician_name", ["x"])):
+        body = {**CASE, "used_recommended": True, field: value}
+        out.append(("POST", "/feedback", json.dumps(body).encode(), 422))
+    out.append(("POST", "/feedback", {**CASE, "used_recommended": False}, 422))
+    out.append(("POST", "/recommend", ["not", "an", "object"], 422))
+    return out
+
+
+def check_defaults() -> int:
+    hairless = {k: v for k, v in CASE.items() if k != "hair"}
+    hair = api.feedback_row({**hairless, "used_recommended": True})["hair"]
+    print(f"defaults: feedback without 'hair' logs hair={hair} (the form's default: True)")
+    return 0 if hair is True else 1
+
+
+async def run() -> int:
+    bad = check_defaults()
+    checks = cases()
+    for method, path, body, want in checks:
+        got, payload = await call(method, path, body)
+        if got != want:
+            bad += 1
+            shown = body if isinstance(body, bytes) else json.dumps(body)
+            print(f"  {method} {path} {shown[:80]}: {got}, want {want} – {payload}")
+    api._writer_instance().close()
+    print(f"check   : {len(checks) - bad}/{len(checks)} requests got the expected status")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,51 @@
+# bench/atlas_check.py  –  the decision atlas against decide(), exhaustively
+# -----------------------------------------------------------------
+#   python bench/atlas_check.py            # exits 1 on any mismatch
+#
+# Walks every sub-unit × defect type × depth × hair / risk flag combination
+# at cm values on and either side of each THR cut-off (plus NaN) and ages
+# on each band edge, and compares atlas.lookup() – the reference for the
+# page's JavaScript – with the live engine field by field.
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector.atlas import build_atlas, lookup, render_html  # noqa: E402
+from flap_selector.engine import DEPTH_OPTS, KINDS, current_rules  # noqa: E402
+
+FIELDS = ("flap", "rationale", "notes", "size_category", "rule_id", "rules_version")
+
+
+def main() -> int:
+    rules = current_rules()
+    t0 = time.perf_counter()
+    atlas = build_atlas(rules)
+    built = time.perf_counter() - t0
+    checked = bad = 0
+    spent = 0.0
+    for loc in rules.subunits:
+        lo, mid = rules.thr[loc]
+        cms = (0.1, lo - 0.05, lo, lo + 0.05, mid, mid + 0.05, 30.0, float("nan"))
+        for kind, cm, depth, flags, age in itertools.product(
+                KINDS + ["Other"], cms, DEPTH_OPTS, itertools.product((False, True), repeat=4),
+                (5, 17.5, 18, 70, 70.5, 90)):
+            want = rules.decide(loc, kind, cm, depth, flags[0], age, *flags[1:])
+            t0 = time.perf_counter_ns()
+            got = lookup(atlas, loc, kind, cm, depth, flags[0], age, *flags[1:])
+            spent += time.perf_counter_ns() - t0
+            checked += 1
+            bad += any(getattr(want, f) != got[f] for f in FIELDS)
+    size = len(json.dumps(atlas, ensure_ascii=False, separators=(",", ":")).encode())
+    print(f"atlas   : rules {rules.version}, built in {built * 1e3:.0f} ms, "
+          f"{size / 1024:.0f} KiB JSON, {len(render_html(atlas).encode()) / 1024:.0f} KiB HTML")
+    print(f"lookup  : {spent / checked / 1e3:.1f} µs in Python")
+    print(f"check   : {checked - bad:,}/{checked:,} cases match decide()")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+# bench/engine_suite.py  –  benchmark + golden-output check for decide()
+# -----------------------------------------------------------------
+#   python bench/engine_suite.py                  # check golden, time, write JSON
+#   python bench/engine_suite.py --update-golden  # after an intended rule change
+#   python bench/engine_suite.py --compare OLD.json NEW.json
+#
+# The grid is every discrete input the form can produce: all sub-units and
+# depths, defect sizes on and either side of each THR boundary, every defect
+# type, ages around the <18 / 18-70 / >70 bands, hair and all risk flags.
+#
+# bench/golden/engine.json pins the outputs three ways, all built from
+# decide() results only (so a rewritten engine is checked the same way):
+#   digests  sha256 of every case's output, per sub-unit
+#   sizes    _cat() on each sub-unit's boundary sizes
+#   rules    (loc, depth, size, hair)            -> [rule_id, flap, rationale]
+#   notes    (kind, hair-graft, age band, flags) -> notes
+# The golden part is pure Python; decide_batch() is timed and checked
+# against the scalar results only when NumPy / pandas are installed.
+import argparse
+import hashlib
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from flap_selector.engine import DEPTH_OPTS, KINDS, SUBUNITS, THR, _cat, decide  # noqa: E402
+
+GOLDEN = Path(__file__).with_name("golden") / "engine.json"
+RESULTS = Path(__file__).with_name("results")
+
+AGES = (0, 17, 18, 45, 70, 71, 95)
+FLAGS = list(itertools.product((False, True), repeat=3))            # dia, smk, rad
+
+
+def _sizes(loc: str) -> list[float]:
+    lo, mid = THR[loc]
+    edges = {0.1, lo - 0.1, lo, lo + 0.1, mid - 0.1, mid, mid + 0.1, 2 * mid}
+    return sorted(round(x, 2) for x in edges if x > 0)
+
+
+def grid(locs=SUBUNITS):
+    """Yield every benchmark case as decide()'s positional arguments."""
+    for loc in locs:
+        for depth, cm, kind, hair, age, (dia, smk, rad) in itertools.product(
+                DEPTH_OPTS, _sizes(loc), KINDS, (False, True), AGES, FLAGS):
+            yield loc, kind, cm, depth, hair, age, dia, smk, rad
+
+
+def _band(age: int) -> str:
+    return "<18" if age < 18 else ">70" if age > 70 else "18-70"
+
+
+def _line(case, rec) -> bytes:
+    return json.dumps([*case, rec.size_category, rec.rule_id, rec.flap, rec.rationale,
+                       list(rec.notes)], ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. GOLDEN OUTPUTS
+# ──────────────────────────────────────────────────────────────
+def snapshot() -> dict:
+    """Golden tables for the current engine (see module header)."""
+    digests, rules, notes, conflicts = {}, {}, {}, []
+
+    def put(table, key, value):
+        if table.setdefault(key, value) != value:
+            conflicts.append(key)
+
+    for loc in SUBUNITS:
+        h = hashlib.sha256()
+        for case in grid([loc]):
+            rec = decide(*case)
+            h.update(_line(case, rec))
+            _, kind, _, depth, hair, age, dia, smk, rad = case
+            put(rules, f"{loc}|{depth}|{rec.size_category}|{hair}",
+                [rec.rule_id, rec.flap, rec.rationale])
+            graft = hair and "graft" in rec.flap.lower()
+            put(notes, f"{kind}|{graft}|{_band(age)}|{dia}|{smk}|{rad}", list(rec.notes))
+        digests[loc] = h.hexdigest()
+    sizes = {loc: [[cm, _cat(loc, cm)] for cm in _sizes(loc)] for loc in SUBUNITS}
+    return {"version": 1, "cases": sum(1 for _ in grid()), "digests": digests,
+            "sizes": sizes, "rules": rules, "notes": notes, "conflicts": conflicts}
+
+
+def diff_golden(golden: dict, now: dict) -> list[str]:
+    """Human-readable differences between two snapshots (empty = equivalent)."""
+    out = [f"inconsistent outputs for {k}" for k in now["conflicts"]]
+    if golden["cases"] != now["cases"]:
+        out.append(f"grid size {golden['cases']} -> {now['cases']}")
+    for section in ("digests", "sizes", "rules", "notes"):
+        old, new = golden[section], now[section]
+        for key in sorted(old.keys() | new.keys()):
+            if old.get(key) != new.get(key):
+                out.append(f"{section}[{key}]: {old.get(key)!r} -> {new.get(key)!r}")
+    return out
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. TIMING & MEMORY
+# ──────────────────────────────────────────────────────────────
+def _pct(sorted_ns: list[int], q: float) -> float:
+    return sorted_ns[min(int(q * len(sorted_ns)), len(sorted_ns) - 1)] / 1000
+
+
+def bench_scalar(cases: list[tuple]) -> dict:
+    clock = time.perf_counter_ns
+    lat = []
+    for case in cases:
+        t0 = clock()
+        decide(*case)
+        lat.append(clock() - t0)
+    lat.sort()
+
+    t0 = time.perf_counter()
+    for case in cases:
+        decide(*case)
+    wall = time.perf_counter() - t0
+
+    pairs = [(loc, cm) for loc in SUBUNITS for cm in _sizes(loc)] * 100
+    t0 = clock()
+    for loc, cm in pairs:
+        _cat(loc, cm)
+    cat_ns = (clock() - t0) / len(pairs)
+
+    tracemalloc.start()
+    results = [decide(*case) for case in cases]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return {
+        "latency_us": {"mean": sum(lat) / len(lat) / 1000, "p50": _pct(lat, 0.5),
+                       "p90": _pct(lat, 0.9), "p99": _pct(lat, 0.99), "max": lat[-1] / 1000},
+        "cat_ns": cat_ns,
+        "calls_per_s": len(cases) / wall,
+        "peak_bytes": peak,
+        "bytes_per_result": peak / len(cases),
+    }
+
+
+def bench_memo(cases: list[tuple]) -> dict:
+    from flap_selector.memo import DecisionTable
+
+    table = DecisionTable()
+    t0 = time.perf_counter()
+    size = table.precompute()
+    fill = time.perf_counter() - t0
+    mismatches = sum(table.decide(*case) != decide(*case) for case in cases)
+
+    t0 = time.perf_counter()
+    for case in cases:
+        table.decide(*case)
+    wall = time.perf_counter() - t0
+    return {"keys": size, "precompute_s": fill, "hit_us": wall / len(cases) * 1e6,
+            "calls_per_s": len(cases) / wall, "mismatches_vs_scalar": mismatches}
+
+
+def bench_batch(cases: list[tuple], rows: int) -> dict | None:
+    try:
+        import pandas as pd
+        from flap_selector.batch import CASE_COLS, decide_batch
+    except ImportError:
+        return None
+
+    base = pd.DataFrame(cases, columns=CASE_COLS)
+    out = decide_batch(base)
+    expected = [decide(*case) for case in cases]
+    mismatches = sum(
+        (r.size_category, r.flap, r.rationale, " ".join(r.notes), r.rule_id, r.rules_version)
+        != tuple(got)
+        for r, got in zip(expected, out.astype(str).itertuples(index=False)))
+
+    df = pd.concat([base] * max(rows // len(base), 1), ignore_index=True)
+    t0 = time.perf_counter()
+    decide_batch(df)
+    wall = time.perf_counter() - t0
+    tracemalloc.start()
+    decide_batch(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows": len(df), "rows_per_s": len(df) / wall, "seconds": wall,
+            "peak_bytes": peak, "mismatches_vs_scalar": mismatches}
+
+
+# ──────────────────────────────────────────────────────────────
+# 3. CLI
+# ──────────────────────────────────────────────────────────────
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path: Path, new_path: Path) -> None:
+    old, new = (json.loads(Path(p).read_text()) for p in (old_path, new_path))
+    print(f"{old['commit']} -> {new['commit']}")
+    rows = [("decide mean µs", ("scalar", "latency_us", "mean")),
+            ("decide p99 µs", ("scalar", "latency_us", "p99")),
+            ("_cat ns", ("scalar", "cat_ns")),
+            ("calls/s", ("scalar", "calls_per_s")),
+            ("memo hit µs", ("memo", "hit_us")),
+            ("bytes/result", ("scalar", "bytes_per_result")),
+            ("batch rows/s", ("batch", "rows_per_s")),
+            ("batch peak bytes", ("batch", "peak_bytes"))]
+    for label, path in rows:
+        a, b = old, new
+        for key in path:
+            a = (a or {}).get(key)
+            b = (b or {}).get(key)
+        if a is None or b is None:
+            continue
+        print(f"  {label:<18}{a:>16,.2f}{b:>16,.2f}{b / a if a else float('nan'):>9.2f}x")
+    print(f"  golden            {old['golden']:>16}{new['golden']:>16}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="decide() benchmark and golden check")
+    parser.add_argument("--update-golden", action="store_true",
+                        help=f"rewrite {GOLDEN.relative_to(ROOT)} from the current engine")
+    parser.add_argument("--out", type=Path, help="results JSON (default bench/results/engine-<commit>.json)")
+    parser.add_argument("--batch-rows", type=int, default=1_000_000)
+    parser.add_argument("--no-batch", action="store_true")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    now = snapshot()
+    if args.update_golden:
+        GOLDEN.parent.mkdir(exist_ok=True)
+        GOLDEN.write_text(json.dumps(now, indent=1, ensure_ascii=False, sort_keys=True) + "\n",
+                          encoding="utf-8")
+        print(f"golden updated: {now['cases']:,} cases")
+    diffs = diff_golden(json.loads(GOLDEN.read_text(encoding="utf-8")), now)
+    for d in diffs[:20]:
+        print("DIFF", d, file=sys.stderr)
+
+    cases = list(grid())
+    result = {
+        "commit": _commit(),
+        "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(), "machine": platform.machine(),
+        "cases": len(cases),
+        "golden": "ok" if not diffs else f"{len(diffs)} diffs",
+        "scalar": bench_scalar(cases),
+        "memo": bench_memo(cases),
+        "batch": None if args.no_batch else bench_batch(cases, args.batch_rows),
+    }
+    out = args.out or RESULTS / f"engine-{result['commit']}.json"
+    out.parent.mkdir(exist_ok=True, parents=True)
+    out.write_text(json.dumps(result, indent=1) + "\n")
+
+    s, b = result["scalar"], result["batch"]
+    print(f"golden  : {result['golden']} ({len(cases):,} cases)")
+    print(f"decide  : {s['latency_us']['mean']:.2f} µs mean, {s['latency_us']['p99']:.2f} µs p99, "
+          f"{s['calls_per_s']:,.0f} calls/s, {s['bytes_per_result']:.0f} B/result")
+    m = result["memo"]
+    print(f"memo    : {m['hit_us']:.2f} µs per hit, {m['keys']:,} keys filled in "
+          f"{m['precompute_s']:.2f} s, {m['mismatches_vs_scalar']} mismatches")
+    if b:
+        print(f"batch   : {b['rows_per_s']:,.0f} rows/s over {b['rows']:,} rows, "
+              f"peak {b['peak_bytes'] / 2**20:.1f} MiB, {b['mismatches_vs_scalar']} mismatches")
+    print(f"written : {out}")
+    return 1 if diffs or m["mismatches_vs_scalar"] or (b and b["mismatches_vs_scalar"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,529 @@
+# bench/load_app.py  –  concurrent-session load test for app.py
+# -----------------------------------------------------------------
+#   python bench/load_app.py                          # 200 sessions, 16 worker processes
+#   python bench/load_app.py --sessions 500 --concurrency 32 --store sqlite
+#   python bench/load_app.py --seed-rows 100000       # start from a long log
+#   python bench/load_app.py --cpu --sessions 50      # server CPU per interaction
+#   python bench/load_app.py --cpu --app before.py    # … for another version of the page
+#   python bench/load_app.py --cpu --list 20          # … entering 20-case OR lists instead
+#
+# Each synthetic session is one streamlit.testing AppTest driving the real
+# script through the whole flow – first load, case form → recommendation,
+# feedback form → logged row – with a random case.
+#
+# AppTest swaps a process-global Runtime in and out around every script run,
+# so two sessions cannot run at once in one interpreter.  Each concurrent
+# slot is therefore a worker process – in effect one server replica with its
+# own st.cache_resource (log writer, decision table, case index) – running
+# its share of sessions back to back, and all of them read and append to the
+# same log.  Workers exit normally, so their write-behind queues drain.
+#
+# --cpu measures what one interaction costs the server instead.  AppTest
+# re-executes the whole script on every interaction, fragments or not, so
+# this mode starts a real `streamlit run` and drives it over its websocket
+# the way a browser does (widget states, plus the fragment id of the widget
+# that changed).  Sessions run one after another – load, admin password,
+# case form, feedback form, "Start new case" – and the server process's CPU
+# time (/proc/<pid>/stat, user + system) is charged to the step in flight.
+# With --list N each session switches to the "OR list" entry mode instead
+# and enters N cases as one table: case table → feedback table → "Start new
+# list".  The summary compares script runs and CPU per logged case, and the
+# log is checked like the AppTest run's (one row per case, exactly once).
+#
+# The data dir is a fresh temp dir (FLAP_DATA_DIR), never .data.  After the
+# run the log is read back: every session's row must be there exactly once,
+# parse cleanly and match the case that session entered.
+import argparse
+import csv
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS = Path(__file__).with_name("results")
+STEPS = ("load", "recommend", "feedback")
+CPU_STEPS = ("load", "admin_password", "recommend", "feedback", "new_case")
+LIST_STEPS = ("load", "admin_password", "list_mode", "score_list", "feedback_list", "new_list")
+PER_CASE = {"recommend", "feedback", "new_case", "score_list", "feedback_list", "new_list"}
+SETTLE = 0.05          # --cpu: seconds after a run before sampling, so its tail is charged to it
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] * 1000 if values else float("nan")
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. ONE SESSION
+# ──────────────────────────────────────────────────────────────
+def random_case(rnd: random.Random) -> dict:
+    from flap_selector.engine import DEPTH_OPTS, KINDS, current_rules
+    return {"loc": rnd.choice(current_rules().subunits), "kind": rnd.choice(KINDS),
+            "depth": rnd.choice(DEPTH_OPTS), "cm": round(rnd.uniform(0.1, 8.0), 1),
+            "age": rnd.randint(0, 99), "hair": rnd.random() < 0.3,
+            "dia": rnd.random() < 0.1, "smk": rnd.random() < 0.15, "rad": rnd.random() < 0.05,
+            "used": rnd.random() < 0.8}
+
+
+def _by_label(widgets, label: str):
+    return next(w for w in widgets if w.label == label)
+
+
+def run_session(token: str, case: dict, timeout: float) -> dict:
+    """Drive one session through the flow; returns per-step seconds (+ an error, if any)."""
+    from streamlit.testing.v1 import AppTest
+
+    times, clock = {}, time.perf_counter
+    at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=timeout)
+    try:
+        t0 = clock()
+        at.run()
+        times["load"] = clock() - t0
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+        _by_label(at.selectbox, "Anatomical sub-unit").select(case["loc"])
+        _by_label(at.selectbox, "Defect type").select(case["kind"])
+        _by_label(at.radio, "Depth of defect").set_value(case["depth"])
+        _by_label(at.number_input, "Largest diameter (cm)").set_value(case["cm"])
+        _by_label(at.number_input, "Patient age (years)").set_value(case["age"])
+        for label, key in (("Hair-bearing skin?", "hair"), ("Diabetes", "dia"),
+                           ("Active smoker", "smk"), ("Previously irradiated site", "rad")):
+            _by_label(at.checkbox, label).set_value(case[key])
+        t0 = clock()
+        _by_label(at.button, "Recommend flap").click().run()
+        times["recommend"] = clock() - t0
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+        at.radio(key="used_recommended").set_value("Yes" if case["used"] else "No")
+        if not case["used"]:
+            at.text_input(key="alt_flap_text").set_value("Load-test alternative")
+        at.text_area(key="final_comments_rationale").set_value(token)
+        t0 = clock()
+        _by_label(at.button, "Submit feedback").click().run()
+        times["feedback"] = clock() - t0
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        if not at.success:
+            raise RuntimeError("no confirmation after feedback submit")
+    except Exception as exc:                       # noqa: BLE001 – reported per session
+        times["error"] = f"{type(exc).__name__}: {exc}"
+    return times
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. LOG CHECK
+# ──────────────────────────────────────────────────────────────
+def _read_rows(log: Path) -> tuple[list[dict], list[str]]:
+    """All rows of the usage log, plus structural problems (CSV only)."""
+    from flap_selector.logstore import open_store
+    if log.suffix != ".csv":
+        store = open_store(log)
+        rows = list(store.iter_rows())
+        store.close()
+        return rows, []
+    problems = []
+    with log.open(newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        rows = []
+        for n, values in enumerate(reader, start=2):
+            if len(values) != len(header):
+                problems.append(f"line {n}: {len(values)} fields, header has {len(header)}")
+                continue
+            rows.append(dict(zip(header, values)))
+    return rows, problems
+
+
+def check_log(log: Path, expected: dict[str, dict], seeded: int) -> dict:
+    """Every submitted session's row present exactly once and matching its case."""
+    from flap_selector.engine import decide
+    rows, problems = _read_rows(log)
+    seen: dict[str, int] = {}
+    mismatched = []
+    for row in rows:
+        token = str(row.get("final_comments_rationale") or "")
+        case = expected.get(token)
+        if case is None:
+            continue
+        seen[token] = seen.get(token, 0) + 1
+        rec = decide(case["loc"], case["kind"], case["cm"], case["depth"], case["hair"],
+                     case["age"], case["dia"], case["smk"], case["rad"])
+        got = (row["loc"], str(row["depth"]), float(row["cm"]), int(float(row["age"])),
+               row["recommended_flap"], str(row["used_recommended"]))
+        want = (case["loc"], case["depth"].split()[0], case["cm"], case["age"],
+                rec.flap, str(case["used"]))
+        if got != want:
+            mismatched.append(token)
+    return {
+        "rows": len(rows), "seeded": seeded, "expected": len(expected),
+        "lost": sorted(set(expected) - set(seen)),
+        "duplicated": sorted(t for t, n in seen.items() if n > 1),
+        "mismatched": mismatched, "unexpected": len(rows) - seeded - sum(seen.values()),
+        "malformed": problems,
+    }
+
+
+# ──────────────────────────────────────────────────────────────
+# 3. SERVER CPU PER INTERACTION (--cpu)
+# ──────────────────────────────────────────────────────────────
+def _server_cpu(pid: int) -> float:
+    """User + system CPU seconds of process *pid* so far (Linux)."""
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class BrowserSession:
+    """Minimal Streamlit websocket client: widget states in, deltas out."""
+
+    def __init__(self, port: int, timeout: float):
+        from websockets.sync.client import connect
+        self.ws = connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"],
+                          max_size=None, open_timeout=timeout).__enter__()
+        self.timeout = timeout
+        self.widgets: dict[str, tuple] = {}    # label -> (widget id, fragment id)
+        self.values: dict[str, object] = {}    # widget id -> WidgetState the "browser" holds
+        self.runs = 0
+
+    def rerun(self, changed: str | None = None, **value) -> None:
+        """Set the widget labelled *changed* (e.g. string_value="x", trigger_value=True), rerun."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        msg = BackMsg()
+        fragment = self.set(changed, **value) if changed is not None else ""
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.widget_states.widgets.extend(self.values.values())
+        if fragment:
+            msg.rerun_script.fragment_id = fragment
+        self.ws.send(msg.SerializeToString())
+        # triggers (buttons) fire once, like the frontend
+        self.values = {k: v for k, v in self.values.items() if not v.HasField("trigger_value")}
+        self._wait()
+
+    def set(self, label: str, **value) -> str:
+        """Hold a new state for the widget labelled *label*; returns its fragment id."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        wid, fragment = self.widgets[label]
+        self.values[wid] = WidgetState(id=wid, **value)
+        return fragment
+
+    def _wait(self) -> None:
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        early = ForwardMsg.ScriptFinishedStatus.FINISHED_EARLY_FOR_RERUN
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(self.ws.recv(timeout=self.timeout))
+            kind = msg.WhichOneof("type")
+            if kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                widget = getattr(element, element.WhichOneof("type"))
+                label = getattr(widget, "label", "")
+                if getattr(widget, "editing_mode", 0):       # st.data_editor has no label
+                    label = "data_editor"
+                if getattr(widget, "id", "") and label:
+                    self.widgets[label] = (widget.id, msg.delta.fragment_id)
+            elif kind == "script_finished" and msg.script_finished != early:
+                self.runs += 1
+                return
+
+    def close(self) -> None:
+        self.ws.__exit__(None, None, None)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StreamlitServer:
+    """`streamlit run *app*` on a free port for the duration of a with block."""
+
+    def __init__(self, app: Path, cwd: Path, timeout: float):
+        self.app, self.cwd, self.timeout = app, cwd, timeout
+        self.port = _free_port()
+
+    def __enter__(self) -> "StreamlitServer":
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", str(self.app), "--server.headless", "true",
+             "--server.port", str(self.port), "--server.fileWatcherType", "none",
+             "--browser.gatherUsageStats", "false"],
+            cwd=self.cwd, env=dict(os.environ, PYTHONPATH=str(ROOT)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1)
+                break
+            except OSError as exc:
+                if time.time() > deadline or self.proc.poll() is not None:
+                    self.__exit__()
+                    raise RuntimeError(f"streamlit server for {self.app} did not come up") from exc
+                time.sleep(0.2)
+        warm = self.session()                    # first run pays imports + cache_resource
+        warm.rerun()
+        warm.close()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.proc.terminate()
+        self.proc.wait()
+
+    def session(self) -> BrowserSession:
+        return BrowserSession(self.port, self.timeout)
+
+    def cpu(self) -> float:
+        return _server_cpu(self.proc.pid)
+
+
+FLOOR_APP = 'import streamlit as st\nst.button("Again")\n'
+
+
+def _list_edits(cases: list[dict]) -> str:
+    """data_editor state for an empty case table with *cases* added."""
+    keys = ("loc", "kind", "depth", "cm", "age", "hair", "dia", "smk", "rad")
+    return json.dumps({"edited_rows": {}, "deleted_rows": [],
+                       "added_rows": [{k: c[k] for k in keys} for c in cases]})
+
+
+def _feedback_edits(cases: list[dict], tokens: list[str]) -> str:
+    """data_editor state for the feedback table: used / alternative / token per case."""
+    edits = {}
+    for i, (case, token) in enumerate(zip(cases, tokens)):
+        edits[str(i)] = {"used_recommended": case["used"], "final_comments_rationale": token}
+        if not case["used"]:
+            edits[str(i)]["alt_flap_if_no"] = "Load-test alternative"
+    return json.dumps({"edited_rows": edits, "added_rows": [], "deleted_rows": []})
+
+
+def run_cpu(args, data_dir: Path, app: Path, expected: dict | None = None) -> dict:
+    """Drive *app* under a real server; server CPU ms and wall ms per interaction step.
+
+    Also measures the floor: CPU per rerun of a one-button page, which is
+    what Streamlit itself costs per script run before app.py does anything.
+    With args.list, every case entered is added to *expected* (token -> case).
+    """
+    steps = LIST_STEPS if args.list else CPU_STEPS
+    cpu = {s: [] for s in steps}
+    wall = {s: [] for s in steps}
+    runs, rnd = 0, random.Random(args.seed)
+    with StreamlitServer(app, data_dir, args.timeout) as server:
+        def step(name, fn, *a, **kw):
+            c0, t0 = server.cpu(), time.perf_counter()
+            fn(*a, **kw)
+            wall[name].append(time.perf_counter() - t0)
+            time.sleep(SETTLE)
+            cpu[name].append(server.cpu() - c0)
+
+        for n in range(args.sessions):
+            session = server.session()
+            step("load", session.rerun)
+            step("admin_password", session.rerun, "Admin password", string_value="not the password")
+            if not args.list:
+                step("recommend", session.rerun, "Recommend flap", trigger_value=True)
+                step("feedback", session.rerun, "Submit feedback", trigger_value=True)
+                step("new_case", session.rerun, "Start new case", trigger_value=True)
+            else:
+                cases = [random_case(rnd) for _ in range(args.list)]
+                tokens = [f"cpu-{n:04d}-{i:03d}" for i in range(args.list)]
+                expected.update(zip(tokens, cases))
+                step("list_mode", session.rerun, "Entry mode", string_value="OR list")
+                session.set("data_editor", string_value=_list_edits(cases))
+                step("score_list", session.rerun, "Recommend flaps for list", trigger_value=True)
+                session.set("data_editor", string_value=_feedback_edits(cases, tokens))
+                step("feedback_list", session.rerun, f"Submit feedback for {args.list} cases",
+                     trigger_value=True)
+                step("new_list", session.rerun, "Start new list", trigger_value=True)
+            runs += session.runs
+            session.close()
+
+    floor_app = data_dir / "floor_app.py"
+    floor_app.write_text(FLOOR_APP)
+    with StreamlitServer(floor_app, data_dir, args.timeout) as server:
+        session = server.session()
+        session.rerun()
+        c0, n = server.cpu(), 5 * args.sessions
+        for _ in range(n):
+            session.rerun("Again", trigger_value=True)
+            time.sleep(SETTLE)
+        floor = (server.cpu() - c0) / n
+        session.close()
+    per_session = args.list or 1
+    return {"app": str(app), "sessions": args.sessions, "cases_per_session": per_session,
+            "script_runs": runs, "floor_cpu_ms": 1000 * floor,
+            "per_case": {
+                "script_runs": sum(len(cpu[s]) for s in steps if s in PER_CASE)
+                / (args.sessions * per_session),
+                "cpu_ms": 1000 * sum(sum(cpu[s]) for s in steps if s in PER_CASE)
+                / (args.sessions * per_session)},
+            "steps": {s: {"n": len(cpu[s]), "cpu_ms": 1000 * sum(cpu[s]) / max(len(cpu[s]), 1),
+                          "wall_p50_ms": _pct(wall[s], 0.5), "wall_p95_ms": _pct(wall[s], 0.95)}
+                      for s in steps}}
+
+
+# ──────────────────────────────────────────────────────────────
+# 4. CLI
+# ──────────────────────────────────────────────────────────────
+def _seed(log: Path, n: int, rnd: random.Random) -> None:
+    from flap_selector.engine import decide
+    from flap_selector.logstore import open_store
+    rows = []
+    for _ in range(n):
+        c = random_case(rnd)
+        rec = decide(c["loc"], c["kind"], c["cm"], c["depth"], c["hair"], c["age"],
+                     c["dia"], c["smk"], c["rad"])
+        rows.append({"timestamp_utc": "2026-01-01T00:00:00", "loc": c["loc"], "kind": c["kind"],
+                     "depth": c["depth"].split()[0], "cm": c["cm"], "hair": c["hair"],
+                     "age": c["age"], "dia": c["dia"], "smk": c["smk"], "rad": c["rad"],
+                     "recommended_flap": rec.flap, "rule_id": rec.rule_id,
+                     "used_recommended": c["used"], "final_comments_rationale": "seed"})
+    store = open_store(log)
+    for i in range(0, len(rows), 10_000):
+        store.append_many(rows[i:i + 10_000])
+    store.close()
+
+
+def worker(sessions_file: Path, timeout: float) -> None:
+    """Child process: run the sessions in *sessions_file*, print results as JSON."""
+    sys.path.insert(0, str(ROOT))
+    out = []
+    for token, case in json.loads(Path(sessions_file).read_text()).items():
+        start = time.time()
+        times = run_session(token, case, timeout)
+        out.append({"token": token, "start": start, "end": time.time(), **times})
+    print(json.dumps(out))
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="concurrent AppTest sessions against app.py")
+    p.add_argument("--sessions", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=16, help="worker processes in flight")
+    p.add_argument("--store", choices=["csv", "sqlite"], default="csv")
+    p.add_argument("--seed-rows", type=int, default=0, help="pre-fill the log with N rows")
+    p.add_argument("--timeout", type=float, default=120.0, help="per script run, seconds")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", type=Path, help="results JSON (default bench/results/load-<time>.json)")
+    p.add_argument("--cpu", action="store_true",
+                   help="server CPU per interaction against a real `streamlit run`")
+    p.add_argument("--app", type=Path, default=ROOT / "app.py", help="page to drive (--cpu)")
+    p.add_argument("--list", type=int, default=0, metavar="N",
+                   help="--cpu: enter N-case OR lists instead of single cases")
+    p.add_argument("--worker", type=Path, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    if args.worker:
+        worker(args.worker, args.timeout)
+        return 0
+
+    data_dir = Path(tempfile.mkdtemp(prefix="flap-load-"))
+    log = data_dir / ("usage_log.db" if args.store == "sqlite" else "usage_log.csv")
+    os.environ.update(FLAP_DATA_DIR=str(data_dir), FLAP_LOG_STORE=str(log))
+    sys.path.insert(0, str(ROOT))
+    (data_dir / ".streamlit").mkdir()              # app.py reads secrets from the cwd
+    (data_dir / ".streamlit" / "secrets.toml").write_text('ADMIN_PASS = "load-test"\n')
+
+    rnd = random.Random(args.seed)
+    if args.seed_rows or args.cpu:                 # --cpu: the admin box only shows once a log exists
+        _seed(log, args.seed_rows or 1, rnd)
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    if args.cpu:
+        return _main_cpu(args, data_dir, run_id)
+    cases = {f"load-{run_id}-{i:05d}": random_case(rnd) for i in range(args.sessions)}
+
+    slots = max(min(args.concurrency, args.sessions), 1)
+    print(f"{args.sessions} sessions over {slots} worker processes, {args.store} log in {data_dir}")
+    procs = []
+    for w in range(slots):
+        share = dict(list(cases.items())[w::slots])
+        path = data_dir / f"sessions-{w}.json"
+        path.write_text(json.dumps(share))
+        procs.append(subprocess.Popen(
+            [sys.executable, __file__, "--worker", str(path), "--timeout", str(args.timeout)],
+            cwd=data_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True))
+    results, crashed = {}, 0
+    for proc in procs:
+        stdout, _ = proc.communicate()
+        try:
+            results.update((r["token"], r) for r in json.loads(stdout.strip().splitlines()[-1]))
+        except (IndexError, ValueError):
+            crashed += 1
+
+    submitted = {t: cases[t] for t, r in results.items() if "feedback" in r}
+    check = check_log(log, submitted, args.seed_rows)
+    wall = (max((r["end"] for r in results.values()), default=0)
+            - min((r["start"] for r in results.values()), default=0)) or float("nan")
+
+    steps = {}
+    for step in STEPS:
+        lat = [r[step] for r in results.values() if step in r]
+        steps[step] = {"n": len(lat), "p50_ms": _pct(lat, 0.5), "p95_ms": _pct(lat, 0.95),
+                       "p99_ms": _pct(lat, 0.99), "max_ms": max(lat, default=0) * 1000}
+    errors = [r["error"] for r in results.values() if "error" in r]
+    errors += ["worker crashed"] * crashed
+    result = {"at": run_id, "sessions": args.sessions, "concurrency": slots,
+              "store": args.store, "seed_rows": args.seed_rows, "wall_s": wall,
+              "sessions_per_s": len(submitted) / wall,
+              "script_runs_per_s": sum(s["n"] for s in steps.values()) / wall,
+              "steps": steps, "errors": errors[:20], "error_count": len(errors), "log": check}
+    out = args.out or RESULTS / f"load-{run_id}.json"
+    out.parent.mkdir(exist_ok=True, parents=True)
+    out.write_text(json.dumps(result, indent=1) + "\n")
+
+    print(f"{'step':<10}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, s in steps.items():
+        print(f"{step:<10}{s['n']:>6}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+              f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    print(f"throughput: {result['sessions_per_s']:.1f} sessions/s, "
+          f"{result['script_runs_per_s']:.1f} script runs/s over {wall:.1f} s")
+    print(f"errors    : {len(errors)}" + (f" (first: {errors[0]})" if errors else ""))
+    print(f"log       : {check['rows']} rows; lost {len(check['lost'])}, duplicated "
+          f"{len(check['duplicated'])}, mismatched {len(check['mismatched'])}, "
+          f"malformed {len(check['malformed'])}, unexpected {check['unexpected']}")
+    print(f"written   : {out}")
+    bad = errors or check["lost"] or check["duplicated"] or check["mismatched"] \
+        or check["malformed"] or check["unexpected"]
+    return 1 if bad else 0
+
+
+
+def _main_cpu(args, data_dir: Path, run_id: str) -> int:
+    print(f"{args.sessions} sessions, one at a time, against {args.app} ({args.store} log)"
+          + (f", {args.list}-case OR lists" if args.list else ""))
+    expected: dict[str, dict] = {}
+    result = {"at": run_id, "store": args.store, "seed_rows": args.seed_rows,
+              **run_cpu(args, data_dir, args.app.resolve(), expected)}
+    if args.list:
+        log = Path(os.environ["FLAP_LOG_STORE"])
+        time.sleep(1.0)                            # the server's writer flushes every 0.2 s
+        result["log"] = check_log(log, expected, max(args.seed_rows, 1))
+    out = args.out or RESULTS / f"cpu-{run_id}.json"
+    out.parent.mkdir(exist_ok=True, parents=True)
+    out.write_text(json.dumps(result, indent=1) + "\n")
+    print(f"{'step':<16}{'n':>6}{'CPU ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for step, s in result["steps"].items():
+        print(f"{step:<16}{s['n']:>6}{s['cpu_ms']:>10.2f}{s['wall_p50_ms']:>10.1f}"
+              f"{s['wall_p95_ms']:>10.1f}")
+    print(f"script runs: {result['script_runs']} (fragment reruns included); floor "
+          f"{result['floor_cpu_ms']:.1f} ms CPU per run of a one-button page")
+    per_case = result["per_case"]
+    print(f"per case   : {per_case['script_runs']:.2f} script runs, {per_case['cpu_ms']:.1f} ms CPU "
+          f"(entry → feedback → next case)")
+    check = result.get("log")
+    if check:
+        print(f"log        : {check['rows']} rows; lost {len(check['lost'])}, duplicated "
+              f"{len(check['duplicated'])}, mismatched {len(check['mismatched'])}, "
+              f"malformed {len(check['malformed'])}, unexpected {check['unexpected']}")
+    print(f"written    : {out}")
+    return 1 if check and (check["lost"] or check["duplicated"] or check["mismatched"]
+                           or check["malformed"] or check["unexpected"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
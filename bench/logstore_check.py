@@ -0,0 +1,101 @@
+# bench/logstore_check.py  –  CSV header upgrade: crash-safe, nothing lost under load
+# -----------------------------------------------------------------
+#   python bench/logstore_check.py         # exits 1 on any lost / duplicated row
+#
+# A log written before LOG_COLUMNS grew is upgraded by the first append
+# that sees its old header.  Two cases:
+#   • the disk fills while the upgraded copy is being written (os.fsync
+#     raises ENOSPC): the append fails, the original log must be untouched
+#     and the next append must upgrade it and keep every row;
+#   • several processes append to an old-header log at once, so most of
+#     them wait on the lock of the file the first one replaces: every row
+#     must land in the upgraded file exactly once.
+import csv
+import errno
+import multiprocessing
+import os
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector.logstore import LOG_COLUMNS, CsvLogStore  # noqa: E402
+
+OLD_COLUMNS = LOG_COLUMNS[:16]              # a header from before the later columns
+
+
+def write_old(path: Path, n: int) -> None:
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=OLD_COLUMNS, extrasaction="ignore")
+        w.writeheader()
+        w.writerows({"timestamp_utc": "2025-06-01T00:00:00", "loc": "Scalp",
+                     "alt_flap_if_no": f"old {i}"} for i in range(n))
+
+
+def tokens(path: Path) -> tuple[list[str], Counter]:
+    with path.open(newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        return reader.fieldnames, Counter(r["alt_flap_if_no"] for r in reader)
+
+
+def check_full_disk(tmp: Path, n: int) -> bool:
+    log = tmp / "full.csv"
+    write_old(log, n)
+    before = log.read_bytes()
+    store = CsvLogStore(log)
+    real_fsync = os.fsync
+
+    def full(fd):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    failed = False
+    with mock.patch("os.fsync", full):
+        try:
+            store.append_many([{"alt_flap_if_no": "new 0"}])
+        except OSError:
+            failed = True
+    assert os.fsync is real_fsync
+    intact = log.read_bytes() == before and not list(tmp.glob("*.tmp"))
+    store.append_many([{"alt_flap_if_no": "new 1"}])
+    header, seen = tokens(log)
+    ok = (failed and intact and header[:len(LOG_COLUMNS)] == LOG_COLUMNS
+          and set(seen) == {f"old {i}" for i in range(n)} | {"new 1"}
+          and max(seen.values()) == 1)
+    print(f"full    : append failed={failed}, original intact={intact}, "
+          f"then upgraded with {sum(seen.values()):,} rows")
+    return ok
+
+
+def _append(args) -> None:
+    path, w, rows = args
+    store = CsvLogStore(Path(path))
+    for i in range(rows):
+        store.append_many([{"alt_flap_if_no": f"w{w} {i}"}])
+
+
+def check_concurrent(tmp: Path, n: int, workers: int = 6, rows: int = 200) -> bool:
+    log = tmp / "busy.csv"
+    write_old(log, n)
+    with multiprocessing.Pool(workers) as pool:
+        pool.map(_append, [(str(log), w, rows) for w in range(workers)])
+    header, seen = tokens(log)
+    want = {f"old {i}" for i in range(n)} | {f"w{w} {i}" for w in range(workers)
+                                               for i in range(rows)}
+    lost, dup = len(want - set(seen)), sum(c > 1 for c in seen.values())
+    print(f"busy    : {workers} processes × {rows} appends during the upgrade; "
+          f"{lost} lost, {dup} duplicated")
+    return header[:len(LOG_COLUMNS)] == LOG_COLUMNS and not lost and not dup
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = check_full_disk(Path(tmp), 20_000) & check_concurrent(Path(tmp), 20_000)
+    print(f"check   : {'every row kept exactly once' if ok else 'FAILED'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# bench/logview_bench.py  –  sidebar row count: full re-read vs LogView
+# -----------------------------------------------------------------
+#   python bench/logview_bench.py                   # 200k-row CSV log
+#   python bench/logview_bench.py --rows 1000000 --store sqlite
+#
+# Builds a synthetic log in a temp directory, then times what one rerun
+# pays for "Logged cases: N" – store.count() (reads the whole log) against
+# LogView.count() with 0 and 1 freshly appended rows – and the typed
+# frame's memory per row.  Counts must agree.  For a CSV log it then
+# compacts all but the current month into the Parquet archive and checks
+# the view still counts every row and yields the same per-rule feedback,
+# that a tail rewritten with the same number of rows is not served from
+# the cached frame, and (in a fresh interpreter) that count() over more
+# than CHUNK_ROWS new rows never imports pandas.
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector.compact import compact  # noqa: E402
+from flap_selector.engine import DEPTH_OPTS, current_rules  # noqa: E402
+from flap_selector.logstore import open_store  # noqa: E402
+from flap_selector.logview import CHUNK_ROWS, LogView  # noqa: E402
+from flap_selector.telemetry import feedback_by_rule  # noqa: E402
+
+NOW = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def rows(n: int, rnd: random.Random, ts: str = NOW):
+    rules = current_rules()
+    for _ in range(n):
+        yield {"timestamp_utc": ts, "loc": rnd.choice(rules.subunits),
+               "kind": "Oncologic", "depth": rnd.choice(DEPTH_OPTS).split()[0],
+               "cm": round(rnd.uniform(0.1, 6), 1), "age": rnd.randint(18, 90),
+               "hair": rnd.random() < 0.3, "recommended_flap": "Bilobed flap",
+               "used_recommended": rnd.random() < 0.8, "pgy_levels": "PGY-3",
+               "algorithm_assist_recon_planning_q2": "Agree",
+               "rule_id": rnd.choice(["r1", "r2", "r3"]), "rules_version": rules.version}
+
+
+def best_ms(fn, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1e3
+
+
+def check_compaction(n: int, rnd: random.Random) -> bool:
+    """Count and per-rule feedback before == after compacting most of the log away."""
+    version = current_rules().version
+    with tempfile.TemporaryDirectory() as tmp:
+        log, archive = Path(tmp) / "usage_log.csv", Path(tmp) / "archive"
+        store = open_store(log)
+        store.append_many(list(rows(n, rnd, "2026-01-15T09:00:00")))
+        store.append_many(list(rows(n // 10, rnd)))
+        view = LogView(store, archive=archive)
+        before = (view.count(), feedback_by_rule(view.frame(), version))
+        compact(log, archive, keep_months=1)
+        after = (view.count(), feedback_by_rule(view.frame(), version))
+        store.append_many(list(rows(1, rnd)))
+        grown = view.count()
+        store.close()
+    ok = before == after and before[0] == n + n // 10 and grown == before[0] + 1
+    print(f"compaction   : {before[0]:,} rows before, {after[0]:,} after "
+          f"({n:,} archived); feedback by rule {'same' if before[1] == after[1] else 'DIFFERS'}")
+    return ok
+
+
+def check_reset(n: int, rnd: random.Random) -> bool:
+    """A tail replaced by one of the same length must not come back from the cache."""
+    with tempfile.TemporaryDirectory() as tmp:
+        log, archive = Path(tmp) / "usage_log.csv", Path(tmp) / "archive"
+        store = open_store(log)
+        store.append_many(list(rows(n, rnd, "2026-01-15T09:00:00")))
+        store.append_many([{**r, "rule_id": "old"} for r in rows(n // 10, rnd)])
+        compact(log, archive, keep_months=1)
+        view = LogView(store, archive=archive)
+        view.frame()
+        other = open_store(Path(tmp) / "rewritten.csv")
+        other.append_many([{**r, "rule_id": "new"} for r in rows(n // 10, rnd)])
+        os.replace(other.path, log)
+        tail_ids = set(view.frame()["rule_id"].iloc[n:].astype(str))
+        store.close()
+    print(f"reset        : tail rewritten with the same row count -> rule ids {sorted(tail_ids)}")
+    return tail_ids == {"new"}
+
+
+def check_count_without_pandas(rnd: random.Random) -> bool:
+    """count() over more than CHUNK_ROWS fresh rows, in an interpreter without pandas loaded."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = open_store(Path(tmp) / "usage_log.csv")
+        n = CHUNK_ROWS + CHUNK_ROWS // 5
+        store.append_many(list(rows(n, rnd)))
+        store.close()
+        code = ("import sys; from flap_selector.logstore import open_store; "
+                "from flap_selector.logview import LogView; "
+                f"view = LogView(open_store({str(store.path)!r}), archive={tmp!r}); "
+                "print(view.count(), 'pandas' in sys.modules)")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=Path(__file__).resolve().parents[1], check=True).stdout.split()
+    print(f"no pandas    : count() = {int(out[0]):,} rows, pandas imported: {out[1]}")
+    return out == [str(n), "False"]
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="LogView benchmark")
+    p.add_argument("--rows", type=int, default=200_000)
+    p.add_argument("--store", choices=("csv", "sqlite"), default="csv")
+    args = p.parse_args(argv)
+    rnd = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = open_store(Path(tmp) / f"usage_log.{'db' if args.store == 'sqlite' else 'csv'}")
+        for start in range(0, args.rows, 50_000):
+            store.append_many(list(rows(min(50_000, args.rows - start), rnd)))
+        view = LogView(store)
+        t0 = time.perf_counter()
+        view.count()
+        first = time.perf_counter() - t0
+
+        full = best_ms(store.count)
+        idle = best_ms(view.count)
+        appended = []
+        for r in rows(20, rnd):
+            store.append_many([r])
+            t0 = time.perf_counter()
+            view.count()
+            appended.append(time.perf_counter() - t0)
+        frame = view.frame()
+        ok = view.count() == store.count() == len(frame)
+        store.close()
+
+    print(f"log          : {args.rows:,} rows ({args.store})")
+    print(f"store.count(): {full:.1f} ms per rerun")
+    print(f"LogView      : first load {first:.2f} s, then {idle * 1e3:.0f} µs idle, "
+          f"{min(appended) * 1e3:.2f} ms after a 1-row append")
+    print(f"typed frame  : {frame.memory_usage(deep=True).sum() / len(frame):.0f} B/row")
+    if args.store == "csv":
+        ok &= check_compaction(min(args.rows, 50_000), rnd)
+        ok &= check_reset(min(args.rows, 50_000), rnd)
+    ok &= check_count_without_pandas(rnd)
+    print(f"check        : counts {'agree' if ok else 'DIFFER'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
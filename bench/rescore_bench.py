@@ -0,0 +1,82 @@
+# bench/rescore_bench.py  –  rescore() timing and a full-replay cross-check
+# -----------------------------------------------------------------
+#   python bench/rescore_bench.py                    # 1M synthetic logged cases
+#   python bench/rescore_bench.py --rows 5000000 --workers 8
+#
+# Edits a copy of the live rules the way a maintainer would (one sub-unit's
+# THR nudged, one rule's flap renamed), then compares rescore() against
+# replaying every row through decide_batch() under both rule sets: the
+# changed rows must be exactly the rows whose flap differs.
+import argparse
+import copy
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector.batch import decide_batch  # noqa: E402
+from flap_selector.engine import DEPTH_OPTS, RULES_PATH, current_rules, load_rules  # noqa: E402
+from flap_selector.rescore import rescore  # noqa: E402
+
+
+def edited_rules(tmp: Path):
+    data = json.loads(Path(RULES_PATH).read_text(encoding="utf-8"))
+    new = copy.deepcopy(data)
+    new["version"] += "-edit"
+    new["subunits"][0]["thr"][0] += 0.5
+    new["rules"][5]["flap"] += " (revised)"
+    path = tmp / "rules.json"
+    path.write_text(json.dumps(new, ensure_ascii=False), encoding="utf-8")
+    return load_rules(path)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="rescore benchmark")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--workers", type=int, default=None)
+    args = p.parse_args(argv)
+    rng = np.random.default_rng(0)
+    old = current_rules()
+    n = args.rows
+    df = pd.DataFrame({
+        "loc": rng.choice(old.subunits, n),
+        "depth": rng.choice([d.split()[0] for d in DEPTH_OPTS], n),
+        "cm": np.round(rng.gamma(2.0, 1.2, n), 1) + 0.1,
+        "hair": rng.choice(["True", "False"], n, p=[0.3, 0.7]),
+    })
+    df["recommended_flap"] = decide_batch(df.assign(
+        kind="Oncologic", age=50, dia=False, smk=False, rad=False,
+        hair=df["hair"].eq("True")))["flap"].astype(str)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        new = edited_rules(Path(tmp))
+    t0 = time.perf_counter()
+    report, changed = rescore(df, new, old, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    cases = df.assign(kind="Oncologic", age=50, dia=False, smk=False, rad=False,
+                      hair=df["hair"].eq("True"))
+    before = decide_batch(cases, rules=old)["flap"].astype(str)
+    after = decide_batch(cases, rules=new)["flap"].astype(str)
+    replay = time.perf_counter() - t0
+    expected = df.index[before.ne(after)]
+    ok = changed.index.sort_values().equals(expected) and \
+        (changed["new_flap"] == after[changed.index]).all()
+
+    print(f"log     : {n:,} cases, {old.version} -> {new.version}")
+    print(f"rescore : {elapsed:.2f} s, {report['changed_keys'].sum():,} changed keys in "
+          f"{(report['keys'] > 0).sum()} sub-units, {len(changed):,} cases change")
+    print(f"replay  : {replay:.2f} s (decide_batch under both rule sets)")
+    print(f"check   : {'matches' if ok else 'DIFFERS from'} full replay")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# bench/ship_check.py  –  log shipping: nothing lost, nothing shipped twice
+# -----------------------------------------------------------------
+#   python bench/ship_check.py                      # exits 1 on any lost / duplicated row
+#   python bench/ship_check.py --rows 200000
+#
+# Ships a synthetic CSV log to a DirTarget (the S3 code path minus boto3)
+# through the awkward cases – a crash between sealing and uploading, an
+# endpoint that fails for a while, compaction of rows that were not
+# shipped yet, a restart from the checkpoint – then reads every uploaded
+# segment and Parquet part back and checks each row arrived exactly once
+# (archive parts may repeat rows already shipped as segments).  The same
+# for a SQLite log, without the compaction step.  Then a redeploy that
+# starts over with an empty data dir must not overwrite what the first
+# deploy shipped, and several processes shipping one log at once (app
+# thread + cron) must still send each row exactly once.
+import argparse
+import gzip
+import io
+import multiprocessing
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector.compact import compact  # noqa: E402
+from flap_selector.engine import DEPTH_OPTS, current_rules  # noqa: E402
+from flap_selector.logstore import open_store  # noqa: E402
+from flap_selector.shipper import DirTarget, LogShipper  # noqa: E402
+
+NOW = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+class FlakyTarget(DirTarget):
+    """Fails the next *fail* puts, then behaves."""
+
+    def __init__(self, root: Path, fail: int = 0):
+        super().__init__(root)
+        self.fail = fail
+
+    def put(self, key, body, content_type):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("endpoint unavailable")
+        super().put(key, body, content_type)
+
+
+def rows(ids: range, ts: str, rnd: random.Random):
+    locs = current_rules().subunits
+    for i in ids:
+        yield {"timestamp_utc": ts, "loc": rnd.choice(locs), "kind": "Oncologic",
+               "depth": rnd.choice(DEPTH_OPTS).split()[0], "cm": round(rnd.uniform(0.1, 6), 1),
+               "age": rnd.randint(18, 90), "hair": rnd.random() < 0.3,
+               "recommended_flap": "Bilobed flap", "used_recommended": False,
+               "alt_flap_if_no": f"case {i}\nwith a quoted, multi-line note"}
+
+
+def received(root: Path, source: str) -> tuple[Counter, Counter]:
+    """(row ids in log segments, row ids in archive parts) found under *root*."""
+    segs, parts = Counter(), Counter()
+    for path in sorted((root / "log" / source).glob("*.csv.gz")):
+        df = pd.read_csv(io.BytesIO(gzip.decompress(path.read_bytes())), dtype=str,
+                         keep_default_na=False)
+        segs.update(df["alt_flap_if_no"])
+    for path in (root / "archive" / source).rglob("*.parquet"):
+        parts.update(pd.read_parquet(path, columns=["alt_flap_if_no"])["alt_flap_if_no"])
+    return segs, parts
+
+
+def ids(n0: int, n1: int) -> set:
+    return {f"case {i}\nwith a quoted, multi-line note" for i in range(n0, n1)}
+
+
+def check_csv(n: int, rnd: random.Random) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        log, archive, bucket = tmp / "usage_log.csv", tmp / "archive", tmp / "bucket"
+        store = open_store(log)
+        kw = dict(source="test", checkpoint=tmp / "ckpt.json", outbox=tmp / "outbox",
+                  segment_bytes=256 << 10)
+        q = n // 4
+
+        store.append_many(list(rows(range(0, q), "2026-01-15T09:00:00", rnd)))
+        t0 = time.perf_counter()
+        stats = LogShipper(DirTarget(bucket), log, archive, **kw).run_once(force=True)
+        took = time.perf_counter() - t0
+        print(f"csv     : {q:,} rows in {stats['segments']} segments, {took * 1e3:.0f} ms, "
+              f"{stats['bytes_in'] / max(stats['bytes_out'], 1):.1f}× smaller gzipped")
+
+        # crash after sealing, before uploading; the restart sends the spool
+        store.append_many(list(rows(range(q, 2 * q), "2026-01-20T09:00:00", rnd)))
+        LogShipper(DirTarget(bucket), log, archive, **kw).seal(force=True)
+        # endpoint down for a while: the round fails, segments stay spooled
+        flaky = LogShipper(FlakyTarget(bucket, fail=3), log, archive, **kw)
+        try:
+            flaky.run_once(force=True)
+        except ConnectionError:
+            pass
+        flaky.run_once(force=True)
+
+        # rows appended, then compacted before anyone shipped them
+        store.append_many(list(rows(range(2 * q, 3 * q), "2026-02-03T09:00:00", rnd)))
+        store.append_many(list(rows(range(3 * q, 3 * q + 10), NOW, rnd)))
+        compact(log, archive, keep_months=1)
+        store.append_many(list(rows(range(3 * q + 10, n), NOW, rnd)))
+        shipper = LogShipper(DirTarget(bucket), log, archive, **kw)
+        shipper.run_once(force=True)
+        shipper.run_once(force=True)                         # idle round: ships nothing
+        store.close()
+
+        segs, parts = received(bucket, "test")
+        want = ids(0, n)
+        got = set(segs) | set(parts)
+        dup = sum(c > 1 for c in segs.values())
+        ok = got == want and not dup and not list((tmp / "outbox").iterdir())
+        print(f"          {len(segs):,} rows as segments, {len(parts):,} in archive parts, "
+              f"{len(want - got):,} lost, {dup:,} duplicated segment rows")
+        return ok
+
+
+def check_sqlite(n: int, rnd: random.Random) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        log, bucket = tmp / "usage_log.db", tmp / "bucket"
+        store = open_store(log)
+        kw = dict(source="test", checkpoint=tmp / "ckpt.json", outbox=tmp / "outbox",
+                  segment_bytes=256 << 10)
+        store.append_many(list(rows(range(0, n // 2), NOW, rnd)))
+        LogShipper(DirTarget(bucket), log, tmp / "archive", **kw).run_once(force=True)
+        store.append_many(list(rows(range(n // 2, n), NOW, rnd)))
+        LogShipper(DirTarget(bucket), log, tmp / "archive", **kw).seal(force=True)
+        stats = LogShipper(DirTarget(bucket), log, tmp / "archive", **kw).run_once(force=True)
+        store.close()
+        segs, _ = received(bucket, "test")
+        dup = sum(c > 1 for c in segs.values())
+        ok = set(segs) == ids(0, n) and not dup
+        print(f"sqlite  : {len(segs):,} of {n:,} rows shipped ({stats['uploaded']} segments "
+              f"after the restart), {dup:,} duplicated")
+        return ok
+
+
+def check_redeploy(n: int, rnd: random.Random) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        data, bucket = tmp / "data", tmp / "bucket"
+        for lo, hi in ((0, n // 2), (n // 2, n)):        # the second deploy finds .data empty
+            shutil.rmtree(data, ignore_errors=True)
+            data.mkdir()
+            store = open_store(data / "usage_log.csv")
+            store.append_many(list(rows(range(lo, hi), NOW, rnd)))
+            LogShipper(DirTarget(bucket), store.path, data / "archive", source="test",
+                       checkpoint=data / "ckpt.json", outbox=data / "outbox",
+                       segment_bytes=256 << 10).run_once(force=True)
+            store.close()
+        segs, _ = received(bucket, "test")
+        dup = sum(c > 1 for c in segs.values())
+        print(f"redeploy: {len(segs):,} of {n:,} rows in the bucket after two fresh deploys, "
+              f"{dup:,} duplicated")
+        return set(segs) == ids(0, n) and not dup
+
+
+def _ship_rounds(args) -> None:
+    tmp, rounds = args
+    shipper = LogShipper(DirTarget(tmp / "bucket"), tmp / "usage_log.csv", tmp / "archive",
+                         source="test", checkpoint=tmp / "ckpt.json", outbox=tmp / "outbox",
+                         segment_bytes=64 << 10)
+    for _ in range(rounds):
+        shipper.run_once(force=True, threads=1)
+
+
+def check_concurrent(n: int, rnd: random.Random, workers: int = 4) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        store = open_store(tmp / "usage_log.csv")
+        batches = [list(rows(range(i, min(i + 500, n)), NOW, rnd)) for i in range(0, n, 500)]
+        with multiprocessing.Pool(workers) as pool:
+            shipping = pool.map_async(_ship_rounds, [(tmp, 30)] * workers)
+            for batch in batches:
+                store.append_many(batch)
+                time.sleep(0.002)
+            shipping.get()
+        _ship_rounds((tmp, 1))
+        store.close()
+        segs, _ = received(tmp / "bucket", "test")
+        dup = sum(c > 1 for c in segs.values())
+        print(f"parallel: {workers} shipper processes, {len(segs):,} of {n:,} rows shipped, "
+              f"{dup:,} duplicated")
+        return set(segs) == ids(0, n) and not dup
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="log shipping check")
+    p.add_argument("--rows", type=int, default=40_000)
+    args = p.parse_args(argv)
+    rnd = random.Random(0)
+    ok = (check_csv(args.rows, rnd) & check_sqlite(args.rows, rnd)
+          & check_redeploy(args.rows, rnd) & check_concurrent(args.rows, rnd))
+    print(f"check   : {'every row shipped exactly once' if ok else 'FAILED'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# bench/similar_bench.py  –  CaseIndex build / insert / query timings
+# -----------------------------------------------------------------
+#   python bench/similar_bench.py                 # 2M synthetic logged cases
+#   python bench/similar_bench.py --rows 5000000 --queries 20000
+#
+# Synthetic rows are drawn like the form's inputs (cm on the 0.1 step, whole
+# years, ~30 % hair, a few % per risk flag).  A sample of queries is checked
+# against a brute-force scan of the same partition: the k distances must match.
+# Last, an index is attached to a live UsageLogWriter (as app.py does) while
+# another thread keeps submitting rows: it must end up holding each stored
+# row exactly once.
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector.engine import DEPTH_OPTS, _depth_class, current_rules  # noqa: E402
+from flap_selector.similar import FLAGS, CaseIndex  # noqa: E402
+from flap_selector.usagelog import UsageLogWriter  # noqa: E402
+
+DEPTHS = [d.split()[0] for d in DEPTH_OPTS]
+
+
+def rows(n: int, rnd: random.Random):
+    locs = current_rules().subunits
+    for _ in range(n):
+        used = rnd.random() < 0.8
+        yield {"loc": rnd.choice(locs), "depth": rnd.choice(DEPTHS),
+               "cm": round(min(rnd.gammavariate(2.0, 0.8) + 0.1, 25.0), 1),
+               "age": rnd.randint(0, 99), "hair": rnd.random() < 0.3,
+               "dia": rnd.random() < 0.1, "smk": rnd.random() < 0.15, "rad": rnd.random() < 0.05,
+               "used_recommended": used, "recommended_flap": "Bilobed flap",
+               "alt_flap_if_no": "" if used else rnd.choice(["Primary closure", "FTSG", "Other"])}
+
+
+def brute(data: list[dict], index: CaseIndex, q: dict, k: int) -> list[float]:
+    d = []
+    for r in data:
+        if r["loc"] != q["loc"] or _depth_class(r["depth"]) != _depth_class(q["depth"]):
+            continue
+        mism = sum(bool(r[f]) != bool(q[f]) for f in FLAGS)
+        d.append(abs(round(r["cm"] * 10) - round(q["cm"] * 10)) / (10 * index.cm_scale)
+                 + abs(r["age"] - q["age"]) / index.age_scale + index.flag_weight * mism)
+    return [round(x, 3) for x in sorted(d)[:k]]
+
+
+def check_attach(rnd: random.Random, n: int = 20_000) -> bool:
+    """Index attached mid-stream via add_listener(backfill=…): no row missed or doubled."""
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = UsageLogWriter(Path(tmp) / "usage_log.csv", batch_size=50, flush_interval=0.01)
+        data = list(rows(n, rnd))
+        writer.submit_many(data[:n // 4])
+        writer.flush()
+
+        def feed():                                       # ~0.5 s of steady small batches
+            for i in range(n // 4, n, 25):
+                writer.submit_many(data[i:i + 25])
+                time.sleep(0.001)
+
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+        time.sleep(0.05)                                  # attach while batches are landing
+        index = CaseIndex()
+        writer.add_listener(index, backfill=lambda: index.add_many(writer.store.iter_rows()))
+        feeder.join()
+        writer.close()
+        stored = writer.store.count()
+    ok = len(index) + index.skipped == stored == n
+    print(f"attach  : {len(index):,} indexed of {stored:,} stored while writing "
+          f"({'each once' if ok else 'MISMATCH'})")
+    return ok
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="CaseIndex benchmark")
+    p.add_argument("--rows", type=int, default=2_000_000)
+    p.add_argument("--queries", type=int, default=10_000)
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--check", type=int, default=50, help="queries verified by brute force")
+    args = p.parse_args(argv)
+    rnd = random.Random(0)
+
+    index = CaseIndex()
+    build = 0.0
+    for start in range(0, args.rows, 100_000):          # bulk load in chunks, as from iter_rows()
+        chunk = list(rows(min(100_000, args.rows - start), rnd))
+        t0 = time.perf_counter()
+        index.add_many(chunk)
+        build += time.perf_counter() - t0
+
+    fresh = list(rows(5_000, rnd))
+    t0 = time.perf_counter()
+    for r in fresh:
+        index.add_many([r])                              # one listener call per row: worst case
+    insert_us = (time.perf_counter() - t0) / len(fresh) * 1e6
+
+    queries = list(rows(args.queries, rnd))
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter_ns()
+        index.similar(q["loc"], q["depth"], q["cm"], q["age"], q["hair"], q["dia"],
+                      q["smk"], q["rad"], k=args.k)
+        lat.append(time.perf_counter_ns() - t0)
+    lat.sort()
+    pct = lambda f: lat[min(int(f * len(lat)), len(lat) - 1)] / 1e3
+
+    bad = 0
+    if args.check:
+        data = list(rows(20_000, random.Random(1)))
+        small = CaseIndex()
+        small.add_many(data)
+        for q in queries[:args.check]:
+            got = [r["distance"] for r in small.similar(
+                q["loc"], q["depth"], q["cm"], q["age"], q["hair"], q["dia"], q["smk"], q["rad"],
+                k=args.k)]
+            bad += got != brute(data, small, q, args.k)
+
+    stats = index.stats()
+    print(f"index   : {len(index):,} rows, {stats['buckets']:,} buckets, built in "
+          f"{build:.1f} s, {stats['bytes'] / len(index):.0f} B/row in arrays")
+    print(f"insert  : {insert_us:.1f} µs per single-row batch")
+    print(f"query   : p50 {pct(0.5):.0f} µs, p99 {pct(0.99):.0f} µs, max {lat[-1] / 1e3:.0f} µs "
+          f"(k={args.k}, {len(lat):,} queries)")
+    print(f"check   : {args.check - bad}/{args.check} match brute force")
+    attached = check_attach(rnd)
+    return 1 if bad or not attached else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
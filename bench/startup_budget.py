@@ -0,0 +1,69 @@
+# bench/startup_budget.py  –  cold-start budget for the recommendation path
+# -----------------------------------------------------------------
+#   python bench/startup_budget.py            # exits 1 when over budget
+#
+# Collects every flap_selector module app.py imports at top level, imports
+# them in a fresh interpreter under `python -X importtime`, and checks that
+#   • none of the heavy analytics stacks got pulled in, and
+#   • their cumulative import time (best of N runs) stays under BUDGET_MS.
+# Streamlit itself is not counted – that cost is outside our control.
+import argparse
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BUDGET_MS = 80.0
+FORBIDDEN = ("pandas", "numpy", "pyarrow")
+
+
+def app_imports(app: Path = ROOT / "app.py") -> list[str]:
+    """flap_selector modules imported at the top level of app.py."""
+    mods = []
+    for node in ast.parse(app.read_text(encoding="utf-8")).body:
+        if isinstance(node, ast.ImportFrom) and (node.module or "").startswith("flap_selector"):
+            mods.append(node.module)
+        elif isinstance(node, ast.Import):
+            mods += [a.name for a in node.names if a.name.startswith("flap_selector")]
+    return list(dict.fromkeys(mods))
+
+
+def measure(mods: list[str]) -> tuple[float, list[str]]:
+    """(cumulative import ms, heavy modules loaded) in a fresh interpreter."""
+    code = (f"import sys; import {', '.join(mods)}; "
+            f"print(' '.join(m for m in {FORBIDDEN!r} if m in sys.modules))")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # top-level entries have a single leading space; nested ones are indented,
+        # and interpreter start-up (site, encodings…) is not ours to budget
+        if name[:1] == " " and name[1:].startswith("flap_selector"):
+            total_us += int(cumulative)
+    return total_us / 1000, proc.stdout.split()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    mods = app_imports()
+    runs = [measure(mods) for _ in range(args.runs)]
+    best = min(ms for ms, _ in runs)
+    heavy = sorted({m for _, loaded in runs for m in loaded})
+    print(f"modules : {', '.join(mods)}")
+    print(f"import  : {best:.1f} ms best of {args.runs} (budget {args.budget_ms:.0f} ms)")
+    print(f"heavy   : {', '.join(heavy) or 'none'}")
+    ok = best <= args.budget_ms and not heavy
+    print("OK" if ok else "OVER BUDGET")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
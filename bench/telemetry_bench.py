@@ -0,0 +1,91 @@
+# bench/telemetry_bench.py  –  cost of counting rule hits on the decide() path
+# -----------------------------------------------------------------
+#   python bench/telemetry_bench.py                 # 200k decisions, 8 threads
+#
+# Times DecisionTable.decide() with and without a RuleHits attached, then
+# has short-lived threads (one per "rerun", as Streamlit does) record hits
+# concurrently with the flusher and checks the file ends up with every hit.
+import argparse
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector.engine import DEPTH_OPTS, KINDS, current_rules  # noqa: E402
+from flap_selector.memo import DecisionTable  # noqa: E402
+from flap_selector.telemetry import RuleHits  # noqa: E402
+
+
+def cases(n: int, rnd: random.Random) -> list[tuple]:
+    locs = current_rules().subunits
+    return [(rnd.choice(locs), rnd.choice(KINDS), round(rnd.uniform(0.1, 8), 1),
+             rnd.choice(DEPTH_OPTS), rnd.random() < 0.3, rnd.randint(5, 95),
+             rnd.random() < 0.1, rnd.random() < 0.15, rnd.random() < 0.05) for _ in range(n)]
+
+
+def per_call_ns(table: DecisionTable, batch: list[tuple], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        for args in batch:
+            table.decide(*args)
+        best = min(best, (time.perf_counter_ns() - t0) / len(batch))
+    return best
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="rule-hit telemetry benchmark")
+    p.add_argument("--calls", type=int, default=200_000)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--reruns", type=int, default=200, help="short-lived threads per worker")
+    args = p.parse_args(argv)
+    batch = cases(args.calls, random.Random(0))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = DecisionTable()
+        hits = RuleHits(Path(tmp) / "rule_hits.json")
+        counted = DecisionTable(hits=hits)
+        plain.precompute()
+        counted.precompute()
+        base, with_hits = per_call_ns(plain, batch), per_call_ns(counted, batch)
+        record = float("inf")
+        for _ in range(5):
+            t0 = time.perf_counter_ns()
+            for _ in range(args.calls):
+                hits.record("nose.tip.full", "v")
+            record = min(record, (time.perf_counter_ns() - t0) / args.calls)
+        hits.close()
+
+        path = Path(tmp) / "threads.json"
+        hits = RuleHits(path, flush_interval=0.01)
+        per_thread = 50
+
+        def worker():
+            for _ in range(args.reruns):
+                t = threading.Thread(target=lambda: [hits.record("r", "v") for _ in range(per_thread)])
+                t.start()
+                t.join()
+
+        workers = [threading.Thread(target=worker) for _ in range(args.threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        hits.close()
+        want = args.threads * args.reruns * per_thread
+        got = json.loads(path.read_text())["hits"]["v"]["r"]
+
+    print(f"decide  : {base:.0f} ns plain, {with_hits:.0f} ns with hits "
+          f"(record() alone: {record:.0f} ns)")
+    print(f"threads : {args.threads} × {args.reruns} short-lived threads, "
+          f"{got:,} of {want:,} hits in the file")
+    return 0 if got == want else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# bench/vocab_check.py  –  free-text canonicalisation, before and after a rules reload
+# -----------------------------------------------------------------
+#   python bench/vocab_check.py            # exits 1 on any failure
+#
+# Checks every FLAP_SYNONYMS alias and CANCER_TYPES alias maps to its
+# canonical term, then hot-reloads a copy of rules.json with one flap
+# renamed (the engine's own mtime check, pointed at a temp file) and checks
+# that flap_vocabulary() / canonicalise_rows() – what the log writer thread
+# calls – match against the new rules, not the ones loaded first.  Last,
+# renormalise() rewrites a CSV log while another thread keeps appending:
+# every row must survive, with its canonical columns filled – and a
+# rewrite that fails (disk full) must leave the log and no temp file behind.
+import copy
+import errno
+import json
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from flap_selector import engine  # noqa: E402
+from flap_selector.logstore import open_store  # noqa: E402
+from flap_selector.vocab import (CANCER_TYPES, FLAP_SYNONYMS, canonicalise_rows,  # noqa: E402
+                                 cancer_vocabulary, flap_vocabulary, renormalise)
+
+NEW_FLAP = "Keystone perforator island flap"
+
+
+def check_aliases() -> list[str]:
+    problems = []
+    flaps, cancers = flap_vocabulary(), cancer_vocabulary()
+    live = {flap for _, flap, _ in engine.current_rules().cells.values()}
+    for alias, canonical in FLAP_SYNONYMS.items():
+        if canonical in live and flaps.match(alias) != canonical:
+            problems.append(f"flap {alias!r} -> {flaps.match(alias)!r}, want {canonical!r}")
+    for canonical, aliases in CANCER_TYPES.items():
+        for alias in [canonical, *aliases]:
+            if cancers.match(alias) != canonical:
+                problems.append(f"cancer {alias!r} -> {cancers.match(alias)!r}, want {canonical!r}")
+    return problems
+
+
+def check_reload() -> list[str]:
+    problems = []
+    before = flap_vocabulary()
+    if before.match(NEW_FLAP) == NEW_FLAP:
+        return [f"{NEW_FLAP!r} already known before the reload"]
+    data = json.loads(engine.RULES_PATH.read_text(encoding="utf-8"))
+    new = copy.deepcopy(data)
+    new["version"] += "-vocab-check"
+    new["rules"][0]["flap"] = NEW_FLAP
+    saved = engine.RULES_PATH, engine._rules, engine._rules_mtime
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "rules.json"
+        path.write_text(json.dumps(new, ensure_ascii=False), encoding="utf-8")
+        try:
+            engine.RULES_PATH, engine._next_check = path, 0.0
+            rules = engine.current_rules()                  # hot reload, as the app sees it
+            if rules.version != new["version"]:
+                return ["rules did not reload"]
+            after = flap_vocabulary()
+            row = canonicalise_rows([{"alt_flap_if_no": NEW_FLAP.lower()}])[0]
+            if after is before:
+                problems.append("flap_vocabulary() returned the pre-reload vocabulary")
+            if after.match(NEW_FLAP) != NEW_FLAP or row["alt_flap_canonical"] != NEW_FLAP:
+                problems.append(f"{NEW_FLAP!r} not matched after the reload")
+            if flap_vocabulary(saved[1]) is not before:
+                problems.append("vocabulary of the old rules was rebuilt, not cached")
+        finally:
+            engine.RULES_PATH, engine._rules, engine._rules_mtime = saved
+            engine._next_check = 0.0
+    if flap_vocabulary() is not before:
+        problems.append("flap_vocabulary() did not follow the rules back")
+    return problems
+
+
+def check_renormalise(n: int = 20_000) -> list[str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = open_store(Path(tmp) / "usage_log.csv")
+        store.append_many([{"alt_flap_if_no": f"abbe {i}", "cancer_type": "bcc"}
+                           for i in range(n)])
+        before = store.path.read_bytes()
+        with mock.patch("os.fsync", side_effect=OSError(errno.ENOSPC, "No space left")):
+            try:
+                renormalise(store)
+            except OSError:
+                pass
+        failed_cleanly = store.path.read_bytes() == before and not list(Path(tmp).glob("*.tmp"))
+
+        def append():
+            for i in range(200):
+                store.append_many([{"alt_flap_if_no": f"late {i}"}])
+
+        appender = threading.Thread(target=append)
+        appender.start()
+        res = renormalise(store)
+        appender.join()
+        rows = list(store.iter_rows())
+        leftovers = list(Path(tmp).glob("*.tmp"))
+    texts = [r["alt_flap_if_no"] for r in rows]
+    early = [r for r in rows if r["alt_flap_if_no"].startswith("abbe")]
+    print(f"renorm  : {res['rows']:,} rows rewritten, {len(rows):,} in the log afterwards")
+    problems = [] if failed_cleanly else ["a failed renormalise changed the log or left a temp file"]
+    if len(texts) != n + 200 or len(set(texts)) != len(texts):
+        problems.append(f"{len(rows)} rows after renormalise, want {n + 200} distinct")
+    if any(r["cancer_type_canonical"] != "Basal cell carcinoma" for r in early):
+        problems.append("canonical columns not filled by renormalise")
+    if leftovers:
+        problems.append(f"temp files left behind: {leftovers}")
+    return problems
+
+
+def main() -> int:
+    problems = check_aliases()
+    print(f"aliases : {len(FLAP_SYNONYMS)} flap, "
+          f"{sum(len(a) + 1 for a in CANCER_TYPES.values())} cancer-type aliases checked")
+    reload_problems = check_reload()
+    print(f"reload  : {'vocabulary follows the live rules' if not reload_problems else 'FAILED'}")
+    problems += reload_problems + check_renormalise()
+    for p in problems:
+        print(f"  {p}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+"""Head-&-Neck Local-Flap Selector – decision engine and offline tooling.
+
+The flap rules live in rules.json and are hot-reloaded (engine.current_rules()).
+Importing the package loads only the pure-Python engine; decide_batch()
+(NumPy / pandas) is imported on first use so the app's cold start stays light.
+"""
+from .engine import (DEPTH_OPTS, KINDS, SIZES, Recommendation, RuleError, RuleSet,
+                     current_rules, decide, load_rules)
+from .memo import DecisionTable
+
+__all__ = [
+    "DEPTH_OPTS", "KINDS", "SIZES", "SUBUNITS", "THR",
+    "DecisionTable", "Recommendation", "RuleError", "RuleSet",
+    "current_rules", "decide", "decide_batch", "load_rules",
+]
+
+
+def __getattr__(name):
+    if name in ("SUBUNITS", "THR"):      # from the live rules file, see engine.current_rules()
+        from . import engine
+        return getattr(engine, name)
+    if name == "decide_batch":
+        from .batch import decide_batch
+        return decide_batch
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
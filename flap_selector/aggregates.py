@@ -0,0 +1,188 @@
+# flap_selector/aggregates.py  –  running totals behind the admin dashboard
+# -----------------------------------------------------------------
+# For every (dimension, value) group – sub-unit, depth and PGY level, plus
+# an "all" group – we keep: row count, concordance (used_recommended),
+# the Q2 / Q3 Likert distributions and defect-size statistics (Welford
+# mean/variance and a 0.1 cm histogram for quantiles).  The writer thread
+# folds each appended batch in, so the dashboard reads a file whose size
+# depends on the number of groups, never on the number of logged rows.
+import json
+import math
+import os
+from collections import Counter
+from pathlib import Path
+
+from .logstore import file_lock
+from .usagelog import DATA_PATH
+
+AGG_PATH = DATA_PATH.parent / "usage_agg.json"
+
+DIMENSIONS = {"loc": "Sub-unit", "depth": "Depth", "pgy": "PGY level"}
+
+Q2_SCALE = ["Strongly Agree", "Agree", "Neutral", "Disagree", "Strongly Disagree"]
+Q3_SCALE = ["Very helpful", "Helpful", "Neutral", "Unhelpful", "Very unhelpful"]
+
+CM_STEP = 0.1                            # form input step, so the histogram is exact
+
+
+def _group() -> dict:
+    return {"n": 0, "used": 0, "q2": Counter(), "q3": Counter(),
+            "cm": [0, 0.0, 0.0, math.inf, -math.inf],     # n, mean, M2, min, max
+            "hist": Counter()}
+
+
+def _float(value):
+    try:
+        x = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(x) else x
+
+
+class Aggregates:
+    def __init__(self):
+        self.groups: dict[tuple[str, str], dict] = {}
+
+    def _keys(self, row: dict):
+        yield "all", "all"
+        yield "loc", str(row.get("loc") or "")
+        yield "depth", str(row.get("depth") or "")
+        for level in str(row.get("pgy_levels") or "").split("|"):
+            yield "pgy", level or "(not given)"
+
+    def update(self, row: dict) -> None:
+        """Fold in one log row (typed values from the app or CSV text)."""
+        used = row.get("used_recommended") in (True, "True")
+        cm = _float(row.get("cm"))
+        q2 = row.get("algorithm_assist_recon_planning_q2") or ""
+        q3 = row.get("algorithm_assist_recon_planning_q3") or ""
+        for key in self._keys(row):
+            g = self.groups.get(key)
+            if g is None:
+                g = self.groups[key] = _group()
+            g["n"] += 1
+            g["used"] += used
+            if q2:
+                g["q2"][q2] += 1
+            if q3:
+                g["q3"][q3] += 1
+            if cm is not None:
+                s = g["cm"]
+                s[0] += 1
+                delta = cm - s[1]
+                s[1] += delta / s[0]
+                s[2] += delta * (cm - s[1])
+                s[3], s[4] = min(s[3], cm), max(s[4], cm)
+                g["hist"][round(cm / CM_STEP)] += 1
+
+    def merge(self, other: "Aggregates") -> None:
+        for key, o in other.groups.items():
+            g = self.groups.setdefault(key, _group())
+            g["n"] += o["n"]
+            g["used"] += o["used"]
+            g["q2"].update(o["q2"])
+            g["q3"].update(o["q3"])
+            g["hist"].update(o["hist"])
+            a, b = g["cm"], o["cm"]
+            n = a[0] + b[0]
+            if b[0]:                                     # Chan et al. parallel update
+                delta = b[1] - a[1]
+                a[1] += delta * b[0] / n
+                a[2] += b[2] + delta * delta * a[0] * b[0] / n
+                a[0] = n
+                a[3], a[4] = min(a[3], b[3]), max(a[4], b[4])
+
+    # ── views ────────────────────────────────────────────────
+    @staticmethod
+    def _quantile(hist: Counter, n: int, q: float):
+        target, seen = q * n, 0
+        for b in sorted(hist):
+            seen += hist[b]
+            if seen >= target:
+                return round(b * CM_STEP, 1)
+        return None
+
+    def table(self, dim: str) -> list[dict]:
+        """One summary row per value of *dim*, largest groups first."""
+        rows = []
+        for (d, value), g in self.groups.items():
+            if d != dim:
+                continue
+            n, mean, m2, lo, hi = g["cm"]
+            row = {
+                DIMENSIONS.get(dim, dim): value, "cases": g["n"],
+                "concordance %": round(100 * g["used"] / g["n"], 1) if g["n"] else None,
+                "cm mean": round(mean, 2) if n else None,
+                "cm sd": round(math.sqrt(m2 / (n - 1)), 2) if n > 1 else None,
+                "cm p50": self._quantile(g["hist"], n, 0.5),
+                "cm p90": self._quantile(g["hist"], n, 0.9),
+                "cm max": hi if n else None,
+            }
+            row.update({f"Q2 {k}": g["q2"].get(k, 0) for k in Q2_SCALE})
+            row.update({f"Q3 {k}": g["q3"].get(k, 0) for k in Q3_SCALE})
+            rows.append(row)
+        return sorted(rows, key=lambda r: -r["cases"])
+
+    def total(self) -> int:
+        g = self.groups.get(("all", "all"))
+        return g["n"] if g else 0
+
+    # ── persistence ─────────────────────────────────────────
+    def to_json(self) -> dict:
+        return {"version": 1, "groups": [
+            {"dim": d, "value": v, "n": g["n"], "used": g["used"],
+             "q2": g["q2"], "q3": g["q3"], "cm": g["cm"] if g["cm"][0] else [0, 0.0, 0.0, None, None],
+             "hist": {str(k): c for k, c in g["hist"].items()}}
+            for (d, v), g in self.groups.items()]}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Aggregates":
+        agg = cls()
+        for g in data.get("groups", []):
+            cm = g["cm"]
+            agg.groups[(g["dim"], g["value"])] = {
+                "n": g["n"], "used": g["used"], "q2": Counter(g["q2"]), "q3": Counter(g["q3"]),
+                "cm": cm if cm[0] else [0, 0.0, 0.0, math.inf, -math.inf],
+                "hist": Counter({int(k): c for k, c in g["hist"].items()})}
+        return agg
+
+
+# ──────────────────────────────────────────────────────────────
+# FILE-BACKED STORE  (a UsageLogWriter listener)
+# ──────────────────────────────────────────────────────────────
+class AggregateFile:
+    """Aggregates persisted next to the log; safe across server processes."""
+
+    def __init__(self, path: Path = AGG_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+    def load(self) -> Aggregates:
+        try:
+            return Aggregates.from_json(json.loads(self.path.read_text()))
+        except FileNotFoundError:
+            return Aggregates()
+
+    def _replace(self, agg: Aggregates) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(agg.to_json()))
+        os.replace(tmp, self.path)
+
+    def __call__(self, rows: list[dict]) -> None:
+        """Writer hook: fold a freshly appended batch into the file."""
+        delta = Aggregates()
+        for row in rows:
+            delta.update(row)
+        with self.path.with_suffix(".lock").open("a") as lock, file_lock(lock):
+            agg = self.load()
+            agg.merge(delta)
+            self._replace(agg)
+
+    def rebuild(self, rows) -> Aggregates:
+        """Recompute from scratch over *rows* (e.g. LogStore.iter_rows())."""
+        agg = Aggregates()
+        for row in rows:
+            agg.update(row)
+        with self.path.with_suffix(".lock").open("a") as lock, file_lock(lock):
+            self._replace(agg)
+        return agg
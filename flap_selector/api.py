@@ -0,0 +1,248 @@
+# flap_selector/api.py  –  headless JSON API for EHR / OR-scheduling clients
+# -----------------------------------------------------------------
+#   python -m flap_selector serve --port 8000        (needs uvicorn)
+#
+#   POST /recommend         {"loc": …, "kind": …, "cm": …, "depth": …, "age": …,
+#                            "hair": …, "dia": …, "smk": …, "rad": …}
+#                           (an omitted flag defaults as on the app's form: hair true)
+#   POST /recommend/batch   {"cases": [case, …]}           -> {"results": [rec, …]}
+#   POST /feedback          case + the app's feedback fields -> 202, row queued
+#   GET  /healthz           decision-table hit/miss stats
+#   GET  /metrics           Prometheus text, per-route timings with FLAP_PROFILE=1
+#
+# A bare ASGI callable – no web framework – so a request costs one JSON
+# parse, a DecisionTable lookup per case and one JSON dump.  Feedback rows
+# go through the same UsageLogWriter (and store / aggregates) as app.py.
+import asyncio
+import json
+import math
+from datetime import datetime, timezone
+
+from .aggregates import Q2_SCALE, Q3_SCALE, AggregateFile
+from .engine import DEPTH_OPTS, KINDS, Recommendation, current_rules
+from .memo import DecisionTable
+from .profiling import METRICS, stage
+from .telemetry import RuleHits
+from .usagelog import writer_from_env
+
+CM_RANGE = (0.1, 25.0)                   # same bounds as the app's form
+AGE_RANGE = (0, 120)
+MAX_BODY = 16 << 20
+MAX_BATCH = 10_000
+MAX_TEXT = 2_000
+
+TABLE = DecisionTable(hits=RuleHits())
+_writer = None
+
+
+class CaseError(ValueError):
+    """A request body that does not describe a valid case (-> 422)."""
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. VALIDATION
+# ──────────────────────────────────────────────────────────────
+def _number(case: dict, field: str, lo: float, hi: float) -> float:
+    value = case.get(field)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise CaseError(f"{field}: expected a number")
+    if not lo <= value <= hi:
+        raise CaseError(f"{field}: must be between {lo} and {hi}")
+    return value
+
+
+def _flag(case: dict, field: str, default: bool = False) -> bool:
+    value = case.get(field, default)
+    if not isinstance(value, bool):
+        raise CaseError(f"{field}: expected true or false")
+    return value
+
+
+def _choice(case: dict, field: str, options, default=None) -> str:
+    value = case.get(field, default)
+    if not isinstance(value, str) or value not in options:    # a list / object is unhashable
+        raise CaseError(f"{field}: must be one of {list(options)}")
+    return value
+
+
+def _text(obj: dict, field: str) -> str:
+    value = obj.get(field, "")
+    if not isinstance(value, str) or len(value) > MAX_TEXT:
+        raise CaseError(f"{field}: expected a string of at most {MAX_TEXT} characters")
+    return value.strip()
+
+
+def parse_case(case) -> tuple:
+    """Validated decide() arguments for one JSON case; raises CaseError."""
+    if not isinstance(case, dict):
+        raise CaseError("case: expected a JSON object")
+    loc = _choice(case, "loc", current_rules().thr)
+    return (loc, _choice(case, "kind", KINDS), _number(case, "cm", *CM_RANGE),
+            _choice(case, "depth", DEPTH_OPTS), _flag(case, "hair", True),   # the form's default
+            _number(case, "age", *AGE_RANGE),
+            _flag(case, "dia"), _flag(case, "smk"), _flag(case, "rad"))
+
+
+def feedback_row(body) -> dict:
+    """Usage-log row for a /feedback body, laid out like the app's rows."""
+    loc, kind, cm, depth, hair, age, dia, smk, rad = parse_case(body)
+    rec = TABLE.decide(loc, kind, cm, depth, hair, age, dia, smk, rad)
+    if "used_recommended" not in body:
+        raise CaseError("used_recommended: required")
+    used = _flag(body, "used_recommended")
+    alt = _text(body, "alt_flap_if_no")
+    if not used and not alt:
+        raise CaseError("alt_flap_if_no: required when used_recommended is false")
+    pgy = body.get("pgy_levels", [])
+    if not isinstance(pgy, list) or not all(isinstance(p, str) for p in pgy):
+        raise CaseError("pgy_levels: expected a list of strings")
+    margin = _number(body, "margin_size_mm", 0.0, 50.0) if "margin_size_mm" in body else 0.0
+    return {
+        "timestamp_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+        "loc": loc, "kind": kind, "depth": depth.split()[0], "cm": cm, "hair": hair, "age": age,
+        "patient_sex": _choice(body, "patient_sex", ("", "Male", "Female", "Other"), ""),
+        "cancer_type": _text(body, "cancer_type"),
+        "margin_size_mm": margin,
+        "dia": dia, "smk": smk, "rad": rad,
+        "recommended_flap": rec.flap,
+        "used_recommended": used, "alt_flap_if_no": alt,
+        "physician_name": _text(body, "physician_name"),
+        "pgy_levels": "|".join(pgy),
+        "experience_level": _text(body, "experience_level"),
+        "algorithm_assist_recon_planning_q2": _choice(body, "algorithm_assist_recon_planning_q2",
+                                                      Q2_SCALE + [""], ""),
+        "algorithm_assist_recon_planning_q3": _choice(body, "algorithm_assist_recon_planning_q3",
+                                                      Q3_SCALE + [""], ""),
+        "final_comments_rationale": _text(body, "final_comments_rationale"),
+        "rule_id": rec.rule_id, "rules_version": rec.rules_version,
+    }
+
+
+def _rec_json(rec: Recommendation) -> dict:
+    return {f: getattr(rec, f) for f in rec.__slots__}
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. HANDLERS  (body -> (status, payload))
+# ──────────────────────────────────────────────────────────────
+def _writer_instance():
+    global _writer
+    if _writer is None:
+        _writer = writer_from_env(listeners=[AggregateFile()])
+    return _writer
+
+
+async def recommend(body):
+    return 200, _rec_json(TABLE.decide(*parse_case(body)))
+
+
+async def recommend_batch(body):
+    cases = body.get("cases") if isinstance(body, dict) else body
+    if not isinstance(cases, list):
+        raise CaseError("cases: expected a list")
+    if len(cases) > MAX_BATCH:
+        return 413, {"error": f"at most {MAX_BATCH} cases per request"}
+    parsed, errors = [], []
+    for i, case in enumerate(cases):
+        try:
+            parsed.append(parse_case(case))
+        except CaseError as exc:
+            errors.append({"index": i, "error": str(exc)})
+    if errors:
+        return 422, {"errors": errors}
+    decide = TABLE.decide
+    return 200, {"results": [_rec_json(decide(*args)) for args in parsed]}
+
+
+async def feedback(body):
+    row = feedback_row(body)
+    # submit() blocks only under back-pressure; keep that off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, _writer_instance().submit, row)
+    return 202, {"recommended_flap": row["recommended_flap"], "rule_id": row["rule_id"],
+                 "rules_version": row["rules_version"]}
+
+
+async def healthz(_body):
+    return 200, {"status": "ok", "decision_table": TABLE.stats()}
+
+
+async def metrics(_body):
+    return 200, METRICS.render()
+
+
+ROUTES = {
+    ("POST", "/recommend"): recommend,
+    ("POST", "/recommend/batch"): recommend_batch,
+    ("POST", "/feedback"): feedback,
+    ("GET", "/healthz"): healthz,
+    ("GET", "/metrics"): metrics,
+}
+
+
+# ──────────────────────────────────────────────────────────────
+# 3. ASGI PLUMBING
+# ──────────────────────────────────────────────────────────────
+async def _read_body(receive) -> bytes | None:
+    chunks, size = [], 0
+    while True:
+        msg = await receive()
+        chunks.append(msg.get("body", b""))
+        size += len(chunks[-1])
+        if size > MAX_BODY:
+            return None
+        if not msg.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _respond(send, status: int, payload) -> None:
+    if isinstance(payload, str):
+        body, ctype = payload.encode("utf-8"), b"text/plain; version=0.0.4"
+    else:
+        body, ctype = json.dumps(payload, ensure_ascii=False).encode("utf-8"), b"application/json"
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", ctype),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            if _writer is not None:
+                _writer.close()
+            TABLE.hits.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    path = scope["path"].rstrip("/") or "/"
+    handler = ROUTES.get((scope["method"], path))
+    if handler is None:
+        allowed = any(p == path for _, p in ROUTES)
+        return await _respond(send, 405 if allowed else 404,
+                              {"error": "method not allowed" if allowed else "not found"})
+    with stage(f"api {path}"):
+        await _handle(handler, receive, send)
+
+
+async def _handle(handler, receive, send) -> None:
+    raw = await _read_body(receive)
+    if raw is None:
+        return await _respond(send, 413, {"error": f"body larger than {MAX_BODY} bytes"})
+    try:
+        body = json.loads(raw) if raw else {}
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:     # not JSON, or not UTF-8
+        return await _respond(send, 400, {"error": f"invalid JSON: {exc}"})
+    try:
+        status, payload = await handler(body)
+    except CaseError as exc:
+        status, payload = 422, {"error": str(exc)}
+    await _respond(send, status, payload)
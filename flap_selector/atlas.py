@@ -0,0 +1,175 @@
+# flap_selector/atlas.py  –  the whole decision space as a static artifact
+# -----------------------------------------------------------------
+#   python -m flap_selector atlas --out atlas/      atlas.json + atlas.html
+#
+# decide() sees cm only through THR (three sizes) and age only through
+# three bands, so every outcome fits in two small tables: one cell per
+# (sub-unit, depth, size, hair) and one notes entry per (flap, hair, kind,
+# age band, risk flags) – the same tabulation batch.py vectorises.  The
+# atlas stores them as flat integer arrays over one string table, and
+# atlas.html embeds it with a ~20-line lookup, so an outreach clinic can
+# open the file from disk: no server, no network, microsecond lookups.
+# app.py rewrites both files whenever the rules hot-reload (engine.on_reload).
+import json
+import os
+from datetime import datetime, timezone
+from html import escape
+from pathlib import Path
+
+from .engine import AGE_BANDS, DEPTH_OPTS, KINDS, SIZES, RuleSet, current_rules
+from .usagelog import DATA_DIR
+
+ATLAS_DIR = DATA_DIR / "atlas"
+FORMAT = 1
+AGE_CUTS = (18, 70)                      # engine._age_band: < 18, 18–70, > 70
+
+
+def build_atlas(rules: RuleSet | None = None) -> dict:
+    """Indexed-JSON form of *rules* (default: the live rules)."""
+    rules = rules or current_rules()
+    strings: dict[str, int] = {}
+    sid = lambda s: strings.setdefault(s, len(strings))
+    flaps: dict[str, int] = {}           # flap string -> flap code
+
+    cells = []
+    for loc in rules.subunits:
+        for depth in range(len(DEPTH_OPTS)):
+            for size in SIZES:
+                for hair in (False, True):
+                    rule, flap, rationale = rules.cells[loc, depth, size, hair]
+                    cells += [sid(rule), flaps.setdefault(flap, len(flaps)), sid(rationale)]
+
+    kinds = KINDS + [""]                 # "" = any other defect type
+    note_sets: dict[tuple, int] = {}
+    notes = []
+    for flap in flaps:
+        for hair in (False, True):
+            for kind in kinds:
+                for band in range(len(AGE_BANDS)):
+                    for low in range(8):             # smk | dia << 1 | rad << 2
+                        texts = rules.notes_for(kind, hair, flap, band,
+                                                bool(low & 2), bool(low & 1), bool(low & 4))
+                        ids = tuple(sid(t) for t in texts)
+                        notes.append(note_sets.setdefault(ids, len(note_sets)))
+
+    flap_ids = [sid(f) for f in flaps]
+    return {
+        "format": FORMAT, "version": rules.version, "digest": rules.digest,
+        "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "subunits": rules.subunits, "thr": [list(rules.thr[loc]) for loc in rules.subunits],
+        "kinds": KINDS, "depths": DEPTH_OPTS, "sizes": SIZES,
+        "age_bands": AGE_BANDS, "age_cuts": list(AGE_CUTS),
+        "strings": list(strings), "flaps": flap_ids,
+        "cells": cells, "notes": notes, "note_sets": [list(s) for s in note_sets],
+    }
+
+
+def lookup(atlas: dict, loc, kind, cm, depth, hair, age, dia, smk, rad) -> dict:
+    """decide() answered from an atlas – the reference for the page's JavaScript."""
+    S = atlas["strings"]
+    l = atlas["subunits"].index(loc)
+    lo, mid = atlas["thr"][l]
+    size = 0 if cm <= lo else 1 if cm <= mid else 2
+    d = 2 if str(depth).startswith("Full") else 0 if str(depth).startswith("Superficial") else 1
+    band = 0 if age < AGE_CUTS[0] else 2 if age > AGE_CUTS[1] else 1
+    k = KINDS.index(kind) if kind in KINDS else len(KINDS)
+    c = (((l * 3 + d) * 3 + size) * 2 + bool(hair)) * 3
+    rule, flap, rationale = atlas["cells"][c:c + 3]
+    n = (((flap * 2 + bool(hair)) * (len(KINDS) + 1) + k) * 3 + band) * 8 \
+        + (bool(smk) | bool(dia) << 1 | bool(rad) << 2)
+    return {"flap": S[atlas["flaps"][flap]], "rationale": S[rationale],
+            "notes": tuple(S[i] for i in atlas["note_sets"][atlas["notes"][n]]),
+            "size_category": SIZES[size], "rule_id": S[rule],
+            "rules_version": atlas["version"]}
+
+
+def render_html(atlas: dict) -> str:
+    """Self-contained lookup page with the atlas embedded."""
+    data = json.dumps(atlas, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+    return _PAGE.replace("{version}", escape(atlas["version"])).replace("{atlas}", data)
+
+
+def write_atlas(out_dir: Path = ATLAS_DIR, rules: RuleSet | None = None) -> Path:
+    """Write atlas.json and atlas.html into *out_dir* (atomically); returns the HTML path."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    atlas = build_atlas(rules)
+    for name, text in (("atlas.json", json.dumps(atlas, ensure_ascii=False, separators=(",", ":"))),
+                       ("atlas.html", render_html(atlas))):
+        tmp = out_dir / f".{name}.{os.getpid()}.tmp"     # server replicas may write at once
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, out_dir / name)
+    return out_dir / "atlas.html"
+
+
+def ensure_atlas(out_dir: Path = ATLAS_DIR, rules: RuleSet | None = None) -> Path:
+    """write_atlas() unless *out_dir* already holds the atlas of *rules*."""
+    rules = rules or current_rules()
+    try:
+        with (Path(out_dir) / "atlas.json").open(encoding="utf-8") as f:
+            head = json.load(f)
+        if (head.get("format"), head.get("digest")) == (FORMAT, rules.digest) \
+                and (Path(out_dir) / "atlas.html").exists():
+            return Path(out_dir) / "atlas.html"
+    except (OSError, ValueError):
+        pass
+    return write_atlas(out_dir, rules)
+
+
+_PAGE = """<!doctype html>
+<html lang="en"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Flap-Selector atlas {version}</title>
+<style>
+body{font:15px/1.45 system-ui,sans-serif;max-width:46rem;margin:2rem auto;padding:0 1rem;color:#222}
+form{display:grid;grid-template-columns:10rem 1fr;gap:.45rem .8rem;align-items:center}
+select,input[type=number]{font:inherit;padding:.2rem}
+#out{margin-top:1.4rem;padding:1rem;border:1px solid #ccc;border-radius:6px;background:#fafafa}
+small{color:#666}
+</style></head><body>
+<h2>🩺 Local-flap decision atlas</h2>
+<p><small>Research prototype — use best clinical judgement. Rules {version};
+every answer is precomputed, this page works offline.</small></p>
+<form id="f">
+<label for="loc">Sub-unit</label><select id="loc"></select>
+<label for="kind">Defect type</label><select id="kind"></select>
+<label for="depth">Depth</label><select id="depth"></select>
+<label for="cm">Defect size (cm)</label><input id="cm" type="number" min="0.1" max="25" step="0.1" value="1.0">
+<label for="age">Age</label><input id="age" type="number" min="0" max="120" step="1" value="60">
+<span>Findings</span><span>
+<label><input id="hair" type="checkbox"> hair-bearing</label>
+<label><input id="dia" type="checkbox"> diabetes</label>
+<label><input id="smk" type="checkbox"> smoker</label>
+<label><input id="rad" type="checkbox"> prior radiation</label></span>
+</form>
+<div id="out"></div>
+<script id="atlas" type="application/json">{atlas}</script>
+<script>
+const A = JSON.parse(document.getElementById("atlas").textContent), S = A.strings;
+const $ = id => document.getElementById(id);
+const fill = (el, opts) => opts.forEach((t, i) => el.add(new Option(t, i)));
+fill($("loc"), A.subunits); fill($("kind"), A.kinds.concat(["Other"])); fill($("depth"), A.depths);
+function decide(l, k, cm, d, hair, age, dia, smk, rad) {
+  const [lo, mid] = A.thr[l];
+  const size = cm <= lo ? 0 : cm <= mid ? 1 : 2;
+  const band = age < A.age_cuts[0] ? 0 : age > A.age_cuts[1] ? 2 : 1;
+  const c = (((l * 3 + d) * 3 + size) * 2 + hair) * 3, flap = A.cells[c + 1];
+  const n = (((flap * 2 + hair) * (A.kinds.length + 1) + k) * 3 + band) * 8 + (smk | dia << 1 | rad << 2);
+  return {flap: S[A.flaps[flap]], rationale: S[A.cells[c + 2]], size: A.sizes[size],
+          notes: A.note_sets[A.notes[n]].map(i => S[i]), rule: S[A.cells[c]]};
+}
+function show() {
+  const b = id => +$(id).checked, v = id => parseFloat($(id).value);
+  const r = decide(+$("loc").value, +$("kind").value, v("cm"), +$("depth").value,
+                   b("hair"), v("age"), b("dia"), b("smk"), b("rad"));
+  const out = $("out"); out.textContent = "";
+  for (const [k, t] of [["Recommended flap", r.flap], ["Rationale", r.rationale],
+                        ["Notes", r.notes.join(" ") || "None."],
+                        ["Size category", r.size + " · rule " + r.rule + " · rules " + A.version]]) {
+    const p = document.createElement("p"), s = document.createElement("strong");
+    s.textContent = k + ": "; p.append(s, t); out.append(p);
+  }
+}
+$("f").addEventListener("input", show); show();
+</script></body></html>
+"""
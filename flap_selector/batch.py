@@ -0,0 +1,110 @@
+# flap_selector/batch.py  –  vectorised scoring of whole case tables
+# -----------------------------------------------------------------
+# decide() only looks at (sub-unit, depth class, size category, hair) to
+# pick the flap + rationale, and at the risk flags / age band / defect type
+# for the notes.  Both spaces are tiny, so each RuleSet is tabulated once
+# (from its own lookups) and every row is resolved with array indexing.
+from functools import lru_cache
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from .engine import AGE_BANDS, DEPTH_KEYS, KINDS, SIZES, RuleSet, _depth_class, current_rules
+
+CASE_COLS = ["loc", "kind", "cm", "depth", "hair", "age", "dia", "smk", "rad"]
+OUT_COLS = ["size_category", "flap", "rationale", "notes", "rule_id", "rules_version"]
+
+
+def _kind_code(kind) -> int:
+    return KINDS.index(kind) if kind in KINDS else len(KINDS)
+
+
+def _categorical_table(table: np.ndarray):
+    """Split a table of strings into (int codes of same shape, categories)."""
+    codes, cats = pd.factorize(table.ravel())
+    return codes.reshape(table.shape), pd.Index(cats, dtype=object)
+
+
+@lru_cache(maxsize=2)                     # the live rules, plus one being compared against
+def _compiled(rules: RuleSet) -> SimpleNamespace:
+    """Array form of *rules*: per-cell tables plus a notes table per flap."""
+    subunits = rules.subunits
+    shape = (len(subunits), len(DEPTH_KEYS), len(SIZES), 2)
+    rule = np.empty(shape, dtype=object)
+    flap = np.empty(shape, dtype=object)
+    rationale = np.empty(shape, dtype=object)
+    for idx in np.ndindex(shape):
+        l, d, s, h = idx
+        rule[idx], flap[idx], rationale[idx] = rules.cells[subunits[l], d, SIZES[s], bool(h)]
+    flap_codes, flap_names = _categorical_table(flap)
+
+    # notes code = smk | dia<<1 | rad<<2 | 8*(band + 3*(kind + 4*(hair + 2*flap)))
+    kinds = KINDS + [""]
+    notes = np.empty((len(flap_names), 2, len(kinds), len(AGE_BANDS), 8), dtype=object)
+    for f, h, k, b, low in np.ndindex(notes.shape):
+        notes[f, h, k, b, low] = " ".join(rules.notes_for(
+            kinds[k], bool(h), flap_names[f], b, bool(low & 2), bool(low & 1), bool(low & 4)))
+    return SimpleNamespace(
+        rules=rules,
+        loc_code={loc: i for i, loc in enumerate(subunits)},
+        lo=np.array([rules.thr[loc][0] for loc in subunits], dtype=float),
+        mid=np.array([rules.thr[loc][1] for loc in subunits], dtype=float),
+        rule=_categorical_table(rule), flap=(flap_codes, flap_names),
+        rationale=_categorical_table(rationale), notes=_categorical_table(notes.ravel()),
+        version=(np.zeros(1, dtype=np.int64), pd.Index([rules.version], dtype=object)),
+    )
+
+
+_SIZE = (np.arange(len(SIZES)), pd.Index(SIZES, dtype=object))
+
+
+def _resolve(table, idx) -> pd.Categorical:
+    codes, cats = table
+    return pd.Categorical.from_codes(codes[idx], dtype=pd.CategoricalDtype(cats))
+
+
+def _codes(col: pd.Series, encode) -> np.ndarray:
+    """Factorise a string column and encode each distinct value once."""
+    codes, uniques = pd.factorize(col, use_na_sentinel=False)
+    return np.array([encode(u) for u in uniques], dtype=np.int64)[codes]
+
+
+def decide_batch(df: pd.DataFrame, rules: RuleSet | None = None) -> pd.DataFrame:
+    """Score every row of *df* (columns as in CASE_COLS) at once.
+
+    Returns a frame with OUT_COLS on the same index; each row equals what
+    decide() returns for that case, with notes joined by single spaces.
+    Columns are categoricals over the engine's (small) vocabulary of strings.
+    *rules* defaults to the live rules (engine.current_rules()).
+    """
+    missing = [c for c in CASE_COLS if c not in df.columns]
+    if missing:
+        raise KeyError(f"decide_batch: missing columns {missing}")
+    t = _compiled(rules or current_rules())
+
+    loc = _codes(df["loc"], lambda u: t.loc_code[u])         # KeyError like _cat()
+    depth = _codes(df["depth"], _depth_class)
+    kind = _codes(df["kind"], _kind_code)
+
+    cm = df["cm"].to_numpy(dtype=float)
+    age = df["age"].to_numpy(dtype=float)
+    hair = df["hair"].to_numpy(dtype=bool).astype(np.int64)
+
+    # small if cm <= lo, medium if cm <= mid, else large (NaN -> large, as in _cat)
+    size = 2 - (cm <= t.mid[loc]).astype(np.int64) - (cm <= t.lo[loc])
+    band = np.where(age < 18, 0, np.where(age > 70, 2, 1))
+
+    cell = (loc, depth, size, hair)
+    flags = lambda col: df[col].to_numpy(dtype=bool).astype(np.int64)
+    note_code = (flags("smk") | flags("dia") << 1 | flags("rad") << 2) + 8 * (
+        band + len(AGE_BANDS) * (kind + (len(KINDS) + 1) * (hair + 2 * t.flap[0][cell])))
+
+    return pd.DataFrame({
+        "size_category": _resolve(_SIZE, size),
+        "flap":          _resolve(t.flap, cell),
+        "rationale":     _resolve(t.rationale, cell),
+        "notes":         _resolve(t.notes, note_code),
+        "rule_id":       _resolve(t.rule, cell),
+        "rules_version": _resolve(t.version, np.zeros(len(df), dtype=np.int64)),
+    }, index=df.index)
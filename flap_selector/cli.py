@@ -0,0 +1,378 @@
+# flap_selector/cli.py  –  offline command-line entry point
+# -----------------------------------------------------------------
+#   python -m flap_selector score cases.csv scored.parquet --workers 8
+#   python -m flap_selector sweep --out sweep.csv          (THR tuning, see sweep.py)
+#   python -m flap_selector rescore edited_rules.json      (rules diff, see rescore.py)
+#   python -m flap_selector atlas --out atlas/             (offline lookup page, see atlas.py)
+#   python -m flap_selector normalise                    (free-text columns, see vocab.py)
+#   python -m flap_selector ship --once                  (log → S3 / MinIO, see shipper.py)
+#   python -m flap_selector serve --port 8000            (JSON API, see api.py)
+#
+# Input is read in chunks, each chunk is scored by decide_batch() in a
+# process pool, and results are written in input order as they arrive,
+# so memory stays bounded by (workers × 2) chunks regardless of file size.
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from .aggregates import AGG_PATH
+from .atlas import ATLAS_DIR
+from .batch import decide_batch
+from .usagelog import ARCHIVE_DIR, DATA_PATH
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. CHUNKED READERS / STREAMING WRITERS
+# ──────────────────────────────────────────────────────────────
+def _read_chunks(path: Path, chunksize: int):
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+class _CsvSink:
+    encode_in_worker = True                # workers hand back CSV text
+
+    def __init__(self, path: Path):
+        self.f = path.open("w", newline="", encoding="utf-8")
+
+    def write(self, text: str) -> None:
+        self.f.write(text)
+
+    def close(self) -> None:
+        self.f.close()
+
+
+class _ParquetSink:
+    encode_in_worker = False
+
+    def __init__(self, path: Path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq, self.path = pa, pq, path
+        self.writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        # categories differ chunk to chunk; plain strings keep one schema
+        df = df.astype({c: "string" for c in df.select_dtypes("category").columns})
+        table = self.pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _open_sink(path: Path, fmt: str | None):
+    fmt = fmt or ("parquet" if path.suffix == ".parquet" else "csv")
+    return _ParquetSink(path) if fmt == "parquet" else _CsvSink(path)
+
+
+def _score_chunk(df: pd.DataFrame, as_csv: bool, header: bool):
+    scored = pd.concat([df, decide_batch(df)], axis=1)
+    return scored.to_csv(header=header, index=False) if as_csv else scored
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. COMMANDS
+# ──────────────────────────────────────────────────────────────
+def cmd_score(args) -> None:
+    sink = _open_sink(args.output, args.format)
+    rows, t0 = 0, time.perf_counter()
+
+    def emit(n: int, scored) -> None:
+        nonlocal rows
+        sink.write(scored)
+        rows += n
+        elapsed = time.perf_counter() - t0
+        print(f"\r{rows:,} rows  {rows / elapsed:,.0f} rows/s", end="", file=sys.stderr)
+
+    try:
+        chunks = enumerate(_read_chunks(args.input, args.chunksize))
+        as_csv = sink.encode_in_worker
+        if args.workers == 0:
+            for i, chunk in chunks:
+                emit(len(chunk), _score_chunk(chunk, as_csv, i == 0))
+        else:
+            workers = args.workers or os.cpu_count() or 1
+            with ProcessPoolExecutor(workers) as pool:
+                pending = deque()
+                for i, chunk in chunks:
+                    pending.append((len(chunk), pool.submit(_score_chunk, chunk, as_csv, i == 0)))
+                    if len(pending) >= 2 * workers:
+                        n, fut = pending.popleft()
+                        emit(n, fut.result())
+                while pending:
+                    n, fut = pending.popleft()
+                    emit(n, fut.result())
+    finally:
+        sink.close()
+    elapsed = time.perf_counter() - t0
+    print(f"\nscored {rows:,} rows in {elapsed:.2f}s "
+          f"({rows / max(elapsed, 1e-9):,.0f} rows/s) -> {args.output}", file=sys.stderr)
+
+
+def cmd_migrate(args) -> None:
+    from .logstore import SqliteLogStore
+    store = SqliteLogStore(args.db)
+    n = store.migrate_from_csv(args.csv)
+    print(f"copied {n:,} rows into {args.db} ({store.count():,} total)"
+          if n else f"{args.csv} was already migrated into {args.db}", file=sys.stderr)
+    store.close()
+
+
+def cmd_compact(args) -> None:
+    from .compact import compact
+    n = compact(args.csv, args.archive, keep_months=args.keep_months)
+    print(f"moved {n:,} rows from {args.csv} into {args.archive}", file=sys.stderr)
+
+
+def cmd_export(args) -> None:
+    from datetime import date
+    from .export import ExportFilter, iter_export
+    from .logstore import open_store
+    flt = ExportFilter(
+        start=date.fromisoformat(args.start) if args.start else None,
+        end=date.fromisoformat(args.end) if args.end else None,
+        locs=frozenset(args.loc) if args.loc else None,
+        used_recommended=None if args.used is None else args.used == "yes")
+    gzip = args.gzip or args.output.suffix == ".gz"
+    out = sys.stdout.buffer if str(args.output) == "-" else args.output.open("wb")
+    try:
+        for chunk in iter_export(open_store(args.log), flt, gzip=gzip, archive=args.archive):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+def cmd_aggregates(args) -> None:
+    from itertools import chain
+    from .aggregates import DIMENSIONS, AggregateFile
+    from .compact import iter_archive_rows
+    from .logstore import open_store
+    agg_file = AggregateFile(args.path)
+    if args.rebuild:
+        rows = open_store(args.log).iter_rows()
+        if (args.archive / "manifest.json").exists():
+            rows = chain(iter_archive_rows(args.archive), rows)
+        agg = agg_file.rebuild(rows)
+    else:
+        agg = agg_file.load()
+    print(f"{agg.total():,} cases", file=sys.stderr)
+    for row in agg.table(args.by):
+        print(f"  {row[DIMENSIONS[args.by]]:<40} {row['cases']:>8,}  "
+              f"{row['concordance %']:>5}% concordant", file=sys.stderr)
+
+
+def cmd_normalise(args) -> None:
+    from .logstore import open_store
+    from .vocab import renormalise
+    t0 = time.perf_counter()
+    store = open_store(args.log)
+    archive = args.archive if (args.archive / "manifest.json").exists() else None
+    res = renormalise(store, archive)
+    store.close()
+    print(f"re-normalised {res['rows']:,} rows, {res['changed']:,} canonical values changed "
+          f"in {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+
+def cmd_sweep(args) -> None:
+    from .sweep import load_cases, sweep
+
+    t0 = time.perf_counter()
+    df = load_cases(args.log, args.archive)
+    workers = args.workers if args.workers is not None else os.cpu_count()
+    res = sweep(df, step=args.step, span=args.span, top=args.top,
+                min_cases=args.min_cases, workers=workers)
+    if args.out:
+        res.to_csv(args.out, index=False)
+    print(f"{len(df):,} logged cases, {res['candidates'].sum() if len(res) else 0:,} candidates "
+          f"in {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    for row in res[res["rank"] == 1].itertuples() if len(res) else ():
+        print(f"  {row.loc:<34} ({row.current_lo:g}, {row.current_mid:g}) -> ({row.lo:g}, {row.mid:g})  "
+              f"{100 * row.current_concordance:5.1f}% -> {100 * row.concordance:5.1f}%  "
+              f"(n={row.cases:,}, observed {100 * row.observed_concordance:.1f}%)", file=sys.stderr)
+
+
+def cmd_rescore(args) -> None:
+    from .engine import current_rules, load_rules
+    from .rescore import load_cases, rescore
+
+    t0 = time.perf_counter()
+    old = load_rules(args.base) if args.base else current_rules()
+    new = load_rules(args.rules)
+    df = load_cases(args.log, args.archive)
+    workers = args.workers if args.workers is not None else os.cpu_count()
+    report, changed = rescore(df, new, old, workers=workers)
+    if args.out:
+        report.to_csv(args.out, index=False)
+    if args.rows:
+        changed.to_csv(args.rows, index=False)
+    print(f"{len(df):,} logged cases, rules {old.version} -> {new.version}: "
+          f"{len(changed):,} would get a different flap "
+          f"({report['now_differ_from_logged'].sum():,} differ from the logged one) "
+          f"in {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    for row in report[report["changed_cases"] > 0].itertuples():
+        print(f"  {row.loc:<34} {row.changed_cases:>8,} of {row.cases:>8,}  "
+              f"({row.changed_keys} of {row.keys} keys)  {row.top_change}", file=sys.stderr)
+
+
+def cmd_atlas(args) -> None:
+    from .atlas import write_atlas
+    from .engine import current_rules, load_rules
+    rules = load_rules(args.rules) if args.rules else current_rules()
+    html = write_atlas(args.out, rules)
+    print(f"rules {rules.version}: {html} ({html.stat().st_size / 1024:.0f} KiB), "
+          f"{html.with_name('atlas.json')}", file=sys.stderr)
+
+
+def cmd_ship(args) -> None:
+    from .shipper import LogShipper, target_from_url
+    url = args.to or os.environ.get("FLAP_SHIP_URL")
+    if not url:
+        sys.exit("ship needs a target: --to s3://bucket/prefix (or FLAP_SHIP_URL)")
+    try:
+        target = target_from_url(url, endpoint_url=args.endpoint or os.environ.get("FLAP_SHIP_ENDPOINT"))
+    except (RuntimeError, ValueError) as exc:
+        sys.exit(str(exc))
+    shipper = LogShipper(target, args.log, args.archive, source=args.source)
+    if args.once:
+        stats = shipper.run_once(force=True)
+        print(f"{target}: {stats['segments']} segments sealed, {stats['uploaded']} uploaded, "
+              f"{stats['archive_parts']} archive parts "
+              f"({stats['bytes_in']:,} -> {stats['bytes_out']:,} bytes)", file=sys.stderr)
+        return
+    shipper.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        shipper.close()
+
+
+def cmd_serve(args) -> None:
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("serve needs uvicorn:  pip install uvicorn")
+    uvicorn.run("flap_selector.api:app", host=args.host, port=args.port,
+                workers=args.workers, access_log=args.access_log, log_level="info")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m flap_selector",
+                                     description="Flap-Selector offline tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("score", help="score a CSV/Parquet case export")
+    p.add_argument("input", type=Path, help="cases (.csv or .parquet) with decide() columns")
+    p.add_argument("output", type=Path, help="destination (.csv or .parquet)")
+    p.add_argument("--format", choices=["csv", "parquet"], help="default: from output suffix")
+    p.add_argument("--chunksize", type=int, default=100_000)
+    p.add_argument("--workers", type=int, default=None,
+                   help="process-pool size (default: CPU count, 0 = in-process)")
+    p.set_defaults(func=cmd_score)
+
+    p = sub.add_parser("migrate", help="one-shot copy of the CSV usage log into SQLite")
+    p.add_argument("csv", type=Path, nargs="?", default=DATA_PATH)
+    p.add_argument("db", type=Path, nargs="?", default=DATA_PATH.with_suffix(".db"))
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("compact", help="roll old CSV log rows into monthly Parquet")
+    p.add_argument("csv", type=Path, nargs="?", default=DATA_PATH)
+    p.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    p.add_argument("--keep-months", type=int, default=1,
+                   help="months kept in the CSV hot tail (current month = 1)")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("export", help="stream a filtered copy of the usage log")
+    p.add_argument("output", type=Path, help="destination file, '-' for stdout (.gz => gzip)")
+    p.add_argument("--log", type=Path, default=DATA_PATH,
+                   help="usage log (.csv, or .db for SQLite)")
+    p.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    p.add_argument("--start", help="first day, YYYY-MM-DD")
+    p.add_argument("--end", help="last day, YYYY-MM-DD")
+    p.add_argument("--loc", action="append", help="sub-unit to keep (repeatable)")
+    p.add_argument("--used", choices=["yes", "no"], help="used_recommended filter")
+    p.add_argument("--gzip", action="store_true")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("aggregates", help="show (or rebuild) the dashboard aggregates")
+    p.add_argument("--rebuild", action="store_true", help="recompute from the full log")
+    p.add_argument("--by", choices=["loc", "depth", "pgy"], default="loc")
+    p.add_argument("--path", type=Path, default=AGG_PATH)
+    p.add_argument("--log", type=Path, default=DATA_PATH)
+    p.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    p.set_defaults(func=cmd_aggregates)
+
+    p = sub.add_parser("normalise", help="recompute the canonical flap / cancer-type columns")
+    p.add_argument("--log", type=Path, default=DATA_PATH,
+                   help="usage log (.csv, or .db for SQLite)")
+    p.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    p.set_defaults(func=cmd_normalise)
+
+    p = sub.add_parser("sweep", help="score candidate THR cut-offs against logged outcomes")
+    p.add_argument("--log", type=Path, default=DATA_PATH,
+                   help="usage log (.csv, or .db for SQLite)")
+    p.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    p.add_argument("--step", type=float, default=0.1, help="grid step in cm")
+    p.add_argument("--span", type=float, default=2.5,
+                   help="grid goes up to span × the current mid cut-off")
+    p.add_argument("--top", type=int, default=5, help="candidates kept per sub-unit")
+    p.add_argument("--min-cases", type=int, default=30)
+    p.add_argument("--workers", type=int, default=None,
+                   help="process-pool size (default: CPU count, 0 = in-process)")
+    p.add_argument("--out", type=Path, help="write the ranked candidates as CSV")
+    p.set_defaults(func=cmd_sweep)
+
+    p = sub.add_parser("rescore", help="logged cases a rules edit would recommend differently")
+    p.add_argument("rules", type=Path, help="the edited rules file")
+    p.add_argument("--base", type=Path, help="rules to compare against (default: the live rules)")
+    p.add_argument("--log", type=Path, default=DATA_PATH,
+                   help="usage log (.csv, or .db for SQLite)")
+    p.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    p.add_argument("--workers", type=int, default=None,
+                   help="process-pool size (default: CPU count, 0 = in-process)")
+    p.add_argument("--out", type=Path, help="write the per-sub-unit report as CSV")
+    p.add_argument("--rows", type=Path, help="write the changed cases as CSV")
+    p.set_defaults(func=cmd_rescore)
+
+    p = sub.add_parser("atlas", help="precompute every outcome into a static JSON + HTML lookup")
+    p.add_argument("--out", type=Path, default=ATLAS_DIR)
+    p.add_argument("--rules", type=Path, help="rules file (default: the live rules)")
+    p.set_defaults(func=cmd_atlas)
+
+    p = sub.add_parser("ship", help="upload the log in compressed segments to S3 / MinIO")
+    p.add_argument("--to", help="s3://bucket/prefix or file:///dir (default: FLAP_SHIP_URL)")
+    p.add_argument("--endpoint", help="S3 endpoint URL, e.g. MinIO (default: FLAP_SHIP_ENDPOINT)")
+    p.add_argument("--log", type=Path, default=DATA_PATH,
+                   help="usage log (.csv, or .db for SQLite)")
+    p.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    p.add_argument("--source", help="key prefix for this host (default: FLAP_SHIP_SOURCE or hostname)")
+    p.add_argument("--once", action="store_true", help="seal everything, upload, exit")
+    p.set_defaults(func=cmd_ship)
+
+    p = sub.add_parser("serve", help="run the JSON recommendation API (needs uvicorn)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--workers", type=int, default=1, help="server processes")
+    p.add_argument("--access-log", action="store_true")
+    p.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None) -> None:
+    args = build_parser().parse_args(argv)
+    args.func(args)
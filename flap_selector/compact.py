@@ -0,0 +1,183 @@
+# flap_selector/compact.py  –  roll the CSV usage log into monthly Parquet
+# -----------------------------------------------------------------
+#   .data/archive/month=2026-09/part-<n>.parquet
+#   .data/archive/manifest.json      {partitions: {month: [files…]}, …}
+#
+# compact() moves every row older than the kept months out of the CSV into
+# one Parquet part per month (dictionary-encoded categoricals) and leaves
+# the recent rows in the CSV as a short hot tail.  read_log() reads back
+# only the partitions and columns a query needs, plus the tail.
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from .logstore import BOOL_COLUMNS, LOG_SCHEMA, iter_records, locked_log
+from .usagelog import ARCHIVE_DIR, DATA_PATH
+
+CATEGORICAL = [
+    "loc", "kind", "depth", "recommended_flap", "rule_id", "rules_version",
+    "patient_sex", "pgy_levels", "experience_level",
+    "algorithm_assist_recon_planning_q2", "algorithm_assist_recon_planning_q3",
+    "alt_flap_canonical", "cancer_type_canonical",
+]
+
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    """String frame from the CSV -> compact analysis dtypes."""
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col in BOOL_COLUMNS:
+            out[col] = s.map({"True": True, "False": False}).astype("boolean")
+        elif col in CATEGORICAL:
+            out[col] = s.astype("category")
+        elif LOG_SCHEMA.get(col) in ("REAL", "INTEGER"):
+            out[col] = pd.to_numeric(s, errors="coerce").astype(
+                "Int32" if LOG_SCHEMA[col] == "INTEGER" else "float64")
+        else:
+            out[col] = s.astype("string")
+    return pd.DataFrame(out)
+
+
+def _month_ago(months: int) -> str:
+    now = datetime.now(timezone.utc)
+    y, m = divmod(now.year * 12 + now.month - 1 - months, 12)
+    return f"{y:04d}-{m + 1:02d}"
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. MANIFEST
+# ──────────────────────────────────────────────────────────────
+def load_manifest(archive: Path = ARCHIVE_DIR) -> dict:
+    path = Path(archive) / "manifest.json"
+    if not path.exists():
+        return {"version": 1, "partitions": {}, "compactions": []}
+    return json.loads(path.read_text())
+
+
+def _save_manifest(archive: Path, manifest: dict) -> None:
+    tmp = archive / "manifest.json.tmp"
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    os.replace(tmp, archive / "manifest.json")
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. COMPACTION
+# ──────────────────────────────────────────────────────────────
+def compact(csv_path: Path = DATA_PATH, archive: Path = ARCHIVE_DIR,
+            keep_months: int = 1) -> int:
+    """Move CSV rows older than the last *keep_months* months into Parquet.
+
+    Runs under the same fcntl lock the writers use, so appends simply wait.
+    Parquet parts and the manifest are written before the CSV is cut: a
+    crash in between can duplicate rows, never lose them.  Returns rows moved.
+    """
+    csv_path, archive = Path(csv_path), Path(archive)
+    if not csv_path.exists():
+        return 0
+    cutoff = _month_ago(keep_months - 1) if keep_months > 0 else "9999-99"
+    with locked_log(csv_path, "r+b") as f:
+        records = iter_records(f)
+        _, header = next(records, (0, b""))
+        if not header:
+            return 0
+        columns = next(csv.reader([header.decode("utf-8")]))
+        ts_col = columns.index("timestamp_utc")
+        cut, n = len(header), 0
+        for offset, rec in records:
+            if next(csv.reader([rec.decode("utf-8")]))[ts_col][:7] >= cutoff:
+                break
+            cut, n = offset + len(rec), n + 1
+        if not n:
+            return 0
+
+        f.seek(len(header))
+        old = pd.read_csv(io.BytesIO(header + f.read(cut - len(header))),
+                          dtype=str, keep_default_na=False)
+        df = _typed(old)
+        manifest = load_manifest(archive)
+        for month, part in df.groupby(df["timestamp_utc"].str[:7].fillna("unknown"),
+                                      observed=True):
+            files = manifest["partitions"].setdefault(month, [])
+            rel = f"month={month}/part-{len(files):04d}.parquet"
+            (archive / rel).parent.mkdir(parents=True, exist_ok=True)
+            part.to_parquet(archive / rel, index=False)
+            files.append({"path": rel, "rows": len(part)})
+        manifest["columns"] = sorted(set(manifest.get("columns", [])) | set(columns))
+        manifest["compactions"].append({
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "rows": n, "bytes_removed": cut - len(header)})
+        _save_manifest(archive, manifest)
+
+        # keep the inode (writers may be waiting on its lock): shift the tail down
+        f.seek(cut)
+        tail = f.read()
+        f.seek(len(header))
+        f.write(tail)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+    return n
+
+
+# ──────────────────────────────────────────────────────────────
+# 3. READERS
+# ──────────────────────────────────────────────────────────────
+def iter_archive_rows(archive: Path = ARCHIVE_DIR):
+    """Yield every archived row as a dict, one record batch in memory at a time."""
+    import pyarrow.parquet as pq
+
+    archive = Path(archive)
+    for _, files in sorted(load_manifest(archive)["partitions"].items()):
+        for entry in files:
+            for batch in pq.ParquetFile(archive / entry["path"]).iter_batches():
+                yield from batch.to_pylist()
+
+
+def read_log(columns: list[str] | None = None, start: str | None = None,
+             end: str | None = None, csv_path: Path = DATA_PATH,
+             archive: Path = ARCHIVE_DIR, include_tail: bool = True) -> pd.DataFrame:
+    """Archive + hot tail as one frame.
+
+    *start* / *end* are ISO dates or months ("2026-03"); only partitions that
+    overlap them are opened, and only *columns* are read from each file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    archive = Path(archive)
+    want = None if columns is None else list(dict.fromkeys(
+        columns + (["timestamp_utc"] if start or end else [])))
+    tables = []
+    for month, files in sorted(load_manifest(archive)["partitions"].items()):
+        if (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+        for entry in files:
+            path = archive / entry["path"]
+            cols = None if want is None else [c for c in want if c in pq.read_schema(path).names]
+            tables.append(pq.read_table(path, columns=cols))
+    frames = []
+    if tables:
+        frames.append(pa.concat_tables(tables, promote_options="default")
+                      .unify_dictionaries().to_pandas())
+    if include_tail and Path(csv_path).exists():
+        tail = pd.read_csv(csv_path, dtype=str, keep_default_na=False,
+                           usecols=None if want is None else lambda c: c in want)
+        frames.append(_typed(tail))
+    if not frames:
+        return pd.DataFrame(columns=want or [])
+    df = pd.concat(frames, ignore_index=True)
+    for col in CATEGORICAL:                     # concat drops mismatched categories
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    if start:
+        df = df[df["timestamp_utc"] >= start]
+    if end:
+        df = df[df["timestamp_utc"].str[:len(end)] <= end]
+    df = df.reset_index(drop=True)
+    return df.reindex(columns=columns) if columns is not None else df
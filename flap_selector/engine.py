@@ -0,0 +1,353 @@
+# flap_selector/engine.py  –  decision engine for the Flap-Selector
+# Author: Tanish Patel
+# -----------------------------------------------------------------
+# Pure-Python, no Streamlit / pandas imports: app.py, the batch
+# scorer and offline tools all call into this module.
+#
+# The clinical content – sub-units, THR cut-offs, flap rules, rationale
+# modifiers and notes – lives in rules.json (or $FLAP_RULES_PATH).  It is
+# validated and compiled into a RuleSet of plain dict lookups, shared by
+# every session.  current_rules() re-checks the file's mtime at most once a
+# second and swaps in a freshly compiled RuleSet, so a rule edit needs no
+# restart; a decision reads one RuleSet throughout, and a file that fails
+# validation never replaces a good one.
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# ──────────────────────────────────────────────────────────────
+# 1. CONSTANTS & HELPERS
+# ──────────────────────────────────────────────────────────────
+DEPTH_OPTS = [
+    "Superficial (skin only)",
+    "Partial thickness (subcut / perichondrium)",
+    "Full thickness (cartilage / bone exposed)",
+]
+DEPTH_KEYS = ["superficial", "partial", "full"]       # DEPTH_OPTS as rules.json names them
+
+KINDS = ["Oncologic", "Traumatic", "Congenital"]
+SIZES = ["small", "medium", "large"]
+
+AGE_BANDS = ["<18", "18-70", ">70"]
+AGE_REP = (10, 40, 80)                    # one age per band: <18, 18-70, >70
+
+RULES_PATH = Path(os.environ.get("FLAP_RULES_PATH") or Path(__file__).with_name("rules.json"))
+RELOAD_CHECK = 1.0                        # seconds between mtime checks
+
+def _age_band(age) -> int:
+    return 0 if age < 18 else 2 if age > 70 else 1
+
+def _depth_class(depth) -> int:
+    """0 = superficial, 1 = partial, 2 = full – from the label's first word."""
+    depth = str(depth)
+    return 2 if depth.startswith("Full") else 0 if depth.startswith("Superficial") else 1
+
+@dataclass(frozen=True, slots=True)
+class Recommendation:
+    """One engine result; rendering is left to the caller (see to_markdown)."""
+    flap: str
+    rationale: str
+    notes: tuple[str, ...]
+    size_category: str
+    rule_id: str
+    rules_version: str = ""
+
+    def to_markdown(self) -> str:
+        return (
+            f"**Recommended flap:** {self.flap}\n\n"
+            f"**Rationale:** {self.rationale}\n\n"
+            f"**Notes:** {' '.join(self.notes) if self.notes else 'None.'}"
+        )
+
+# ──────────────────────────────────────────────────────────────
+# 2. RULE SET  (compiled rules.json)
+# ──────────────────────────────────────────────────────────────
+class RuleError(ValueError):
+    """A rules file that fails validation; .problems lists every issue found."""
+
+    def __init__(self, source: str, problems: list[str]):
+        self.problems = problems
+        more = f" (+{len(problems) - 10} more)" if len(problems) > 10 else ""
+        super().__init__(f"{source or 'rules'}: " + "; ".join(problems[:10]) + more)
+
+
+class RuleSet:
+    """Validated rules as lookups – nothing is matched or branched at decide time."""
+
+    def __init__(self, version: str, subunits: list[str], thr: dict, cells: dict,
+                 notes: list, digest: str = "", source: str = ""):
+        self.version = version
+        self.subunits = subunits          # display order
+        self.thr = thr                    # loc -> (lo, mid)
+        self.cells = cells                # (loc, depth class, size, hair) -> (rule id, flap, rationale)
+        self.notes = notes                # [(text, ((fact, value), …), flap substring or None)]
+        self.digest = digest              # sha256 prefix of the file, tells edits apart
+        self.source = source
+        self._notes_memo: dict[tuple, tuple] = {}
+
+    def size(self, loc: str, cm: float) -> str:
+        lo, mid = self.thr[loc]
+        return "small" if cm <= lo else "medium" if cm <= mid else "large"
+
+    def notes_for(self, kind, hair, flap, band, dia, smk, rad) -> tuple[str, ...]:
+        key = (kind if kind in KINDS else "", bool(hair), flap, band, bool(dia), bool(smk), bool(rad))
+        notes = self._notes_memo.get(key)
+        if notes is None:
+            facts = {"kind": key[0], "hair": key[1], "age_band": AGE_BANDS[band],
+                     "dia": key[4], "smk": key[5], "rad": key[6]}
+            low = flap.lower()
+            notes = self._notes_memo[key] = tuple(
+                text for text, conds, contains in self.notes
+                if (contains is None or contains in low) and all(facts[f] == v for f, v in conds))
+        return notes
+
+    def canonical_key(self, loc, kind, cm, depth, hair, age, dia, smk, rad) -> tuple:
+        """Everything a decision looks at: cm only via size(), age via its band."""
+        return (loc, kind if kind in KINDS else "", self.size(loc, cm), _depth_class(depth),
+                bool(hair), _age_band(age), bool(dia), bool(smk), bool(rad))
+
+    def decide_key(self, key: tuple) -> Recommendation:
+        loc, kind, size, depth, hair, band, dia, smk, rad = key
+        rule, flap, rationale = self.cells[loc, depth, size, hair]
+        return Recommendation(flap, rationale, self.notes_for(kind, hair, flap, band, dia, smk, rad),
+                              size, rule, self.version)
+
+    def decide(self, loc, kind, cm, depth, hair, age, dia, smk, rad) -> Recommendation:
+        return self.decide_key(self.canonical_key(loc, kind, cm, depth, hair, age, dia, smk, rad))
+
+
+_MATCH_KEYS = {"depth", "size", "hair"}
+_FACTS = {"smk": bool, "dia": bool, "rad": bool, "hair": bool, "kind": KINDS,
+          "age_band": AGE_BANDS, "flap_contains": str}
+
+
+def _match(where: str, obj: dict, problems: list) -> dict:
+    """The depth / size / hair lists a rule or modifier clause covers (absent = all)."""
+    out = {}
+    for key, allowed in (("depth", DEPTH_KEYS), ("size", SIZES)):
+        values = obj.get(key, allowed)
+        if not isinstance(values, list) or not values or not set(values) <= set(allowed):
+            problems.append(f"{where}: {key} must be a non-empty list from {allowed}")
+            values = []
+        out[key] = [DEPTH_KEYS.index(v) for v in values] if key == "depth" else values
+    hair = obj.get("hair")
+    if hair is not None and not isinstance(hair, bool):
+        problems.append(f"{where}: hair must be true or false")
+    out["hair"] = [False, True] if hair is None else [hair]
+    return out
+
+
+def _cells(match: dict):
+    return itertools.product(match["depth"], match["size"], match["hair"])
+
+
+def _unknown(where: str, obj: dict, allowed: set, problems: list) -> None:
+    extra = set(obj) - allowed
+    if extra:
+        problems.append(f"{where}: unknown keys {sorted(extra)}")
+
+
+def compile_rules(data, source: str = "", digest: str = "") -> RuleSet:
+    """Validate a parsed rules file and index it; raises RuleError listing every problem."""
+    if not isinstance(data, dict) or data.get("format") != 1:
+        raise RuleError(source, ['expected an object with "format": 1'])
+    problems: list[str] = []
+    _unknown("file", data, {"format", "version", "subunits", "rules",
+                            "rationale_modifiers", "notes"}, problems)
+    version = data.get("version")
+    if not isinstance(version, str) or not version:
+        problems.append("version: expected a non-empty string")
+
+    subunits, thr = [], {}
+    for i, sub in enumerate(data.get("subunits") or []):
+        name, cut = (sub.get("name"), sub.get("thr")) if isinstance(sub, dict) else (None, None)
+        if not isinstance(name, str) or not name or name in thr:
+            problems.append(f"subunits[{i}]: missing or duplicate name")
+            continue
+        if (not isinstance(cut, list) or len(cut) != 2
+                or not all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in cut)
+                or not 0 < cut[0] <= cut[1]):
+            problems.append(f"subunits[{i}] {name}: thr must be [lo, mid] with 0 < lo <= mid")
+            continue
+        subunits.append(name)
+        thr[name] = (cut[0], cut[1])
+    if not subunits:
+        problems.append("subunits: at least one is required")
+
+    # flap rules: every (loc, depth, size, hair) cell is covered exactly once
+    cells: dict[tuple, tuple] = {}
+    ids = set()
+    for i, rule in enumerate(data.get("rules") or []):
+        if not isinstance(rule, dict):
+            problems.append(f"rules[{i}]: expected an object")
+            continue
+        rid, loc = rule.get("id"), rule.get("loc")
+        where = f"rules[{i}] {rid}"
+        _unknown(where, rule, _MATCH_KEYS | {"id", "loc", "any", "flap", "rationale"}, problems)
+        if not isinstance(rid, str) or not rid or rid in ids:
+            problems.append(f"{where}: missing or duplicate id")
+        ids.add(rid)
+        if loc not in thr:
+            problems.append(f"{where}: unknown loc {loc!r}")
+            continue
+        if not all(isinstance(rule.get(k), str) and rule[k] for k in ("flap", "rationale")):
+            problems.append(f"{where}: flap and rationale must be non-empty strings")
+            continue
+        if "any" in rule:
+            if _MATCH_KEYS & set(rule) or not isinstance(rule["any"], list) or not rule["any"]:
+                problems.append(f'{where}: use either depth/size/hair or a non-empty "any" list')
+                continue
+            clauses = []
+            for j, clause in enumerate(rule["any"]):
+                if not isinstance(clause, dict):
+                    problems.append(f"{where} any[{j}]: expected an object")
+                    continue
+                _unknown(f"{where} any[{j}]", clause, _MATCH_KEYS, problems)
+                clauses.append(_match(f"{where} any[{j}]", clause, problems))
+        else:
+            clauses = [_match(where, rule, problems)]
+        for clause in clauses:
+            for d, s, h in _cells(clause):
+                cell = (loc, d, s, h)
+                if cell in cells:
+                    problems.append(f"{where}: overlaps {cells[cell][0]} at "
+                                    f"{loc}/{DEPTH_KEYS[d]}/{s}/hair={h}")
+                cells[cell] = (rid, rule["flap"], rule["rationale"])
+    for loc in subunits:
+        for d, s, h in itertools.product(range(len(DEPTH_KEYS)), SIZES, (False, True)):
+            if (loc, d, s, h) not in cells:
+                problems.append(f"no rule for {loc}/{DEPTH_KEYS[d]}/{s}/hair={h}")
+
+    # rationale modifiers, appended in file order to the cells they match
+    for i, mod in enumerate(data.get("rationale_modifiers") or []):
+        where = f"rationale_modifiers[{i}]"
+        if not isinstance(mod, dict) or mod.get("loc") not in thr or not isinstance(mod.get("append"), str):
+            problems.append(f"{where}: needs a known loc and an append string")
+            continue
+        _unknown(where, mod, _MATCH_KEYS | {"loc", "append", "flap_contains"}, problems)
+        contains = mod.get("flap_contains", "")
+        if not isinstance(contains, str):
+            problems.append(f"{where}: flap_contains must be a string")
+            continue
+        for d, s, h in _cells(_match(where, mod, problems)):
+            cell = (mod["loc"], d, s, h)
+            if cell in cells and contains.lower() in cells[cell][1].lower():
+                rid, flap, rationale = cells[cell]
+                cells[cell] = (rid, flap, rationale + mod["append"])
+
+    # notes, emitted in file order when every condition holds
+    notes = []
+    for i, note in enumerate(data.get("notes") or []):
+        where = f"notes[{i}]"
+        when = note.get("when") if isinstance(note, dict) else None
+        if not isinstance(when, dict) or not isinstance(note.get("text"), str):
+            problems.append(f'{where}: needs a "when" object and a text')
+            continue
+        _unknown(where, note, {"when", "text"}, problems)
+        for fact, value in when.items():
+            allowed = _FACTS.get(fact)
+            if allowed is None or (isinstance(allowed, list) and value not in allowed) \
+                    or (isinstance(allowed, type) and type(value) is not allowed):
+                problems.append(f"{where}: bad condition {fact}={value!r}")
+        contains = when.get("flap_contains")
+        conds = tuple((f, v) for f, v in when.items() if f != "flap_contains" and f in _FACTS)
+        notes.append((note["text"], conds, contains.lower() if isinstance(contains, str) else None))
+
+    if problems:
+        raise RuleError(source, problems)
+    return RuleSet(version, subunits, thr, cells, notes, digest, source)
+
+
+def load_rules(path=RULES_PATH) -> RuleSet:
+    """Read, validate and compile one rules file."""
+    raw = Path(path).read_bytes()
+    try:
+        data = json.loads(raw)
+    except ValueError as exc:
+        raise RuleError(str(path), [f"invalid JSON: {exc}"]) from None
+    return compile_rules(data, str(path), hashlib.sha256(raw).hexdigest()[:12])
+
+# ──────────────────────────────────────────────────────────────
+# 3. HOT RELOAD
+# ──────────────────────────────────────────────────────────────
+_rules_mtime = RULES_PATH.stat().st_mtime_ns
+_rules = load_rules(RULES_PATH)
+_next_check = time.monotonic() + RELOAD_CHECK
+_reload_lock = threading.Lock()
+_reload_hooks: list = []               # see on_reload()
+
+def current_rules() -> RuleSet:
+    """The live RuleSet, recompiled when rules.json changes (checked at most once a second)."""
+    if time.monotonic() >= _next_check:
+        _maybe_reload()
+    return _rules
+
+def on_reload(hook) -> None:
+    """Call hook(new RuleSet) after every hot reload, on the thread that noticed it."""
+    _reload_hooks.append(hook)
+
+def _maybe_reload() -> None:
+    global _rules, _rules_mtime, _next_check
+    if not _reload_lock.acquire(blocking=False):
+        return                            # another thread is already checking
+    try:
+        _next_check = time.monotonic() + RELOAD_CHECK
+        try:
+            mtime = RULES_PATH.stat().st_mtime_ns
+        except OSError:
+            return                        # mid-replace; try again next check
+        if mtime == _rules_mtime:
+            return
+        _rules_mtime = mtime
+        try:
+            new = load_rules(RULES_PATH)
+        except (OSError, RuleError) as exc:
+            log.error("rules file rejected, keeping %s: %s", _rules.version, exc)
+            return
+        if new.version == _rules.version and new.digest != _rules.digest:
+            log.warning("rules file changed without a version bump (%s)", new.version)
+        _rules = new                      # one reference swap: readers see old or new, never half
+        log.info("rules %s loaded from %s", new.version, RULES_PATH)
+        for hook in list(_reload_hooks):
+            try:
+                hook(new)
+            except Exception:
+                log.exception("rules reload hook %r failed", hook)
+    finally:
+        _reload_lock.release()
+
+def __getattr__(name):
+    # sub-units and cut-offs now come from the live rules file
+    if name == "SUBUNITS":
+        return list(current_rules().subunits)
+    if name == "THR":
+        return dict(current_rules().thr)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ──────────────────────────────────────────────────────────────
+# 4. DECISIONS  (against the live rules)
+# ──────────────────────────────────────────────────────────────
+def _cat(loc: str, cm: float) -> str:
+    return current_rules().size(loc, cm)
+
+def decide(loc, kind, cm, depth, hair, age, dia, smk, rad) -> Recommendation:
+    return current_rules().decide(loc, kind, cm, depth, hair, age, dia, smk, rad)
+
+def canonical_key(loc, kind, cm, depth, hair, age, dia, smk, rad) -> tuple:
+    """Everything decide() actually looks at: cm only via _cat(), age via its band.
+
+    Cases with equal keys get equal recommendations under the same rules.
+    """
+    return current_rules().canonical_key(loc, kind, cm, depth, hair, age, dia, smk, rad)
+
+def decide_key(key: tuple) -> Recommendation:
+    """decide() for a canonical_key()."""
+    return current_rules().decide_key(key)
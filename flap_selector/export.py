@@ -0,0 +1,193 @@
+# flap_selector/export.py  –  streamed, filtered export of the usage log
+# -----------------------------------------------------------------
+# iter_export() yields the log as CSV bytes in ~1 MB chunks (optionally
+# gzip-compressed on the fly), applying date / sub-unit / concordance
+# filters server-side.  Memory use is one chunk, whatever the log size:
+#   • unfiltered CSV log  – slices of a memory map, no parsing at all
+#   • filtered CSV log    – record-by-record, only matching rows kept
+#   • Parquet archive     – one partition file at a time
+#   • SQLite log          – indexed WHERE clause, cursor iteration
+# export_file() spools the same chunks to an anonymous temp file for
+# st.download_button, which reads its data into memory once when clicked.
+import csv
+import io
+import mmap
+import os
+import tempfile
+import zlib
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+from .logstore import LOG_COLUMNS, CsvLogStore, LogStore, SqliteLogStore, file_lock, iter_records
+
+CHUNK = 1 << 20
+
+
+@dataclass(frozen=True)
+class ExportFilter:
+    start: date | None = None            # inclusive, on timestamp_utc
+    end: date | None = None              # inclusive
+    locs: frozenset | None = None        # sub-units to keep
+    used_recommended: bool | None = None
+
+    def active(self) -> bool:
+        return any(v is not None for v in (self.start, self.end, self.locs, self.used_recommended))
+
+    def months(self) -> tuple[str, str]:
+        return (self.start.isoformat()[:7] if self.start else "",
+                self.end.isoformat()[:7] if self.end else "9999-99")
+
+    def match(self, row: dict) -> bool:
+        ts = row.get("timestamp_utc", "")
+        if self.start and ts[:10] < self.start.isoformat():
+            return False
+        if self.end and ts[:10] > self.end.isoformat():
+            return False
+        if self.locs is not None and row.get("loc") not in self.locs:
+            return False
+        if self.used_recommended is not None and row.get("used_recommended") != str(self.used_recommended):
+            return False
+        return True
+
+
+def _csv_line(values) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue().encode("utf-8")
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. SOURCES  (each yields raw CSV bytes without a header)
+# ──────────────────────────────────────────────────────────────
+def _snapshot_size(f) -> int:
+    # writers append whole batches under the lock, so this is a record boundary
+    with file_lock(f):
+        return os.fstat(f.fileno()).st_size
+
+
+def _from_csv(path: Path, header: list[str], flt: ExportFilter):
+    with path.open("rb") as f:
+        size = _snapshot_size(f)
+        if not size:
+            return
+        first = f.readline()
+        if not flt.active() and next(csv.reader([first.decode("utf-8")])) == header:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                for pos in range(len(first), size, CHUNK):
+                    yield mm[pos:min(pos + CHUNK, size)]
+            return
+        cols = next(csv.reader([first.decode("utf-8")]))
+        for offset, rec in iter_records(f, len(first)):
+            if offset >= size:
+                break
+            row = dict(zip(cols, next(csv.reader([rec.decode("utf-8")]))))
+            if flt.match(row):
+                yield rec if cols == header else _csv_line(row.get(c, "") for c in header)
+
+
+def _frame_mask(df, flt: ExportFilter):
+    ts = df["timestamp_utc"].astype(str).str[:10]
+    mask = ts.notna()
+    if flt.start:
+        mask &= ts >= flt.start.isoformat()
+    if flt.end:
+        mask &= ts <= flt.end.isoformat()
+    if flt.locs is not None:
+        mask &= df["loc"].isin(flt.locs)
+    if flt.used_recommended is not None:
+        mask &= (df["used_recommended"] == flt.used_recommended).fillna(False)
+    return mask
+
+
+def _from_archive(archive: Path, header: list[str], flt: ExportFilter):
+    from .compact import load_manifest
+    import pyarrow.parquet as pq
+
+    lo, hi = flt.months()
+    for month, files in sorted(load_manifest(archive)["partitions"].items()):
+        if not lo <= month <= hi:
+            continue
+        for entry in files:
+            df = pq.read_table(archive / entry["path"]).to_pandas().reindex(columns=header)
+            if flt.active():
+                df = df[_frame_mask(df, flt)]
+            yield df.to_csv(header=False, index=False, lineterminator="\r\n").encode("utf-8")
+
+
+def _from_sqlite(store: SqliteLogStore, flt: ExportFilter):
+    where, args = [], []
+    if flt.start:
+        where.append("timestamp_utc >= ?"); args.append(flt.start.isoformat())
+    if flt.end:
+        where.append("substr(timestamp_utc, 1, 10) <= ?"); args.append(flt.end.isoformat())
+    if flt.locs is not None:
+        where.append(f"loc IN ({', '.join('?' * len(flt.locs))})"); args.extend(sorted(flt.locs))
+    if flt.used_recommended is not None:
+        where.append("used_recommended = ?"); args.append(int(flt.used_recommended))
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in store.iter_rows(" AND ".join(where), args):
+        writer.writerow(row.values())
+        if buf.tell() >= CHUNK:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. PUBLIC API
+# ──────────────────────────────────────────────────────────────
+def iter_export(store: LogStore, flt: ExportFilter | None = None, *,
+                gzip: bool = False, archive: Path | None = None):
+    """Yield the (filtered) log as CSV bytes, archive partitions first."""
+    flt = flt or ExportFilter()
+    header = LOG_COLUMNS
+    if isinstance(store, CsvLogStore) and store.exists():
+        with store.path.open(newline="", encoding="utf-8") as f:
+            header = next(csv.reader([f.readline()]), None) or LOG_COLUMNS
+
+    def raw():
+        yield _csv_line(header)
+        if archive is not None and (Path(archive) / "manifest.json").exists():
+            yield from _from_archive(Path(archive), header, flt)
+        if isinstance(store, SqliteLogStore):
+            yield from _from_sqlite(store, flt)
+        elif store.exists():
+            yield from _from_csv(store.path, header, flt)
+
+    z = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None   # 31 = gzip framing
+    pending = []
+    size = 0
+    for piece in raw():
+        pending.append(piece)
+        size += len(piece)
+        if size >= CHUNK:
+            out = b"".join(pending)
+            pending, size = [], 0
+            out = z.compress(out) if z else out
+            if out:
+                yield out
+    out = b"".join(pending)
+    if z:
+        out = z.compress(out) + z.flush()
+    if out:
+        yield out
+
+
+def export_file(store: LogStore, flt: ExportFilter | None = None, *,
+                gzip: bool = False, archive: Path | None = None) -> io.RawIOBase:
+    """iter_export() written to an anonymous temp file, rewound – for st.download_button.
+
+    Streamlit copies a download's data into memory once; spooling the
+    chunks to disk (rather than b"".join()-ing them) keeps that the only copy.
+    """
+    f = tempfile.TemporaryFile(buffering=0)     # a raw file: download_button accepts RawIOBase
+    try:
+        for chunk in iter_export(store, flt, gzip=gzip, archive=archive):
+            f.write(chunk)
+    except BaseException:
+        f.close()
+        raise
+    f.seek(0)
+    return f
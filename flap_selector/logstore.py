@@ -0,0 +1,365 @@
+# flap_selector/logstore.py  –  storage backends for the usage log
+# -----------------------------------------------------------------
+# UsageLogWriter hands batches of row dicts to a LogStore.  Two backends:
+#   CsvLogStore     .data/usage_log.csv  (the original format)
+#   SqliteLogStore  .data/usage_log.db   (WAL, fixed schema, indexed)
+# open_store() picks one from the file suffix.
+import csv
+import io
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:                      # Windows dev boxes: no advisory lock
+    fcntl = None
+
+# column -> SQLite type; the order is also the CSV header order
+LOG_SCHEMA = {
+    "timestamp_utc": "TEXT", "loc": "TEXT", "kind": "TEXT", "depth": "TEXT",
+    "cm": "REAL", "hair": "INTEGER", "age": "INTEGER",
+    "patient_sex": "TEXT", "cancer_type": "TEXT", "margin_size_mm": "REAL",
+    "dia": "INTEGER", "smk": "INTEGER", "rad": "INTEGER",
+    "recommended_flap": "TEXT", "used_recommended": "INTEGER", "alt_flap_if_no": "TEXT",
+    "physician_name": "TEXT", "pgy_levels": "TEXT", "experience_level": "TEXT",
+    "algorithm_assist_recon_planning_q2": "TEXT",
+    "algorithm_assist_recon_planning_q3": "TEXT",
+    "final_comments_rationale": "TEXT",
+    "rule_id": "TEXT", "rules_version": "TEXT",
+    "alt_flap_canonical": "TEXT", "cancer_type_canonical": "TEXT",   # see vocab.py
+}
+LOG_COLUMNS = list(LOG_SCHEMA)
+BOOL_COLUMNS = {"hair", "dia", "smk", "rad", "used_recommended"}
+INDEXED = ("timestamp_utc", "loc", "recommended_flap")
+
+
+class LogStore:
+    """Append-only row store behind UsageLogWriter."""
+
+    def append_many(self, rows: list[dict], sync: bool = False) -> None:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def iter_rows(self):
+        """Yield every stored row as a dict of strings keyed by LOG_COLUMNS."""
+        raise NotImplementedError
+
+    def tail(self, cursor=None, limit: int | None = None):
+        """Rows stored since *cursor*: (columns, rows as lists of strings, cursor, reset).
+
+        Pass the returned cursor back to get only what was appended since;
+        None starts from the beginning.  reset is True when the store was
+        rewritten under the cursor (compaction, header upgrade) and the rows
+        start over from the beginning.  At most *limit* rows per call.
+        """
+        raise NotImplementedError
+
+    def export_csv(self, f) -> None:
+        """Write the whole log to text file *f* in the CSV log layout."""
+        writer = csv.DictWriter(f, fieldnames=LOG_COLUMNS, restval="", extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(self.iter_rows())
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def close(self) -> None:
+        pass
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. CSV
+# ──────────────────────────────────────────────────────────────
+class file_lock:
+    """Exclusive advisory lock on an open file for the duration of a block."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        if fcntl:
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self.f
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+
+
+class locked_log:
+    """Open *path* and hold file_lock on it, reopening if it was replaced meanwhile.
+
+    A rewrite of the log (CsvLogStore._upgrade) builds the new file beside
+    the old one and os.replace()s it in under the lock; whoever was waiting
+    on the old inode's lock notices here and locks the new file instead.
+    """
+
+    def __init__(self, path: Path, mode: str = "rb", **kwargs):
+        self.path, self.mode, self.kwargs = Path(path), mode, kwargs
+
+    def __enter__(self):
+        while True:
+            f = self.path.open(self.mode, **self.kwargs)
+            self.lock = file_lock(f)
+            self.lock.__enter__()
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    self.f = f
+                    return f
+            except FileNotFoundError:
+                pass
+            self.lock.__exit__()
+            f.close()
+
+    def __exit__(self, *exc):
+        self.lock.__exit__(*exc)
+        self.f.close()
+
+
+def replace_durably(tmp: Path, path: Path) -> None:
+    """os.replace() a fully written, fsynced *tmp* over *path*, then fsync the directory."""
+    os.replace(tmp, path)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def iter_records(f, start: int = 0):
+    """Yield (byte offset, raw bytes) of each CSV record in binary file *f*.
+
+    Free-text answers may contain quoted newlines, so a record ends at the
+    first newline where its double quotes balance.  A trailing record with
+    no final newline (a write in progress) is not yielded.
+    """
+    f.seek(start)
+    offset, buf, quotes = start, [], 0
+    for line in f:
+        buf.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0 and line.endswith(b"\n"):
+            rec = b"".join(buf)
+            yield offset, rec
+            offset += len(rec)
+            buf, quotes = [], 0
+
+
+class CsvLogStore(LogStore):
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+    def append_many(self, rows: list[dict], sync: bool = False) -> None:
+        while True:
+            with locked_log(self.path, "a+", newline="", encoding="utf-8") as f:
+                # header decided under the lock, so concurrent first writers agree
+                header = self._header(f)
+                if header is not None and header[:len(LOG_COLUMNS)] != LOG_COLUMNS:
+                    self._upgrade(f, header)
+                    continue                     # the file was replaced: append to the new one
+                f.seek(0, os.SEEK_END)
+                writer = csv.DictWriter(f, fieldnames=header or LOG_COLUMNS,
+                                        restval="", extrasaction="ignore")
+                if header is None:
+                    writer.writeheader()
+                writer.writerows(rows)
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+                return
+
+    @staticmethod
+    def _header(f) -> list[str] | None:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        f.seek(0)
+        return next(csv.reader([f.readline()]))
+
+    def _upgrade(self, f, header: list[str]) -> None:
+        """Rewrite a file whose header predates LOG_COLUMNS (caller holds the lock).
+
+        The upgraded copy is written and fsynced beside the log, then
+        replaces it: a crash or full disk midway leaves the old file intact.
+        """
+        new_header = LOG_COLUMNS + [c for c in header if c not in LOG_SCHEMA]
+        tmp = self.path.with_suffix(".upgrade.tmp")
+        f.seek(0)
+        try:
+            with tmp.open("w", newline="", encoding="utf-8") as out:
+                writer = csv.DictWriter(out, fieldnames=new_header, restval="",
+                                        extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(csv.DictReader(f))
+                out.flush()
+                os.fsync(out.fileno())
+            replace_durably(tmp, self.path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def count(self) -> int:
+        if not self.exists():
+            return 0
+        with self.path.open(newline="", encoding="utf-8") as f:
+            return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+    def iter_rows(self):
+        if not self.exists():
+            return
+        with self.path.open(newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+
+    _MARK = 32                           # bytes before the cursor that must not have moved
+
+    def tail(self, cursor=None, limit: int | None = None):
+        if not self.exists():
+            return [], [], None, cursor is not None
+        with self.path.open("rb") as f:
+            st = os.fstat(f.fileno())
+            reset = False
+            if cursor is not None:
+                ino, offset, mark, columns = cursor
+                f.seek(offset - len(mark))
+                if st.st_ino != ino or st.st_size < offset or f.read(len(mark)) != mark:
+                    cursor, reset = None, True
+                elif st.st_size == offset:
+                    return columns, [], cursor, False
+            records = iter_records(f, 0 if cursor is None else offset)
+            if cursor is None:
+                offset, header = next(records, (0, b""))
+                if not header:
+                    return [], [], None, reset
+                columns = next(csv.reader([header.decode("utf-8")]))
+                offset = len(header)
+            raw = []
+            for start, rec in records:
+                raw.append(rec)
+                offset = start + len(rec)
+                if limit is not None and len(raw) >= limit:
+                    break
+            f.seek(max(offset - self._MARK, 0))
+            mark = f.read(offset - f.tell())
+        rows = list(csv.reader(io.StringIO(b"".join(raw).decode("utf-8"), newline="")))
+        return columns, rows, (st.st_ino, offset, mark, columns), reset
+
+    def export_csv(self, f) -> None:
+        with self.path.open(newline="", encoding="utf-8") as src:
+            while block := src.read(1 << 20):
+                f.write(block)
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. SQLITE (WAL)
+# ──────────────────────────────────────────────────────────────
+_INSERT = (f"INSERT INTO usage_log ({', '.join(LOG_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * len(LOG_COLUMNS))})")
+
+
+def _to_sql(col: str, value):
+    """Coerce a row value (Python or CSV text) to the column's SQLite type."""
+    if value is None or value == "":
+        return None
+    if col in BOOL_COLUMNS:
+        return int(value == "True") if isinstance(value, str) else int(bool(value))
+    kind = LOG_SCHEMA[col]
+    try:
+        if kind == "INTEGER":
+            return int(float(value))
+        if kind == "REAL":
+            return float(value)
+    except ValueError:                   # hand-edited CSV cell: keep the text
+        pass
+    return str(value)
+
+
+def _from_sql(col: str, value) -> str:
+    """Inverse of _to_sql, rendering values the way the CSV log spells them."""
+    if value is None:
+        return ""
+    return str(bool(value)) if col in BOOL_COLUMNS else str(value)
+
+
+class SqliteLogStore(LogStore):
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._local = threading.local()
+        with self._conn() as con:
+            con.execute(f"CREATE TABLE IF NOT EXISTS usage_log "
+                        f"(id INTEGER PRIMARY KEY, "
+                        f"{', '.join(f'{c} {t}' for c, t in LOG_SCHEMA.items())})")
+            have = {row[1] for row in con.execute("PRAGMA table_info(usage_log)")}
+            for col, kind in LOG_SCHEMA.items():
+                if col not in have:       # table predates the column
+                    con.execute(f"ALTER TABLE usage_log ADD COLUMN {col} {kind}")
+            for col in INDEXED:
+                con.execute(f"CREATE INDEX IF NOT EXISTS ix_usage_log_{col} ON usage_log ({col})")
+            con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread: the writer thread inserts, script threads read
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def append_many(self, rows: list[dict], sync: bool = False) -> None:
+        con = self._conn()
+        with con:
+            con.executemany(_INSERT, ([_to_sql(c, r.get(c)) for c in LOG_COLUMNS] for r in rows))
+        if sync:
+            con.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM usage_log").fetchone()[0]
+
+    def iter_rows(self, where: str = "", args=()):
+        """Like LogStore.iter_rows, optionally restricted by an SQL WHERE clause."""
+        cur = self._conn().execute(f"SELECT {', '.join(LOG_COLUMNS)} FROM usage_log "
+                                   f"{'WHERE ' + where if where else ''} ORDER BY id", args)
+        for values in cur:
+            yield {c: _from_sql(c, v) for c, v in zip(LOG_COLUMNS, values)}
+
+    def tail(self, cursor=None, limit: int | None = None):
+        """As LogStore.tail; the cursor is the last row id seen."""
+        cur = self._conn().execute(
+            f"SELECT id, {', '.join(LOG_COLUMNS)} FROM usage_log WHERE id > ? ORDER BY id"
+            + ("" if limit is None else f" LIMIT {int(limit)}"), (cursor or 0,))
+        fetched = cur.fetchall()
+        rows = [[_from_sql(c, v) for c, v in zip(LOG_COLUMNS, values)] for _, *values in fetched]
+        return list(LOG_COLUMNS), rows, fetched[-1][0] if fetched else cursor, False
+
+    def migrate_from_csv(self, csv_path: Path, batch: int = 5_000) -> int:
+        """One-shot import of an existing CSV log; returns rows copied (0 if done before)."""
+        con = self._conn()
+        key = f"migrated:{Path(csv_path).resolve()}"
+        if con.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone():
+            return 0
+        n = 0
+        with con, Path(csv_path).open(newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            while chunk := [r for _, r in zip(range(batch), reader)]:
+                con.executemany(_INSERT, ([_to_sql(c, r.get(c)) for c in LOG_COLUMNS] for r in chunk))
+                n += len(chunk)
+            con.execute("INSERT INTO meta VALUES (?, ?)", (key, str(n)))
+        return n
+
+    def close(self) -> None:
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+
+def open_store(path) -> LogStore:
+    """SQLite for *.db / *.sqlite, CSV otherwise."""
+    path = Path(path)
+    return SqliteLogStore(path) if path.suffix in (".db", ".sqlite") else CsvLogStore(path)
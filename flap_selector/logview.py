@@ -0,0 +1,144 @@
+# flap_selector/logview.py  –  shared in-memory view of the usage log
+# -----------------------------------------------------------------
+# LogView keeps the store's tail cursor (byte offset for the CSV log, last
+# row id for SQLite) and on refresh() parses only what was appended since.
+# New rows wait as plain string lists and are folded into a typed chunk
+# (categoricals, nullable booleans – compact._typed) only when frame() is
+# asked for, so count() never imports pandas however much was appended.
+# A rewrite under the cursor (compaction, header upgrade) makes the store
+# report a reset and the view starts over under a new generation.
+#
+# Rows compaction moved into the Parquet archive (compact.py) are still
+# part of the log: count() adds the manifest's per-part row counts (a JSON
+# read when manifest.json changes, still no pandas) and frame() prepends the
+# archived months, read once per compaction.  Between compact() saving the
+# manifest and shifting the CSV tail a count may include the moved rows
+# twice; the next refresh sees the reset and corrects it.
+import json
+import os
+import threading
+from pathlib import Path
+
+CHUNK_ROWS = 50_000
+
+
+class LogView:
+    """Incrementally loaded copy of *store*, safe to share between sessions."""
+
+    def __init__(self, store, chunk_rows: int = CHUNK_ROWS, archive: Path | None = None):
+        self.store, self.chunk_rows = store, chunk_rows
+        self.archive = Path(archive) if archive is not None else None
+        self._manifest_key = None             # (mtime, size) of the manifest last read
+        self._archived = 0                    # rows in the archive, from the manifest
+        self._archive_frame = None            # archived months, read on first frame()
+        self._whole = None                    # ((archive key, generation, tail rows), frame)
+        self._generation = 0                  # bumped whenever the tail starts over
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._columns: list[str] = []
+        self._pending: list[list[str]] = []
+        self._chunks: list = []               # typed DataFrames, oldest first
+        self._rows = 0
+
+    def refresh(self) -> int:
+        """Read rows appended since the last call; returns how many were new."""
+        with self._lock:
+            new = 0
+            while True:
+                columns, rows, cursor, reset = self.store.tail(self._cursor, self.chunk_rows)
+                if reset or columns != self._columns:
+                    self._pending, self._chunks, self._rows = [], [], 0
+                    self._columns, new = columns, 0
+                    self._generation += 1
+                self._cursor = cursor
+                self._pending.extend(rows)
+                self._rows += len(rows)
+                new += len(rows)
+                if len(rows) < self.chunk_rows:
+                    return new
+
+    def count(self) -> int:
+        """Rows in the log – archive included – after picking up any appended ones."""
+        self.refresh()
+        with self._lock:
+            self._check_archive()
+            return self._archived + self._rows
+
+    def frame(self):
+        """The whole log, archive included, as one typed DataFrame (shared – do not modify it)."""
+        self.refresh()
+        with self._lock:
+            self._fold()
+            if len(self._chunks) > 1:
+                self._chunks = [_concat(self._chunks)]
+            self._check_archive()
+            if self._archived:
+                return self._with_archive()
+            if not self._chunks:
+                import pandas as pd
+
+                from .logstore import LOG_COLUMNS
+                return pd.DataFrame(columns=self._columns or LOG_COLUMNS)
+            return self._chunks[0]
+
+    def _check_archive(self) -> None:
+        """Re-read the manifest's row counts if compaction changed it (caller holds the lock)."""
+        if self.archive is None:
+            return
+        path = self.archive / "manifest.json"
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            key = None
+        else:
+            key = (st.st_mtime_ns, st.st_size)
+        if key == self._manifest_key:
+            return
+        manifest = json.loads(path.read_text()) if key else {"partitions": {}}
+        self._archived = sum(entry["rows"] for files in manifest["partitions"].values()
+                             for entry in files)
+        self._manifest_key, self._archive_frame, self._whole = key, None, None
+
+    def _with_archive(self):
+        """Archived months + the tail chunk, cached until either changes (caller holds the lock)."""
+        key = (self._manifest_key, self._generation, self._rows)
+        if self._whole is not None and self._whole[0] == key:
+            return self._whole[1]
+        import pandas as pd
+
+        from .compact import CATEGORICAL, read_log
+        if self._archive_frame is None:
+            self._archive_frame = read_log(archive=self.archive, include_tail=False)
+        df = pd.concat([self._archive_frame, *self._chunks], ignore_index=True)
+        for col in CATEGORICAL:                 # concat drops mismatched categories
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+        self._whole = (key, df)
+        return df
+
+    def _fold(self) -> None:
+        """Pending string rows -> one typed chunk (caller holds the lock)."""
+        if not self._pending:
+            return
+        import pandas as pd
+
+        from .compact import _typed
+        width = len(self._columns)
+        rows = [r if len(r) == width else (r + [""] * width)[:width] for r in self._pending]
+        self._chunks.append(_typed(pd.DataFrame(rows, columns=self._columns, dtype=str)))
+        self._pending = []
+
+
+def _concat(chunks: list):
+    """Concatenate typed chunks, keeping categoricals categorical."""
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    out = {}
+    for col in chunks[0].columns:
+        parts = [c[col] for c in chunks]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            out[col] = pd.Series(union_categoricals(parts), name=col)
+        else:
+            out[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(out)
@@ -0,0 +1,78 @@
+# flap_selector/memo.py  –  memoised decide() over canonical inputs
+# -----------------------------------------------------------------
+# decide() sees cm only through its size category and age only through
+# three bands, so every case maps onto one of key_space() canonical keys
+# (engine.canonical_key).  DecisionTable serves results from a bounded LRU
+# over those keys; Recommendation is frozen, so one instance can be shared
+# by every session.  app.py keeps a single table in st.cache_resource.
+# Entries are keyed on the RuleSet too, and the table empties itself when
+# engine.current_rules() hot-reloads a new one.
+import itertools
+from functools import lru_cache
+
+from .engine import AGE_REP, DEPTH_OPTS, KINDS, SIZES, Recommendation, RuleSet, current_rules
+
+# kind (+ "other") x size x depth class x hair x age band x dia x smk x rad, per sub-unit
+KEYS_PER_LOC = (len(KINDS) + 1) * len(SIZES) * len(DEPTH_OPTS) * 2 * len(AGE_REP) * 2 * 2 * 2
+
+
+def key_space(rules: RuleSet | None = None) -> int:
+    """Number of canonical keys under *rules* (default: the live rules)."""
+    return len((rules or current_rules()).subunits) * KEYS_PER_LOC
+
+
+def all_keys(rules: RuleSet | None = None):
+    """Every canonical key under *rules* (default: the live rules), in a stable order."""
+    bools = (False, True)
+    rules = rules or current_rules()
+    return itertools.product(rules.subunits, KINDS + [""], SIZES, range(len(DEPTH_OPTS)),
+                             bools, range(len(AGE_REP)), bools, bools, bools)
+
+
+def _decide_key(rules: RuleSet, key: tuple) -> Recommendation:
+    return rules.decide_key(key)
+
+
+class DecisionTable:
+    """decide() with the same signature, backed by an LRU of canonical keys.
+
+    *maxsize* defaults to unbounded – the key space is finite (key_space())
+    and the table is emptied on every rules reload; pass something smaller
+    to bound memory, or call precompute() to fill it.  *hits* (a
+    telemetry.RuleHits) is told the rule id of every answer, cached or not.
+    """
+
+    def __init__(self, maxsize: int | None = None, hits=None):
+        self._lookup = lru_cache(maxsize=maxsize)(_decide_key)
+        self._rules = None
+        self.hits = hits
+
+    def decide(self, loc, kind, cm, depth, hair, age, dia, smk, rad) -> Recommendation:
+        rules = current_rules()
+        if rules is not self._rules:      # first call, or the rules file was reloaded
+            self._lookup.cache_clear()
+            self._rules = rules
+        rec = self._lookup(rules, rules.canonical_key(loc, kind, cm, depth, hair, age, dia, smk, rad))
+        if self.hits is not None:
+            self.hits.record(rec.rule_id, rec.rules_version)
+        return rec
+
+    __call__ = decide
+
+    def precompute(self) -> int:
+        """Fill the table with every key (about 0.2 s); returns the number of entries."""
+        rules = self._rules = current_rules()
+        self._lookup.cache_clear()
+        for key in all_keys(rules):
+            self._lookup(rules, key)
+        return self._lookup.cache_info().currsize
+
+    def stats(self) -> dict:
+        info = self._lookup.cache_info()
+        calls = info.hits + info.misses
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize,
+                "maxsize": info.maxsize, "hit_rate": info.hits / calls if calls else None,
+                "rules_version": self._rules.version if self._rules else None}
+
+    def clear(self) -> None:
+        self._lookup.cache_clear()
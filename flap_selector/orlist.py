@@ -0,0 +1,143 @@
+# flap_selector/orlist.py  –  a whole OR / Mohs list in one submission
+# -----------------------------------------------------------------
+# app.py's "OR list" entry mode.  The surgeon fills one editable table of
+# cases (one row per defect), decide_batch() scores the whole table in a
+# single call, and the per-case feedback table comes back as one list of
+# usage-log rows for UsageLogWriter.submit_many() – one append_many(), so
+# one lock hold on the CSV or one SQLite transaction per list instead of
+# one per case.  Rows are laid out exactly like the single-case form's.
+import math
+
+import pandas as pd
+
+from .aggregates import Q2_SCALE, Q3_SCALE
+from .batch import decide_batch
+from .engine import DEPTH_OPTS, KINDS, RuleSet, current_rules
+
+MAX_CASES = 60
+CM_RANGE = (0.1, 25.0)                   # same bounds as the single-case form
+AGE_RANGE = (0, 120)
+MARGIN_RANGE = (0.0, 50.0)
+SEXES = ["Male", "Female", "Other"]
+
+# case column -> value of a cell left empty (None: the column is required)
+CASE_DEFAULTS = {
+    "loc": None, "kind": "Oncologic", "depth": None, "cm": None, "age": None,
+    "hair": True, "patient_sex": "", "cancer_type": "", "margin_size_mm": 0.0,
+    "dia": False, "smk": False, "rad": False,
+}
+FEEDBACK_DEFAULTS = {
+    "used_recommended": True, "alt_flap_if_no": "",
+    "algorithm_assist_recon_planning_q2": "", "algorithm_assist_recon_planning_q3": "",
+    "final_comments_rationale": "",
+}
+_TEXT = {"loc", "kind", "depth", "patient_sex", "cancer_type"}
+_FLAGS = {"hair", "dia", "smk", "rad"}
+
+
+def blank_list() -> pd.DataFrame:
+    """Empty case table with the editor's column types."""
+    dtypes = {c: "object" if c in _TEXT else "bool" if c in _FLAGS else "float"
+              for c in CASE_DEFAULTS}
+    return pd.DataFrame({c: pd.Series(dtype=t) for c, t in dtypes.items()})
+
+
+def _empty(value) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)) \
+        or (isinstance(value, str) and not value.strip())
+
+
+def clean_cases(edited: pd.DataFrame, rules: RuleSet | None = None) -> tuple[pd.DataFrame, list[str]]:
+    """(typed cases, problems) from the edited table; rows left entirely blank are dropped.
+
+    Problems name the case by its position in the list ("Case 3: …").
+    """
+    rules = rules or current_rules()
+    records, problems = [], []
+    for case in edited.to_dict("records"):
+        if all(_empty(case.get(c)) for c in ("loc", "depth", "cm", "age")):
+            continue
+        n = len(records) + 1
+        row = {c: d if _empty(case.get(c)) else case[c] for c, d in CASE_DEFAULTS.items()}
+        missing = [c for c, v in row.items() if v is None]
+        if missing:
+            problems.append(f"Case {n}: fill in {', '.join(missing)}")
+        elif row["loc"] not in rules.thr:
+            problems.append(f"Case {n}: unknown sub-unit {row['loc']!r}")
+        elif row["kind"] not in KINDS or row["depth"] not in DEPTH_OPTS:
+            problems.append(f"Case {n}: defect type or depth not one of the listed options")
+        elif row["patient_sex"] not in SEXES + [""]:
+            problems.append(f"Case {n}: patient sex must be one of {SEXES}")
+        else:
+            for field, (lo, hi) in (("cm", CM_RANGE), ("age", AGE_RANGE),
+                                    ("margin_size_mm", MARGIN_RANGE)):
+                if not lo <= float(row[field]) <= hi:
+                    problems.append(f"Case {n}: {field} must be between {lo} and {hi}")
+        records.append(row)
+    if len(records) > MAX_CASES:
+        problems.append(f"At most {MAX_CASES} cases per list ({len(records)} entered)")
+    cases = pd.DataFrame(records, columns=list(CASE_DEFAULTS))
+    if not problems:
+        cases = cases.astype({"cm": float, "age": int, "margin_size_mm": float,
+                              **{c: bool for c in _FLAGS}})
+        cases["cancer_type"] = cases["cancer_type"].str.strip()
+    return cases, problems
+
+
+def score_cases(cases: pd.DataFrame, hits=None, rules: RuleSet | None = None) -> pd.DataFrame:
+    """decide_batch() over the whole list; *hits* (a telemetry.RuleHits) counts each answer."""
+    recs = decide_batch(cases, rules)
+    if hits is not None:
+        for rule_id, version in zip(recs["rule_id"].astype(str), recs["rules_version"].astype(str)):
+            hits.record(rule_id, version)
+    return recs
+
+
+def feedback_table(cases: pd.DataFrame, recs: pd.DataFrame) -> pd.DataFrame:
+    """One editable feedback row per case, headed by the case and its recommendation."""
+    table = pd.DataFrame({
+        "case": [f"{loc} · {cm:g} cm · {depth.split()[0]}"
+                 for loc, cm, depth in zip(cases["loc"], cases["cm"], cases["depth"])],
+        "recommended_flap": recs["flap"].astype(str).to_numpy(),
+    }, index=cases.index)
+    for col, default in FEEDBACK_DEFAULTS.items():
+        table[col] = default
+    return table
+
+
+def log_rows(cases: pd.DataFrame, recs: pd.DataFrame, feedback: pd.DataFrame, shared: dict,
+             timestamp: str) -> tuple[list[dict], list[str]]:
+    """(usage-log rows, problems) for a scored list and its edited feedback table.
+
+    *shared* holds the answers given once per list: physician_name,
+    pgy_levels (a list) and experience_level.
+    """
+    rows, problems = [], []
+    per_list = {"physician_name": shared.get("physician_name", "").strip(),
+                "pgy_levels": "|".join(shared.get("pgy_levels", [])),
+                "experience_level": shared.get("experience_level", "")}
+    for n, (case, rec, fb) in enumerate(zip(cases.to_dict("records"), recs.to_dict("records"),
+                                            feedback.to_dict("records")), start=1):
+        fb = {c: d if _empty(fb.get(c)) else fb[c] for c, d in FEEDBACK_DEFAULTS.items()}
+        used, alt = bool(fb["used_recommended"]), str(fb["alt_flap_if_no"]).strip()
+        if not used and not alt:
+            problems.append(f"Case {n}: tell us which flap you used")
+        q2, q3 = fb["algorithm_assist_recon_planning_q2"], fb["algorithm_assist_recon_planning_q3"]
+        if q2 not in Q2_SCALE + [""] or q3 not in Q3_SCALE + [""]:
+            problems.append(f"Case {n}: answer the algorithm questions from the listed options")
+        rows.append({
+            "timestamp_utc": timestamp,
+            "loc": case["loc"], "kind": case["kind"], "depth": case["depth"].split()[0],
+            "cm": case["cm"], "hair": case["hair"], "age": case["age"],
+            "patient_sex": case["patient_sex"], "cancer_type": case["cancer_type"],
+            "margin_size_mm": case["margin_size_mm"],
+            "dia": case["dia"], "smk": case["smk"], "rad": case["rad"],
+            "recommended_flap": str(rec["flap"]),
+            "rule_id": str(rec["rule_id"]), "rules_version": str(rec["rules_version"]),
+            "used_recommended": used, "alt_flap_if_no": alt,
+            **per_list,
+            "algorithm_assist_recon_planning_q2": q2,
+            "algorithm_assist_recon_planning_q3": q3,
+            "final_comments_rationale": str(fb["final_comments_rationale"]).strip(),
+        })
+    return rows, problems
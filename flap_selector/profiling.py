@@ -0,0 +1,210 @@
+# flap_selector/profiling.py  –  per-rerun stage timings, Prometheus text out
+# -----------------------------------------------------------------
+#   FLAP_PROFILE=1             stage histograms -> .data/metrics.prom
+#   FLAP_PROFILE=cprofile      … plus one cProfile dump per rerun in .data/profiles/
+#   FLAP_PROFILE=pyinstrument  … plus one pyinstrument HTML per rerun (if installed)
+#   FLAP_METRICS_PATH=…        where the textfile goes (node_exporter textfile dir)
+#
+# app.py opens a RerunTimer at the top of the script and calls lap(name)
+# after each section; stage(name) times a nested span.  A click inside an
+# st.fragment reruns only that function, never reaching the script's
+# done(), so each fragment body opens its own fragment_run(name) and calls
+# done() at its end.  When FLAP_PROFILE is unset all three return shared
+# no-op objects, so the cost is one call each.
+import cProfile
+import os
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from .usagelog import DATA_PATH
+
+MODE = os.environ.get("FLAP_PROFILE", "").strip().lower()
+ENABLED = MODE not in ("", "0", "off", "false")
+METRICS_PATH = Path(os.environ.get("FLAP_METRICS_PATH", DATA_PATH.parent / "metrics.prom"))
+PROFILE_DIR = DATA_PATH.parent / "profiles"
+WRITE_INTERVAL = 5.0                     # seconds between textfile rewrites
+
+# seconds; Prometheus-style cumulative "le" buckets
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+
+
+class StageMetrics:
+    """Thread-safe histogram per stage name."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages: dict[str, list] = {}           # name -> [bucket counts, sum, count]
+        self._written = 0.0
+
+    def observe(self, stage: str, seconds: float) -> None:
+        i = next(i for i, b in enumerate(self.buckets) if seconds <= b)
+        with self._lock:
+            h = self._stages.get(stage)
+            if h is None:
+                h = self._stages[stage] = [[0] * len(self.buckets), 0.0, 0]
+            h[0][i] += 1
+            h[1] += seconds
+            h[2] += 1
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = ["# HELP flap_stage_seconds Wall time per named stage.",
+                 "# TYPE flap_stage_seconds histogram"]
+        with self._lock:
+            stages = {k: (list(v[0]), v[1], v[2]) for k, v in sorted(self._stages.items())}
+        for name, (counts, total, n) in stages.items():
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            seen = 0
+            for b, c in zip(self.buckets, counts):
+                seen += c
+                le = "+Inf" if b == float("inf") else repr(b)
+                lines.append(f'flap_stage_seconds_bucket{{stage="{label}",le="{le}"}} {seen}')
+            lines.append(f'flap_stage_seconds_sum{{stage="{label}"}} {total:.6f}')
+            lines.append(f'flap_stage_seconds_count{{stage="{label}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path = METRICS_PATH, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._written < WRITE_INTERVAL:
+            return
+        self._written = now
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
+
+
+METRICS = StageMetrics()
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. SPANS & RERUN TIMER
+# ──────────────────────────────────────────────────────────────
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        METRICS.observe(self.name, time.perf_counter() - self.t0)
+
+
+_NULL_SPAN = nullcontext()
+
+
+def stage(name: str):
+    """Context manager timing one span under *name* (no-op when disabled)."""
+    return _Span(name) if ENABLED else _NULL_SPAN
+
+
+def _start_profiler():
+    if MODE == "cprofile":
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:               # 3.12+: another session's rerun is being profiled
+            return None
+        return prof
+    if MODE == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            return None
+        prof = Profiler()
+        prof.start()
+        return prof
+    return None
+
+
+def _save_profile(prof) -> None:
+    PROFILE_DIR.mkdir(exist_ok=True, parents=True)
+    stem = PROFILE_DIR / f"rerun-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}"
+    if isinstance(prof, cProfile.Profile):
+        prof.disable()
+        prof.dump_stats(f"{stem}.prof")
+    else:
+        prof.stop()
+        Path(f"{stem}.html").write_text(prof.output_html())
+
+
+class RerunTimer:
+    """Lap timer over one script run; done() records the total."""
+
+    _active = threading.local()          # Streamlit runs each session's script in its own thread
+
+    def __init__(self):
+        stale = getattr(self._active, "timer", None)
+        if stale is not None:            # previous run ended in st.stop() / st.rerun()
+            stale._discard()
+        self._active.timer = self
+        self.profiler = _start_profiler()
+        self.t0 = self.last = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter()
+        METRICS.observe(name, now - self.last)
+        self.last = now
+
+    def done(self) -> None:
+        METRICS.observe("rerun", time.perf_counter() - self.t0)
+        self._active.timer = None
+        if self.profiler is not None:
+            _save_profile(self.profiler)
+        METRICS.write_textfile()
+
+    def _discard(self) -> None:
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.disable()
+        elif self.profiler is not None:
+            self.profiler.stop()
+
+
+class FragmentTimer:
+    """Lap timer over one fragment run; done() records it as "fragment:<name>".
+
+    No profiler and no thread-local: a fragment also runs inside the full
+    script run, whose RerunTimer must stay the active one.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.t0 = self.last = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        now = time.perf_counter()
+        METRICS.observe(name, now - self.last)
+        self.last = now
+
+    def done(self) -> None:
+        METRICS.observe(f"fragment:{self.name}", time.perf_counter() - self.t0)
+        METRICS.write_textfile()
+
+
+class _NoTimer:
+    def lap(self, name: str) -> None:
+        pass
+
+    def done(self) -> None:
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def rerun():
+    """Start timing a script run (a shared no-op when FLAP_PROFILE is unset)."""
+    return RerunTimer() if ENABLED else _NO_TIMER
+
+
+def fragment_run(name: str):
+    """Start timing one run of the st.fragment *name* (a shared no-op when FLAP_PROFILE is unset)."""
+    return FragmentTimer(name) if ENABLED else _NO_TIMER
@@ -0,0 +1,106 @@
+# flap_selector/rescore.py  –  what a rules edit would change in the logged history
+# -----------------------------------------------------------------
+#   python -m flap_selector rescore new_rules.json --out diff.csv
+#   python -m flap_selector rescore new.json --base old.json --rows changed.csv
+#
+# The flap part of a canonical decision key is (sub-unit, depth class, size,
+# hair), and size is cm against the sub-unit's THR.  So per sub-unit every
+# logged case reduces to a (depth class, hair, cm) key – a few hundred
+# distinct keys however long the log is.  A sub-unit whose THR and cells are
+# identical in both rule sets is skipped outright; otherwise each distinct
+# key is decided once under each rule set and only rows whose key changed
+# flap are counted.  Sub-units are diffed in parallel processes.
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .engine import DEPTH_KEYS, SIZES, RuleSet, _depth_class, current_rules
+from .sweep import _map_unique
+from .sweep import load_cases as _load_cases
+from .usagelog import ARCHIVE_DIR, DATA_PATH
+
+LOG_FIELDS = ["timestamp_utc", "loc", "depth", "cm", "hair", "recommended_flap",
+              "rules_version"]
+
+REMOVED = "(sub-unit removed)"
+
+
+def changed_subunits(old: RuleSet, new: RuleSet) -> list[str]:
+    """Sub-units of *old* whose THR or any flap cell differs in *new* (or is gone)."""
+    out = []
+    for loc in old.subunits:
+        if loc not in new.thr:
+            out.append(loc)
+            continue
+        cells = [(loc, d, s, h) for d in range(len(DEPTH_KEYS)) for s in SIZES
+                 for h in (False, True)]
+        if old.thr[loc] != new.thr[loc] or any(old.cells[c][1] != new.cells[c][1] for c in cells):
+            out.append(loc)
+    return out
+
+
+def _flap(rules: RuleSet, loc: str, depth: int, hair: bool, cm: float) -> str:
+    if loc not in rules.thr:
+        return REMOVED
+    return rules.cells[loc, depth, rules.size(loc, cm), hair][1]
+
+
+def _diff_one(args) -> tuple[dict, pd.DataFrame]:
+    loc, rows, old, new = args
+    cm = pd.to_numeric(rows["cm"], errors="coerce").to_numpy(dtype=float)
+    depth = _map_unique(rows["depth"].astype(object).to_numpy(), _depth_class)
+    hair = rows["hair"].astype(str).eq("True").to_numpy()
+    # distinct (depth, hair, cm) keys; NaN cm -> inf, "large" either way as in _cat
+    cm = np.where(np.isnan(cm), np.inf, cm)
+    inverse, keys = pd.factorize(pd.MultiIndex.from_arrays([depth, hair, cm]))
+    was = [_flap(old, loc, int(d), bool(h), c) for d, h, c in keys]
+    now = [_flap(new, loc, int(d), bool(h), c) for d, h, c in keys]
+    was, now = np.array(was, dtype=object), np.array(now, dtype=object)
+    changed_key = was != now
+    hit = changed_key[inverse]
+    logged = rows["recommended_flap"].astype(object).fillna("").to_numpy()
+    before, after = was[inverse][hit], now[inverse][hit]
+    moves = pd.Series(list(zip(before, after)), dtype=object).value_counts()
+    summary = {
+        "loc": loc, "cases": len(rows), "keys": len(keys),
+        "changed_keys": int(changed_key.sum()), "changed_cases": int(hit.sum()),
+        "now_differ_from_logged": int((after != logged[hit]).sum()),
+        "top_change": (f"{moves.index[0][0]} -> {moves.index[0][1]} ({moves.iloc[0]:,})"
+                       if len(moves) else ""),
+    }
+    changed = rows[hit].assign(old_flap=before, new_flap=after)
+    return summary, changed
+
+
+def rescore(df: pd.DataFrame, new: RuleSet, old: RuleSet | None = None,
+            workers: int | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(per-sub-unit report, changed rows) for moving the logged cases from *old* to *new*.
+
+    *old* defaults to the live rules.  Sub-units with no change between the
+    two rule sets are reported with zero changes and never evaluated.
+    """
+    old = old or current_rules()
+    touched = set(changed_subunits(old, new))
+    df = df[df["loc"].isin(old.thr)]
+    groups = dict(tuple(df.groupby("loc", sort=False, observed=True)))
+    jobs = [(loc, groups[loc], old, new) for loc in old.subunits if loc in touched and loc in groups]
+    if workers == 0 or len(jobs) < 2:
+        parts = [_diff_one(j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_diff_one, jobs))
+    done = {s["loc"]: s for s, _ in parts}
+    report = pd.DataFrame([
+        done.get(loc) or {"loc": loc, "cases": len(groups.get(loc, ())), "keys": 0,
+                          "changed_keys": 0, "changed_cases": 0, "now_differ_from_logged": 0,
+                          "top_change": ""}
+        for loc in old.subunits])
+    changed = pd.concat([c for _, c in parts], ignore_index=False) if parts else df.iloc[:0]
+    return report, changed
+
+
+def load_cases(log: Path = DATA_PATH, archive: Path = ARCHIVE_DIR) -> pd.DataFrame:
+    """The columns rescore() needs, from the whole history."""
+    return _load_cases(log, archive, fields=LOG_FIELDS)
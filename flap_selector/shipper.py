@@ -0,0 +1,368 @@
+# flap_selector/shipper.py  –  ship the usage log off the container, incrementally
+# -----------------------------------------------------------------
+#   FLAP_SHIP_URL=s3://bucket/prefix  [FLAP_SHIP_ENDPOINT=http://minio:9000]
+#   FLAP_SHIP_URL=file:///mnt/backup      (a mounted volume, or for testing)
+#   python -m flap_selector ship --once   (cron / CI; app.py runs it in a thread)
+#
+# The log is cut into segments: the bytes appended since the checkpoint are
+# sealed once they reach SEGMENT_BYTES or the oldest has waited
+# SEGMENT_SECONDS, gzip-compressed with the CSV header in front (each object
+# stands alone) and spooled to .data/outbox/.  Only then does the checkpoint
+# advance, and spooled segments are uploaded in batches and deleted – so a
+# crash at any point re-sends a segment under the same key, never skips one.
+# Every key carries the checkpoint's run id (created with the checkpoint), so
+# a redeploy that starts from a fresh checkpoint never overwrites objects an
+# earlier one shipped.  A round holds ship_checkpoint.lock: app.py's thread
+# and a cron `ship --once` take turns, each starting from the other's
+# checkpoint.
+# Compaction shifts the CSV tail down by the bytes it removed (recorded in
+# the archive manifest); the checkpoint follows, and the Parquet parts are
+# shipped too, so rows compacted before they were shipped are still covered.
+# A SQLite log is shipped by row id.  Nothing here runs on the request path.
+import atexit
+import binascii
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+from .logstore import CsvLogStore, SqliteLogStore, file_lock, iter_records, locked_log, open_store
+from .usagelog import ARCHIVE_DIR, DATA_DIR, DATA_PATH
+
+SEGMENT_BYTES = 8 << 20                  # uncompressed log bytes per segment
+SEGMENT_SECONDS = 300.0                  # …or seal whatever is pending after this long
+POLL_SECONDS = 5.0
+UPLOAD_BATCH = 16                        # spooled segments per round
+UPLOAD_THREADS = 4
+CHECKPOINT_PATH = DATA_DIR / "ship_checkpoint.json"
+OUTBOX_DIR = DATA_DIR / "outbox"
+_MARK = 32                               # bytes before the offset that must not have moved
+
+log = logging.getLogger(__name__)
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. TARGETS
+# ──────────────────────────────────────────────────────────────
+class S3Target:
+    """Any S3-compatible bucket (AWS, MinIO, …); needs boto3."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str | None = None,
+                 **client_kwargs):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("shipping to S3 needs boto3:  pip install boto3") from None
+        self.bucket, self.prefix = bucket, prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, **client_kwargs)
+
+    def put(self, key: str, body: bytes, content_type: str) -> None:
+        key = f"{self.prefix}/{key}" if self.prefix else key
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type)
+
+    def __repr__(self) -> str:
+        return f"S3Target(s3://{self.bucket}/{self.prefix})"
+
+
+class DirTarget:
+    """A directory standing in for a bucket (mounted volume, local testing)."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def put(self, key: str, body: bytes, content_type: str) -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+
+    def __repr__(self) -> str:
+        return f"DirTarget({self.root})"
+
+
+def target_from_url(url: str, endpoint_url: str | None = None):
+    """s3://bucket/prefix -> S3Target, file:///path (or a bare path) -> DirTarget."""
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        return S3Target(parsed.netloc, parsed.path, endpoint_url=endpoint_url)
+    if parsed.scheme in ("", "file"):
+        return DirTarget(Path(parsed.path if parsed.scheme else url))
+    raise ValueError(f"unsupported ship target {url!r} (use s3:// or file://)")
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. SHIPPER
+# ──────────────────────────────────────────────────────────────
+class LogShipper:
+    """Seal, spool and upload the log (and its Parquet archive) to *target*.
+
+    run_once() does one round; start() runs rounds every POLL_SECONDS on a
+    daemon thread, and close() seals and uploads whatever is left.
+    """
+
+    def __init__(self, target, log_path: Path = DATA_PATH, archive: Path = ARCHIVE_DIR, *,
+                 source: str | None = None, checkpoint: Path = CHECKPOINT_PATH,
+                 outbox: Path = OUTBOX_DIR, segment_bytes: int = SEGMENT_BYTES,
+                 segment_seconds: float = SEGMENT_SECONDS, poll: float = POLL_SECONDS):
+        self.target = target
+        self.store = open_store(log_path)
+        self.archive = Path(archive)
+        self.source = source or os.environ.get("FLAP_SHIP_SOURCE") or socket.gethostname()
+        self.checkpoint_path, self.outbox = Path(checkpoint), Path(outbox)
+        self.lock_path = self.checkpoint_path.with_suffix(".lock")
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        self.outbox.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes, self.segment_seconds, self.poll = segment_bytes, segment_seconds, poll
+        self.state = self._load_checkpoint()
+        self._pending_since = None               # monotonic time unshipped bytes were first seen
+        self._lock = threading.Lock()            # one round at a time (lock_path: across processes)
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"segments": 0, "uploaded": 0, "bytes_in": 0, "bytes_out": 0,
+                      "archive_parts": 0, "errors": 0}
+
+    # ── checkpoint ───────────────────────────────────────────
+    def _load_checkpoint(self) -> dict:
+        try:
+            return json.loads(self.checkpoint_path.read_text())
+        except FileNotFoundError:
+            return {"version": 1, "seq": 0, "inode": None, "offset": 0, "mark": "",
+                    "compactions": 0, "last_id": 0, "archive": {}}
+
+    def _resume(self) -> None:
+        """Pick up the checkpoint another process may have moved; called holding lock_path."""
+        self.state = self._load_checkpoint()
+        if "run" not in self.state:              # new (or pre-run-id) checkpoint: keys of its own
+            stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+            self.state["run"] = f"{stamp}-{os.urandom(3).hex()}"
+            self._save_checkpoint()
+
+    def _save_checkpoint(self) -> None:
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            json.dump(self.state, f, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    # ── sealing ──────────────────────────────────────────────
+    def _due(self, pending: int, force: bool) -> bool:
+        if pending <= 0:
+            self._pending_since = None
+            return False
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        return (force or pending >= self.segment_bytes
+                or time.monotonic() - self._pending_since >= self.segment_seconds)
+
+    def _spool(self, header: bytes, body: bytes, first_offset: str) -> None:
+        seq = self.state["seq"]
+        name = f"{self.state['run']}-{seq:010d}.csv.gz"
+        data = gzip.compress(header + body, compresslevel=6, mtime=0)
+        tmp = self.outbox / f".{name}.tmp"
+        with tmp.open("wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.outbox / name)      # spooled first, checkpoint second
+        self.state["seq"] = seq + 1
+        self.stats["segments"] += 1
+        self.stats["bytes_in"] += len(body)
+        self.stats["bytes_out"] += len(data)
+        log.info("sealed log segment %s (%d bytes from %s, %d gzipped)",
+                 name, len(body), first_offset, len(data))
+
+    def _manifest(self) -> dict:
+        # compact.load_manifest without importing pandas into the server process
+        try:
+            return json.loads((self.archive / "manifest.json").read_text())
+        except FileNotFoundError:
+            return {"partitions": {}, "compactions": []}
+
+    def _follow_compactions(self, header_len: int) -> None:
+        """Shift the CSV offset down by whatever compaction removed since last round."""
+        done = self._manifest()["compactions"]
+        for entry in done[self.state["compactions"]:]:
+            shifted = self.state["offset"] - entry.get("bytes_removed", 0)
+            if shifted < header_len:             # compacted before shipped: the Parquet part covers it
+                log.warning("%d unshipped log bytes were compacted; shipped via the archive",
+                            header_len - shifted)
+                shifted, self.state["mark"] = header_len, ""
+            keep = 2 * (shifted - header_len)    # the mark must not reach back into the header
+            self.state["mark"] = self.state["mark"][-keep:] if keep else ""
+            self.state["offset"] = shifted
+        self.state["compactions"] = len(done)
+
+    def _seal_csv(self, force: bool) -> bool:
+        path = self.store.path
+        if not path.exists():
+            return False
+        with locked_log(path) as f:              # writers / compaction wait a few ms
+            records = iter_records(f)
+            _, header = next(records, (0, b""))
+            if not header:
+                return False
+            self._follow_compactions(len(header))
+            st = os.fstat(f.fileno())
+            offset, mark = self.state["offset"], binascii.unhexlify(self.state["mark"])
+            f.seek(max(offset - len(mark), 0))
+            if (self.state["inode"] != st.st_ino or offset < len(header) or st.st_size < offset
+                    or f.read(len(mark)) != mark):
+                if self.state["inode"] is not None:
+                    log.warning("usage log was rewritten under the shipper; re-shipping it whole")
+                offset = len(header)
+                self.state.update(inode=st.st_ino, offset=offset, mark="")
+            if not self._due(st.st_size - offset, force):
+                return False
+            body, end = [], offset
+            for start, rec in iter_records(f, offset):
+                body.append(rec)
+                end = start + len(rec)
+                if end - offset >= self.segment_bytes:
+                    break
+            if not body:
+                return False
+            f.seek(max(end - _MARK, 0))
+            new_mark = f.read(end - f.tell())
+        self._spool(header, b"".join(body), f"byte {offset}")
+        self.state.update(offset=end, mark=binascii.hexlify(new_mark).decode())
+        self._pending_since = None
+        self._save_checkpoint()
+        return True
+
+    def _seal_sqlite(self, force: bool) -> bool:
+        con = self.store._conn()
+        top = con.execute("SELECT COALESCE(MAX(id), 0) FROM usage_log").fetchone()[0]
+        if not self._due((top - self.state["last_id"]) * 256, force):   # ~bytes per CSV row
+            return False
+        columns, rows, cursor, _ = self.store.tail(self.state["last_id"],
+                                                   limit=max(self.segment_bytes // 256, 1))
+        if not rows:
+            return False
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+        self._spool(header.getvalue().encode(), buf.getvalue().encode(), f"id {self.state['last_id'] + 1}")
+        self.state["last_id"] = cursor
+        self._pending_since = None
+        self._save_checkpoint()
+        return True
+
+    def _seal_due(self, force: bool) -> int:
+        n = 0
+        seal = self._seal_sqlite if isinstance(self.store, SqliteLogStore) else self._seal_csv
+        while seal(force):
+            n += 1
+        return n
+
+    def seal(self, force: bool = False) -> int:
+        """Spool every segment that is due; returns how many were sealed."""
+        with self._lock, self.lock_path.open("a") as lock, file_lock(lock):
+            self._resume()
+            return self._seal_due(force)
+
+    # ── uploading ────────────────────────────────────────────
+    def _upload_one(self, path: Path) -> None:
+        self.target.put(f"log/{self.source}/{path.name}", path.read_bytes(), "application/gzip")
+        path.unlink()
+
+    def upload(self, threads: int = UPLOAD_THREADS) -> int:
+        """Upload spooled segments (oldest first, a batch at a time); returns how many went."""
+        sent = 0
+        pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        try:
+            while batch := sorted(self.outbox.glob("*.csv.gz"))[:UPLOAD_BATCH]:
+                # first failure raises; the rest stay spooled for the next round
+                list((pool.map if pool else map)(self._upload_one, batch))
+                sent += len(batch)
+        finally:
+            if pool:
+                pool.shutdown()
+        self.stats["uploaded"] += sent
+        return sent
+
+    def ship_archive(self) -> int:
+        """Upload Parquet parts that are new or rewritten since they were last shipped."""
+        shipped, n = self.state["archive"], 0
+        prefix = f"archive/{self.source}/{self.state['run']}"
+        for files in self._manifest()["partitions"].values():
+            for entry in files:
+                path = self.archive / entry["path"]
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                stamp = [st.st_size, st.st_mtime_ns]
+                if shipped.get(entry["path"]) == stamp:
+                    continue
+                self.target.put(f"{prefix}/{entry['path']}", path.read_bytes(),
+                                "application/vnd.apache.parquet")
+                shipped[entry["path"]] = stamp
+                self._save_checkpoint()
+                n += 1
+        if n:
+            self.target.put(f"{prefix}/manifest.json",
+                            (self.archive / "manifest.json").read_bytes(), "application/json")
+        self.stats["archive_parts"] += n
+        return n
+
+    # ── rounds ───────────────────────────────────────────────
+    def run_once(self, force: bool = False, threads: int = UPLOAD_THREADS) -> dict:
+        """Seal what is due (everything if *force*), then upload; returns self.stats."""
+        with self._lock, self.lock_path.open("a") as lock, file_lock(lock):
+            self._resume()
+            self._seal_due(force)
+            self.upload(threads)
+            if isinstance(self.store, CsvLogStore):
+                self.ship_archive()
+        return self.stats
+
+    def start(self) -> "LogShipper":
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def _run(self) -> None:
+        delay = self.poll
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+                delay = self.poll
+            except Exception:
+                # endpoint down or disk trouble: segments stay spooled, back off and retry
+                self.stats["errors"] += 1
+                log.exception("log shipping round failed (%s)", self.target)
+                delay = min(delay * 2, 300.0)
+
+    def close(self) -> None:
+        """Stop the thread and ship whatever is left (best effort)."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self.run_once(force=True, threads=1)     # at exit no new pool threads may start
+        except Exception:
+            log.exception("final log shipping round failed; segments left in %s", self.outbox)
+        self.store.close()
+
+
+def shipper_from_env(**kwargs) -> LogShipper | None:
+    """LogShipper for FLAP_SHIP_URL (None when unset), shipping the log writer_from_env() uses."""
+    url = os.environ.get("FLAP_SHIP_URL")
+    if not url:
+        return None
+    target = target_from_url(url, endpoint_url=os.environ.get("FLAP_SHIP_ENDPOINT"))
+    return LogShipper(target, os.environ.get("FLAP_LOG_STORE", DATA_PATH), **kwargs)
@@ -0,0 +1,191 @@
+# flap_selector/similar.py  –  "similar past cases" nearest-neighbour index
+# -----------------------------------------------------------------
+# Logged cases are partitioned by (sub-unit, depth class); a neighbour must
+# match both.  Inside a partition the distance is
+#
+#     |Δcm| / CM_SCALE + |Δage| / AGE_SCALE + FLAG_WEIGHT × (hair/dia/smk/rad mismatches)
+#
+# Each partition keeps a sorted list of cm buckets (0.1 cm – the form's
+# step) and, per bucket, the ages in sorted order.  A query walks buckets
+# outward from the query's cm and ages outward from the query's age, and
+# stops as soon as the cm (or cm + age) part alone exceeds the k-th best
+# distance, so it touches a few hundred rows however long the log is.
+# CaseIndex is a UsageLogWriter listener: every stored batch is inserted
+# with bisect, no rebuild.
+import bisect
+import heapq
+import math
+import threading
+from array import array
+
+from .engine import _depth_class
+
+CM_SCALE = 0.5                           # cm per unit of distance
+AGE_SCALE = 10.0                         # years per unit of distance
+FLAG_WEIGHT = 1.0                        # per mismatched hair / risk flag
+FLAGS = ("hair", "dia", "smk", "rad")
+_USED = 1 << len(FLAGS)                  # flag byte bit: recommended flap was used
+
+
+def _truthy(value) -> bool:
+    return value is True or value == "True" or value == 1
+
+
+def _number(value):
+    try:
+        x = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(x) else x
+
+
+class _Bucket:
+    """Rows with one cm value: ages ascending, row ids alongside."""
+    __slots__ = ("ages", "ids")
+
+    def __init__(self):
+        self.ages = array("H")
+        self.ids = array("I")
+
+    def insert(self, age: int, row_id: int) -> None:
+        i = bisect.bisect_right(self.ages, age)
+        self.ages.insert(i, age)
+        self.ids.insert(i, row_id)
+
+    def extend(self, pairs: list) -> None:
+        pairs.sort()
+        if self.ages:
+            pairs = list(heapq.merge(zip(self.ages, self.ids), pairs))
+        self.ages = array("H", [a for a, _ in pairs])
+        self.ids = array("I", [i for _, i in pairs])
+
+
+class CaseIndex:
+    """Incremental k-nearest-neighbour index over logged cases.
+
+    Call it with a batch of log rows (the UsageLogWriter listener
+    signature) to insert them; similar() answers queries.  Rows without a
+    usable cm or age are counted in .skipped and left out.
+    """
+
+    def __init__(self, cm_scale: float = CM_SCALE, age_scale: float = AGE_SCALE,
+                 flag_weight: float = FLAG_WEIGHT):
+        self.cm_scale, self.age_scale, self.flag_weight = cm_scale, age_scale, flag_weight
+        self._lock = threading.Lock()
+        self._parts: dict[tuple, tuple[list, dict]] = {}   # (loc, depth) -> (cm keys, key -> bucket)
+        self._flags = array("B")                           # per row id: FLAGS bits | _USED
+        self._flap = array("I")                            # per row id: code into _flaps
+        self._flaps: list[str] = []
+        self._flap_code: dict[str, int] = {}
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._flags)
+
+    # ── inserts ──────────────────────────────────────────────
+    def _encode(self, row: dict):
+        cm, age = _number(row.get("cm")), _number(row.get("age"))
+        if cm is None or age is None or not row.get("loc"):
+            return None
+        used = _truthy(row.get("used_recommended"))
+        flap = str((row.get("recommended_flap") if used else row.get("alt_flap_if_no")) or "").strip()
+        code = self._flap_code.get(flap)
+        if code is None:
+            code = self._flap_code[flap] = len(self._flaps)
+            self._flaps.append(flap)
+        get = row.get
+        bits = (_truthy(get("hair")) | _truthy(get("dia")) << 1 | _truthy(get("smk")) << 2
+                | _truthy(get("rad")) << 3 | used << 4)         # FLAGS order, then _USED
+        return ((row["loc"], _depth_class(get("depth"))), round(cm * 10),
+                min(max(round(age), 0), 0xFFFF), bits, code)
+
+    def add_many(self, rows) -> int:
+        """Insert *rows* (app / CSV / SQLite row dicts); returns how many were indexed."""
+        grouped: dict[tuple, list] = {}
+        with self._lock:
+            for row in rows:
+                enc = self._encode(row)
+                if enc is None:
+                    self.skipped += 1
+                    continue
+                part, key, age, bits, code = enc
+                row_id = len(self._flags)
+                self._flags.append(bits)
+                self._flap.append(code)
+                grouped.setdefault((part, key), []).append((age, row_id))
+            for (part, key), pairs in grouped.items():
+                keys, buckets = self._parts.setdefault(part, ([], {}))
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = _Bucket()
+                    bisect.insort(keys, key)
+                if len(pairs) <= 8:
+                    for age, row_id in pairs:
+                        bucket.insert(age, row_id)
+                else:                     # bulk load: one sort instead of many memmoves
+                    bucket.extend(pairs)
+        return sum(len(p) for p in grouped.values())
+
+    __call__ = add_many                   # UsageLogWriter listener
+
+    # ── queries ──────────────────────────────────────────────
+    def similar(self, loc: str, depth, cm: float, age: float, hair=False, dia=False,
+                smk=False, rad=False, k: int = 5) -> list[dict]:
+        """The *k* nearest logged cases with the same sub-unit and depth, nearest first."""
+        want = sum(1 << i for i, f in enumerate((hair, dia, smk, rad)) if f)
+        qkey, cm_unit, age_unit = round(cm * 10), 10 * self.cm_scale, self.age_scale
+        best: list[tuple] = []            # max-heap of (-distance, row id, cm key, age)
+        with self._lock:
+            part = self._parts.get((loc, _depth_class(depth)))
+            if part is None or k <= 0:
+                return []
+            keys, buckets = part
+            flags, flag_w = self._flags, self.flag_weight
+            left = bisect.bisect_left(keys, qkey) - 1
+            right = left + 1
+            while left >= 0 or right < len(keys):
+                # next bucket = the nearer of the two frontier buckets
+                if right >= len(keys) or (left >= 0 and qkey - keys[left] <= keys[right] - qkey):
+                    key, left = keys[left], left - 1
+                else:
+                    key, right = keys[right], right + 1
+                d_cm = abs(key - qkey) / cm_unit
+                if len(best) == k and d_cm >= -best[0][0]:
+                    break                 # every remaining bucket is at least this far
+                bucket = buckets[key]
+                ages, ids = bucket.ages, bucket.ids
+                mid = bisect.bisect_left(ages, age)
+                for step, start in ((-1, mid - 1), (1, mid)):
+                    j = start
+                    while 0 <= j < len(ages):
+                        d = d_cm + abs(ages[j] - age) / age_unit
+                        if len(best) == k and d >= -best[0][0]:
+                            break         # ages only get further in this direction
+                        row_id = ids[j]
+                        d += flag_w * ((flags[row_id] ^ want) & (_USED - 1)).bit_count()
+                        item = (-d, row_id, key, ages[j])
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif item > best[0]:
+                            heapq.heapreplace(best, item)
+                        j += step
+            out = []
+            for neg_d, row_id, key, row_age in sorted(best, key=lambda t: (-t[0], -t[1])):
+                bits = flags[row_id]
+                out.append({
+                    "cm": key / 10, "age": row_age,
+                    **{f: bool(bits >> i & 1) for i, f in enumerate(FLAGS)},
+                    "flap_used": self._flaps[self._flap[row_id]],
+                    "used_recommended": bool(bits & _USED),
+                    "distance": round(-neg_d, 3),
+                })
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            buckets = [b for _, part in self._parts.values() for b in part.values()]
+            return {"rows": len(self._flags), "skipped": self.skipped,
+                    "partitions": len(self._parts), "buckets": len(buckets),
+                    "distinct_flaps": len(self._flaps),
+                    "bytes": (len(self._flags) * (self._flags.itemsize + self._flap.itemsize)
+                              + sum(len(b.ages) * 6 for b in buckets))}
@@ -0,0 +1,156 @@
+# flap_selector/sweep.py  –  tune THR against logged outcomes
+# -----------------------------------------------------------------
+#   python -m flap_selector sweep --step 0.1 --out sweep.csv
+#
+# For every sub-unit, every candidate (lo, mid) pair is scored by how many
+# logged cases would have been recommended the flap the surgeon actually
+# used (recommended_flap when used_recommended, else the canonical form of
+# alt_flap_if_no – see vocab.py).
+# Only the size category depends on THR, so with the cases sorted by cm a
+# candidate splits them into three runs – small | medium | large – and its
+# score is three prefix-sum lookups: O(n log n + K) per sub-unit instead of
+# an n × K matrix.  Sub-units are swept in parallel processes.
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .batch import _compiled
+from .engine import _depth_class, current_rules
+from .usagelog import ARCHIVE_DIR, DATA_PATH
+from .vocab import canonicalise_column, flap_vocabulary
+
+LOG_FIELDS = ["loc", "depth", "cm", "hair", "recommended_flap", "used_recommended",
+              "alt_flap_if_no", "alt_flap_canonical"]
+
+_NO_MATCH = -1
+
+
+def _norm(text) -> str:
+    return re.sub(r"\s+", " ", str(text or "")).strip().casefold()
+
+
+def _tables(rules=None):
+    """(compiled rules, normalised flap name -> flap code) for *rules* (default: live)."""
+    t = _compiled(rules or current_rules())
+    return t, {_norm(name): code for code, name in enumerate(t.flap[1])}
+
+
+# ──────────────────────────────────────────────────────────────
+# 1. INPUT
+# ──────────────────────────────────────────────────────────────
+def load_cases(log: Path = DATA_PATH, archive: Path = ARCHIVE_DIR,
+               fields: list[str] = LOG_FIELDS) -> pd.DataFrame:
+    """*fields* (default: the sweep's) from the whole history (archive + CSV tail, or SQLite)."""
+    log = Path(log)
+    if log.suffix in (".db", ".sqlite"):
+        from .logstore import SqliteLogStore
+        store = SqliteLogStore(log)
+        df = pd.DataFrame.from_records(
+            ({c: r.get(c) for c in fields} for r in store.iter_rows()), columns=fields)
+        store.close()
+    else:
+        from .compact import read_log
+        df = read_log(fields, csv_path=log, archive=archive)
+    return df
+
+
+def _map_unique(values, fn) -> np.ndarray:
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return np.array([fn(u) for u in uniques], dtype=np.int64)[codes]
+
+
+def _alternative(df: pd.DataFrame, rules) -> np.ndarray:
+    """Canonical alt flap per row: the logged column, matched here only where it is empty."""
+    raw = df["alt_flap_if_no"].astype(object).fillna("").astype(str)
+    canonical = (df["alt_flap_canonical"].astype(object).fillna("").astype(str)
+                 if "alt_flap_canonical" in df else pd.Series("", index=df.index))
+    todo = canonical.eq("") & raw.ne("")
+    if todo.any():
+        canonical = canonical.copy()
+        canonical[todo] = canonicalise_column(raw[todo], vocab=flap_vocabulary(rules))
+    return np.where(canonical.eq(""), raw, canonical)
+
+
+def encode(df: pd.DataFrame, rules=None) -> dict[int, tuple]:
+    """Per sub-unit code: (cm, depth class, hair, actual flap code, used) arrays.
+
+    The actual flap is -1 when the free-text alternative names no engine flap.
+    """
+    t, vocab = _tables(rules)
+    df = df[df["loc"].isin(t.loc_code)]
+    used = df["used_recommended"].astype(str).eq("True").to_numpy()
+    actual_text = np.where(used, df["recommended_flap"].astype(str), _alternative(df, t.rules))
+    actual = _map_unique(actual_text, lambda a: vocab.get(_norm(a), _NO_MATCH))
+    cm = pd.to_numeric(df["cm"], errors="coerce").to_numpy(dtype=float)
+    depth = _map_unique(df["depth"].astype(object).to_numpy(), _depth_class)
+    hair = df["hair"].astype(str).eq("True").to_numpy().astype(np.int64)
+    loc = df["loc"].map(t.loc_code).to_numpy(dtype=np.int64)
+    return {int(l): tuple(a[loc == l] for a in (cm, depth, hair, actual, used))
+            for l in np.unique(loc)}
+
+
+def candidates(loc: str, step: float = 0.1, span: float = 2.5,
+               rules=None) -> tuple[np.ndarray, np.ndarray]:
+    """All lo < mid pairs on a *step* grid up to *span* × the current mid."""
+    top = span * (rules or current_rules()).thr[loc][1]
+    vals = np.round(np.arange(step, top + step / 2, step), 6)
+    i, j = np.triu_indices(len(vals), k=1)
+    return vals[i], vals[j]
+
+
+# ──────────────────────────────────────────────────────────────
+# 2. SWEEP
+# ──────────────────────────────────────────────────────────────
+def score(loc_code: int, cm, depth, hair, actual, lo, mid, rules=None) -> np.ndarray:
+    """Concordant-case count for each candidate (lo[k], mid[k])."""
+    order = np.argsort(cm, kind="stable")        # NaN sorts last = "large", as in _cat
+    cm, depth, hair, actual = cm[order], depth[order], hair[order], actual[order]
+    rec = _compiled(rules or current_rules()).flap[0][loc_code, depth, :, hair]                    # (n, 3 sizes)
+    hits = np.zeros((len(cm) + 1, 3), dtype=np.int64)
+    np.cumsum(rec == actual[:, None], axis=0, out=hits[1:])
+    i_lo = np.searchsorted(cm, lo, side="right")                 # cm <= lo  -> small
+    i_mid = np.searchsorted(cm, mid, side="right")               # cm <= mid -> medium
+    return (hits[i_lo, 0] + hits[i_mid, 1] - hits[i_lo, 1]
+            + hits[-1, 2] - hits[i_mid, 2])
+
+
+def _sweep_one(args) -> pd.DataFrame:
+    loc_code, (cm, depth, hair, actual, used), step, span, top, rules = args
+    loc = rules.subunits[loc_code]
+    lo, mid = candidates(loc, step, span, rules)
+    cur_lo, cur_mid = rules.thr[loc]
+    matches = score(loc_code, cm, depth, hair, actual, lo, mid, rules)
+    current = score(loc_code, cm, depth, hair, actual,
+                    np.array([cur_lo]), np.array([cur_mid]), rules)[0]
+    # best first; ties go to the candidate nearest the current thresholds
+    dist = np.abs(lo - cur_lo) + np.abs(mid - cur_mid)
+    best = np.lexsort((dist, -matches))[:top]
+    n = len(cm)
+    return pd.DataFrame({
+        "loc": loc, "cases": n, "rank": np.arange(1, len(best) + 1),
+        "lo": lo[best], "mid": mid[best], "concordant": matches[best],
+        "concordance": matches[best] / n,
+        "current_lo": cur_lo, "current_mid": cur_mid, "current_concordance": current / n,
+        "observed_concordance": used.mean(),
+        "unmatched_alt": np.mean(actual == _NO_MATCH),
+        "candidates": len(lo),
+    })
+
+
+def sweep(df: pd.DataFrame, step: float = 0.1, span: float = 2.5, top: int = 5,
+          min_cases: int = 30, workers: int | None = None) -> pd.DataFrame:
+    """Top-*top* (lo, mid) candidates per sub-unit with at least *min_cases* cases."""
+    rules = current_rules()               # one rule set for the whole run, workers included
+    groups = {l: g for l, g in encode(df, rules).items() if len(g[0]) >= min_cases}
+    jobs = [(l, g, step, span, top, rules) for l, g in sorted(groups.items())]
+    if not jobs:
+        return pd.DataFrame()
+    if workers == 0:
+        parts = [_sweep_one(j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_sweep_one, jobs))
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,161 @@
+# flap_selector/telemetry.py  –  which rules fire in production
+# -----------------------------------------------------------------
+# Every decide() result carries the id of the rule that produced it
+# (rules.json).  RuleHits counts them per (rules version, rule id) in one
+# plain dict per thread – Streamlit runs each rerun on its own thread, so a
+# hit is an uncontended dict increment with no lock.  A daemon thread folds
+# the shards together every FLUSH_INTERVAL seconds (and at exit) and adds
+# the delta to .data/rule_hits.json under the same fcntl lock the log uses,
+# so several server processes share one file.  Shards of finished threads
+# are folded into a base count and dropped.
+import atexit
+import json
+import logging
+import os
+import threading
+import weakref
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .logstore import file_lock
+from .usagelog import DATA_DIR
+
+HITS_PATH = DATA_DIR / "rule_hits.json"
+FLUSH_INTERVAL = 30.0                    # seconds between file updates
+
+log = logging.getLogger(__name__)
+
+
+class RuleHits:
+    """Sharded (rules version, rule id) hit counter, persisted to *path*.
+
+    record() is the hot path; totals() is what the admin area reads.
+    """
+
+    def __init__(self, path: Path = HITS_PATH, flush_interval: float = FLUSH_INTERVAL):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()            # shard list + flush, never record()
+        self._shards: list[tuple] = []           # (weakref to owning thread, counts)
+        self._base: Counter = Counter()          # folded shards of finished threads
+        self._flushed: Counter = Counter()       # what is already in the file
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rule-hits-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ── hot path ─────────────────────────────────────────────
+    def record(self, rule_id: str, version: str = "") -> None:
+        try:
+            counts = self._local.counts
+        except AttributeError:
+            counts = self._new_shard()
+        key = (version, rule_id)
+        counts[key] = counts.get(key, 0) + 1
+
+    __call__ = record
+
+    def _new_shard(self) -> dict:
+        counts = self._local.counts = {}
+        with self._lock:
+            self._shards.append((weakref.ref(threading.current_thread()), counts))
+        return counts
+
+    # ── aggregation ──────────────────────────────────────────
+    def _collect(self) -> Counter:
+        """Process-wide counts so far (caller holds the lock)."""
+        total = self._base.copy()
+        live = []
+        for ref, counts in self._shards:
+            thread = ref()
+            snapshot = counts.copy()             # one C-level copy: safe while the owner writes
+            total.update(snapshot)
+            if thread is not None and thread.is_alive():
+                live.append((ref, counts))
+            else:                                # owner is gone: nothing will change it again
+                self._base.update(snapshot)
+        self._shards = live
+        return total
+
+    def flush(self) -> None:
+        """Add everything counted since the last flush to the file."""
+        with self._lock:
+            total = self._collect()
+            delta = total - self._flushed
+            if not delta:
+                return
+            with self.path.with_suffix(".lock").open("a") as lock, file_lock(lock):
+                data = self._load()
+                for (version, rule_id), n in delta.items():
+                    hits = data["hits"].setdefault(version, {})
+                    hits[rule_id] = hits.get(rule_id, 0) + n
+                data["updated"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+                tmp = self.path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(data, sort_keys=True))
+                os.replace(tmp, self.path)
+            self._flushed = total
+
+    def _load(self) -> dict:
+        try:
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {"version": 1, "since": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "hits": {}}
+
+    def totals(self) -> dict:
+        """{rules version: {rule id: hits}} across processes, including unflushed hits here."""
+        with self._lock:
+            pending = self._collect() - self._flushed
+            data = self._load()
+        hits = {v: Counter(h) for v, h in data["hits"].items()}
+        for (v, rule_id), n in pending.items():
+            hits.setdefault(v, Counter())[rule_id] += n
+        return {v: dict(h) for v, h in hits.items()}
+
+    def since(self) -> str | None:
+        return self._load().get("since")
+
+    # ── background flush ─────────────────────────────────────
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError:                      # counts stay in memory; the next round retries
+                log.exception("rule-hit flush to %s failed", self.path)
+
+    def close(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self.flush()
+
+
+def feedback_by_rule(frame, version: str) -> dict:
+    """{rule id: (logged cases, used recommended)} from a typed log frame (LogView.frame())."""
+    if not len(frame) or "rule_id" not in frame or "rules_version" not in frame:
+        return {}
+    cur = frame[frame["rules_version"] == version]
+    used = cur["used_recommended"].fillna(False).astype(bool)
+    g = used.groupby(cur["rule_id"], observed=True).agg(["size", "sum"])
+    return {rid: (int(n), int(u)) for rid, (n, u) in zip(g.index, g.to_numpy())}
+
+
+def hit_table(rules, hits: dict, feedback: dict | None = None) -> list[dict]:
+    """One row per rule of *rules*, most hits first; never-fired rules included."""
+    where: dict[str, tuple] = {}
+    for (loc, _, _, _), (rid, flap, _) in rules.cells.items():
+        where.setdefault(rid, (loc, flap))
+    total = sum(hits.get(rid, 0) for rid in where) or 1
+    feedback = feedback or {}
+    rows = []
+    for rid, (loc, flap) in where.items():
+        cases, used = feedback.get(rid, (0, 0))
+        rows.append({"rule": rid, "sub-unit": loc, "flap": flap, "hits": hits.get(rid, 0),
+                     "share %": round(100 * hits.get(rid, 0) / total, 1),
+                     "feedback": cases,
+                     "concordance %": round(100 * used / cases, 1) if cases else None})
+    rows.sort(key=lambda r: (-r["hits"], r["rule"]))
+    return rows
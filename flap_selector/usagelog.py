@@ -0,0 +1,201 @@
+# flap_selector/usagelog.py  –  shared write-behind writer for the usage log
+# -----------------------------------------------------------------
+# One UsageLogWriter per process (app.py keeps it in st.cache_resource).
+# submit() only enqueues; a background thread drains the queue in batches
+# into a LogStore (CSV under an fcntl lock, or SQLite/WAL) and asks it to
+# fsync according to the configured policy.  submit_many() queues a list of
+# rows as one item, so they are never split across two appends.
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .logstore import LOG_COLUMNS, LogStore, open_store
+from .vocab import canonicalise_rows
+
+DATA_DIR = Path(os.environ.get("FLAP_DATA_DIR", ".data"))   # hidden dot-folder by default
+DATA_PATH = DATA_DIR / "usage_log.csv"
+ARCHIVE_DIR = DATA_DIR / "archive"            # monthly Parquet, see compact.py
+
+__all__ = ["ARCHIVE_DIR", "DATA_DIR", "DATA_PATH", "FSYNC_POLICIES", "LOG_COLUMNS", "UsageLogWriter",
+           "writer_from_env"]
+
+FSYNC_POLICIES = ("always", "periodic", "never")
+
+log = logging.getLogger(__name__)
+_STOP = object()
+
+
+class UsageLogWriter:
+    """Bounded-queue, background-thread CSV appender.
+
+    fsync: "always" after every batch, "periodic" at most every
+    fsync_interval seconds, "never" leaves it to the OS.
+    listeners: callables run on the writer thread with each batch
+    once it is stored (aggregates, indexes, …); add_listener() registers
+    one later without missing or repeating a row.
+    """
+
+    def __init__(self, store: LogStore | Path = DATA_PATH, *, maxsize: int = 10_000,
+                 batch_size: int = 500, flush_interval: float = 0.2,
+                 fsync: str = "periodic", fsync_interval: float = 5.0,
+                 listeners=()):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.store = store if isinstance(store, LogStore) else open_store(store)
+        self.listeners = list(listeners)
+        self._listen_lock = threading.Lock()   # held from storing a batch until it is notified
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._last_fsync = time.monotonic()
+        self._q: queue.Queue = queue.Queue(maxsize)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="usage-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ── request path ─────────────────────────────────────────
+    def submit(self, row: dict) -> None:
+        """Queue one row; blocks only if the queue is full (back-pressure, never drops)."""
+        if self._closed:
+            raise RuntimeError("usage-log writer is closed")
+        self._q.put(row)
+
+    def submit_many(self, rows: list[dict]) -> None:
+        """Queue *rows* together: they reach the store in one append_many() (one transaction)."""
+        if self._closed:
+            raise RuntimeError("usage-log writer is closed")
+        if rows:
+            self._q.put(list(rows))
+
+    def add_listener(self, listener, backfill=None) -> None:
+        """Register *listener* for every batch stored from now on.
+
+        *backfill* runs first, while the writer thread is held between
+        batches, so it sees exactly the rows the listener will not be told
+        about: each row reaches the listener once, either way.
+        """
+        with self._listen_lock:
+            if backfill is not None:
+                backfill()
+            self.listeners = [*self.listeners, listener]   # _notify may hold the old list
+
+    def between_batches(self, fn):
+        """Run *fn* while the writer thread is held between batches; returns its result.
+
+        For a listener's state rebuilt from the store (AggregateFile.rebuild):
+        no batch is stored-but-not-yet-notified while *fn* reads, so every row
+        is counted once – by *fn* or by the next notification.
+        """
+        with self._listen_lock:
+            return fn()
+
+    def flush(self) -> None:
+        """Block until everything submitted so far is on disk."""
+        self._q.join()
+
+    def close(self) -> None:
+        """Drain the queue, write the last batch and stop the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(_STOP)
+        self._thread.join()
+        self.store.close()
+
+    # ── background thread ────────────────────────────────────
+    def _run(self) -> None:
+        batch, stopping = [], False
+        while not stopping:
+            try:
+                item = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            taken = 0 if item is None else 1
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                self._take(batch, item)
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if item is _STOP:
+                    stopping = True
+                else:
+                    self._take(batch, item)
+            if batch:
+                self._canonicalise(batch)
+                with self._listen_lock:
+                    if self._write_with_retry(batch, final=stopping):
+                        self._notify(batch)
+                batch = []
+            for _ in range(taken):
+                self._q.task_done()
+
+    @staticmethod
+    def _take(batch: list, item) -> None:
+        # a submit_many() list may push the batch past batch_size: it stays whole
+        if isinstance(item, list):
+            batch.extend(item)
+        else:
+            batch.append(item)
+
+    def _canonicalise(self, batch: list) -> None:
+        try:
+            canonicalise_rows(batch)
+        except Exception:
+            # never hold rows back for it: `normalise` can fill the columns later
+            log.exception("free-text canonicalisation failed for %d rows", len(batch))
+
+    def _write_with_retry(self, batch: list, final: bool) -> bool:
+        delay = 0.1
+        while True:
+            try:
+                self.store.append_many(batch, sync=self._should_sync(final))
+                return True
+            except (OSError, sqlite3.OperationalError):
+                log.exception("usage log append failed (%d rows pending)", len(batch))
+                if final and delay > 5:
+                    log.error("giving up on usage-log rows at shutdown: %r", batch)
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 10)
+            except Exception:
+                # bad data, not a busy disk: retrying would wedge the thread
+                log.exception("usage-log rows rejected by store: %r", batch)
+                return False
+
+    def _notify(self, rows: list) -> None:
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception:
+                log.exception("usage-log listener %r failed", listener)
+
+    def _should_sync(self, final: bool) -> bool:
+        if self.fsync == "never":
+            return False
+        now = time.monotonic()
+        if final or self.fsync == "always" or now - self._last_fsync >= self.fsync_interval:
+            self._last_fsync = now
+            return True
+        return False
+
+
+def writer_from_env(**kwargs) -> UsageLogWriter:
+    """The writer app.py and the API share a configuration for.
+
+    FLAP_LOG_STORE=.data/usage_log.db switches the log to SQLite;
+    FLAP_LOG_FSYNC picks one of FSYNC_POLICIES.
+    """
+    return UsageLogWriter(os.environ.get("FLAP_LOG_STORE", DATA_PATH),
+                          fsync=os.environ.get("FLAP_LOG_FSYNC", "periodic"), **kwargs)
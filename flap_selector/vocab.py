@@ -0,0 +1,307 @@
+# flap_selector/vocab.py  –  canonical names for free-text log answers
+# -----------------------------------------------------------------
+# alt_flap_if_no and cancer_type are typed by hand ("Abbe", "Abbé cross
+# lip", "abbe flap", "bcc").  A Vocabulary maps such text to one canonical
+# term: first an exact lookup on the folded form (accents, case, punctuation
+# and spacing removed), then the best trigram match over every alias with a
+# Dice score of at least MIN_SCORE.  The trigram index is an inverted list
+# built once, so a lookup touches only aliases sharing a trigram with the
+# query; answers are memoised per distinct text.
+#
+# The flap vocabulary is every flap string the live rules can produce plus
+# FLAP_SYNONYMS.  canonicalise_rows() fills the *_canonical columns once,
+# on the writer thread; canonicalise_column() is the bulk (re)pass – one
+# lookup per distinct value.
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+from .engine import RuleSet, current_rules
+
+MIN_SCORE = 0.5                          # Dice coefficient over padded trigrams
+MEMO_SIZE = 50_000                       # distinct texts remembered per vocabulary
+
+# alias -> engine flap string; aliases are folded before use
+FLAP_SYNONYMS = {
+    "abbe": "Abbé cross-lip flap", "abbe flap": "Abbé cross-lip flap",
+    "lip switch": "Abbé cross-lip flap", "abbe estlander": "Estlander cross-lip flap",
+    "estlander": "Estlander flap",
+    "karapandzic": "Karapandzic rotation flap",
+    "bilobe": "Bilobed flap", "zitelli": "Bilobed flap", "zitelli bilobed": "Bilobed flap",
+    "pff": "Paramedian forehead flap", "forehead flap": "Paramedian forehead flap",
+    "paramedian": "Paramedian forehead flap",
+    "nasolabial flap": "Nasolabial interpolation flap",
+    "melolabial": "Nasolabial interpolation flap",
+    "melolabial interpolation": "Nasolabial interpolation flap",
+    "dorsal nasal": "Rieger dorsal-nasal flap", "rieger": "Rieger dorsal-nasal flap",
+    "rhombic": "Rhomboid transposition flap", "rhomboid": "Rhomboid transposition flap",
+    "limberg": "Limberg rhomboid flap",
+    "mustarde": "Mustardé cheek rotation flap",
+    "cervicofacial": "Cervicofacial rotation flap",
+    "hughes": "Hughes tarsoconjunctival flap + STSG",
+    "cutler beard": "Cutler-Beard bridge flap", "tenzel": "Tenzel semicircular flap",
+    "antia buch": "Antia-Buch advancement flap",
+    "ftsg": "Full-thickness skin graft", "full thickness graft": "Full-thickness skin graft",
+    "skin graft": "Full-thickness skin graft",
+    "primary closure": "Direct primary closure", "primary": "Direct primary closure",
+    "direct": "Direct closure", "linear closure": "Direct closure",
+    "wedge": "Full-thickness wedge closure", "wedge excision": "Full-thickness wedge closure",
+    "secondary intention": "Secondary intention / tiny FTSG",
+    "healing by secondary intention": "Secondary intention / tiny FTSG",
+    "sih": "Secondary intention / tiny FTSG",
+    "o to z": "O-Z rotation flap", "oz": "O-Z rotation flap",
+    "a to t": "Mini A-T advancement flap", "at flap": "Mini A-T advancement flap",
+    "h plasty": "H-plasty bilateral advancement",
+    "glabellar flap": "Glabellar rotation flap",
+    "vy": "V-Y cheek advancement", "v to y": "V-Y cheek advancement",
+    "submental": "Submental island flap",
+    "radial forearm": "Free radial-forearm commissuroplasty flap",
+    "rfff": "Free radial-forearm commissuroplasty flap",
+}
+
+# canonical cancer type -> aliases
+CANCER_TYPES = {
+    "Basal cell carcinoma": ["bcc", "basal cell", "basal cell ca", "rodent ulcer",
+                             "nodular bcc", "infiltrative bcc", "morphoeic bcc"],
+    "Squamous cell carcinoma": ["scc", "cscc", "squamous", "squamous cell",
+                                "squamous cell ca"],
+    "Melanoma": ["mm", "malignant melanoma", "melanoma in situ", "lmm",
+                 "lentigo maligna melanoma"],
+    "Lentigo maligna": ["lm", "hutchinson freckle"],
+    "Merkel cell carcinoma": ["mcc", "merkel", "merkel cell"],
+    "Sebaceous carcinoma": ["sebaceous", "sebaceous gland carcinoma"],
+    "Keratoacanthoma": ["ka"],
+    "Basosquamous carcinoma": ["basosquamous", "metatypical bcc"],
+    "Dermatofibrosarcoma protuberans": ["dfsp"],
+    "Atypical fibroxanthoma": ["afx"],
+    "Microcystic adnexal carcinoma": ["mac"],
+    "Angiosarcoma": [],
+    "Bowen disease": ["bowens", "scc in situ", "sccis"],
+}
+
+CANONICAL_COLUMNS = {"alt_flap_if_no": "alt_flap_canonical",
+                     "cancer_type": "cancer_type_canonical"}
+
+
+def fold(text) -> str:
+    """Accent-, case- and punctuation-insensitive form: "Abbé cross-lip" -> "abbe cross lip"."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.sub(r"[^0-9a-z+]+", " ", text).split())
+
+
+def _trigrams(folded: str) -> set[str]:
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Vocabulary:
+    """Canonical terms plus aliases, with an exact map and a trigram index.
+
+    terms: {canonical: [aliases]}; each canonical is also its own alias.
+    """
+
+    def __init__(self, terms: dict[str, list[str]], min_score: float = MIN_SCORE):
+        self.min_score = min_score
+        self.terms = list(terms)
+        self._exact: dict[str, str] = {}
+        for canonical, aliases in terms.items():
+            for alias in (canonical, *aliases):
+                self._exact.setdefault(fold(alias), canonical)
+        self._aliases = list(self._exact)            # alias id -> folded alias
+        self._sizes = []
+        self._index: dict[str, list[int]] = defaultdict(list)
+        for i, alias in enumerate(self._aliases):
+            grams = _trigrams(alias)
+            self._sizes.append(len(grams))
+            for g in grams:
+                self._index[g].append(i)
+        self._memo: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def match(self, text) -> str:
+        """Canonical term for *text*, or "" when nothing scores MIN_SCORE."""
+        hit = self._memo.get(text)
+        if hit is None:
+            hit = self._match(fold(text))
+            with self._lock:
+                if len(self._memo) >= MEMO_SIZE:
+                    self._memo.clear()
+                self._memo[text] = hit
+        return hit
+
+    def score(self, text) -> tuple[str, float]:
+        """(best canonical, Dice score) – for reviewing near misses."""
+        folded = fold(text)
+        if folded in self._exact:
+            return self._exact[folded], 1.0
+        return self._best(folded)
+
+    def _match(self, folded: str) -> str:
+        if not folded:
+            return ""
+        hit = self._exact.get(folded)
+        if hit is not None:
+            return hit
+        canonical, score = self._best(folded)
+        return canonical if score >= self.min_score else ""
+
+    def _best(self, folded: str) -> tuple[str, float]:
+        grams = _trigrams(folded) if folded else set()
+        shared: dict[int, int] = defaultdict(int)
+        for g in grams:
+            for i in self._index.get(g, ()):
+                shared[i] += 1
+        best, best_score = "", 0.0
+        for i, n in shared.items():
+            s = 2 * n / (len(grams) + self._sizes[i])
+            if s > best_score or (s == best_score and best
+                                  and len(self._aliases[i]) < len(best)):
+                best, best_score = self._aliases[i], s
+        return (self._exact[best], best_score) if best else ("", 0.0)
+
+
+def flap_vocabulary(rules: RuleSet | None = None) -> Vocabulary:
+    """Every flap string *rules* can recommend (default: live rules) plus FLAP_SYNONYMS."""
+    # resolved per call, so a hot reload of rules.json reaches the writer thread
+    return _flap_vocabulary(rules or current_rules())
+
+
+@lru_cache(maxsize=2)                     # the live rules, plus the ones before a reload
+def _flap_vocabulary(rules: RuleSet) -> Vocabulary:
+    terms = {flap: [] for _, flap, _ in rules.cells.values()}
+    for alias, canonical in FLAP_SYNONYMS.items():
+        if canonical in terms:                   # a synonym for a flap the rules dropped is skipped
+            terms[canonical].append(alias)
+    return Vocabulary(terms)
+
+
+@lru_cache(maxsize=1)
+def cancer_vocabulary() -> Vocabulary:
+    return Vocabulary(CANCER_TYPES)
+
+
+def _vocabulary(column: str) -> Vocabulary:
+    return flap_vocabulary() if column == "alt_flap_if_no" else cancer_vocabulary()
+
+
+def canonicalise_rows(rows: list[dict]) -> list[dict]:
+    """Fill the *_canonical columns of log rows in place (UsageLogWriter does this)."""
+    for column, target in CANONICAL_COLUMNS.items():
+        vocab = _vocabulary(column)
+        for row in rows:
+            if not row.get(target):
+                row[target] = vocab.match(row.get(column) or "")
+    return rows
+
+
+def canonicalise_column(values, column: str = "alt_flap_if_no", vocab: Vocabulary | None = None):
+    """Bulk pass: canonical term per value, matching each distinct value once.
+
+    *values* may be any iterable of strings or a pandas Series (a Series
+    comes back as a Series with the same index).
+    """
+    vocab = vocab or _vocabulary(column)
+    if hasattr(values, "map") and hasattr(values, "index"):
+        import numpy as np
+        import pandas as pd
+        codes, uniques = pd.factorize(values.astype(object).fillna(""), use_na_sentinel=False)
+        table = np.array([vocab.match(u) for u in uniques] or [""], dtype=object)
+        return pd.Series(table[codes], index=values.index, dtype=object)
+    seen: dict[str, str] = {}
+    return [seen[v] if v in seen else seen.setdefault(v, vocab.match(v)) for v in values]
+
+
+def renormalise(store, archive=None) -> dict:
+    """Recompute the *_canonical columns over the whole log; one lookup per distinct text.
+
+    Run after FLAP_SYNONYMS, CANCER_TYPES or the rules change.  *store* is a
+    LogStore; *archive* (optional) is the compacted Parquet directory.
+    Returns {"rows": rows rewritten, "changed": canonical values that moved}.
+    """
+    from .logstore import CsvLogStore, SqliteLogStore
+
+    out = {"rows": 0, "changed": 0}
+    if isinstance(store, SqliteLogStore):
+        con = store._conn()
+        before = con.total_changes
+        with con:
+            for column, target in CANONICAL_COLUMNS.items():
+                vocab = _vocabulary(column)
+                params = []
+                for (value,) in con.execute(f"SELECT DISTINCT {column} FROM usage_log"):
+                    hit = vocab.match(value or "")
+                    params.append((hit, value, hit))
+                con.executemany(f"UPDATE usage_log SET {target} = ? "
+                                f"WHERE {column} IS ? AND {target} IS NOT ?", params)
+        out["rows"] = store.count()
+        out["changed"] = con.total_changes - before
+    elif isinstance(store, CsvLogStore) and store.exists():
+        _renormalise_csv(store.path, out)
+    if archive is not None:
+        _renormalise_archive(archive, out)
+    return out
+
+
+def _renormalise_csv(path, out: dict) -> None:
+    import csv
+    import os
+
+    from .logstore import LOG_COLUMNS, LOG_SCHEMA, locked_log, replace_durably
+
+    vocabs = [(c, t, _vocabulary(c)) for c, t in CANONICAL_COLUMNS.items()]
+    tmp = path.with_suffix(".canonical.tmp")
+    # same dance as CsvLogStore._upgrade: write beside the log, replace it under the lock
+    with locked_log(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        header = LOG_COLUMNS + [c for c in reader.fieldnames or () if c not in LOG_SCHEMA]
+        try:
+            with tmp.open("w", newline="", encoding="utf-8") as dst:
+                writer = csv.DictWriter(dst, fieldnames=header, restval="", extrasaction="ignore")
+                writer.writeheader()
+                for row in reader:
+                    for column, target, vocab in vocabs:
+                        hit = vocab.match(row.get(column) or "")
+                        out["changed"] += hit != (row.get(target) or "")
+                        row[target] = hit
+                    writer.writerow(row)
+                    out["rows"] += 1
+                dst.flush()
+                os.fsync(dst.fileno())
+            replace_durably(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+def _renormalise_archive(archive, out: dict) -> None:
+    import os
+    from pathlib import Path
+
+    import pandas as pd
+
+    from .compact import _save_manifest, load_manifest
+
+    archive = Path(archive)
+    manifest = load_manifest(archive)
+    for files in manifest["partitions"].values():
+        for entry in files:
+            path = archive / entry["path"]
+            df = pd.read_parquet(path)
+            for column, target in CANONICAL_COLUMNS.items():
+                source = df[column] if column in df else pd.Series("", index=df.index)
+                new = canonicalise_column(source, column)
+                old = df[target].astype(object).fillna("") if target in df else ""
+                out["changed"] += int((new != old).sum())
+                df[target] = new.astype("category")
+            tmp = path.with_suffix(".tmp")
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+            out["rows"] += len(df)
+    if manifest["partitions"]:
+        manifest["columns"] = sorted(set(manifest.get("columns", [])) | set(CANONICAL_COLUMNS.values()))
+        _save_manifest(archive, manifest)